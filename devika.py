@@ -11,7 +11,7 @@ from src.init import init_devika
 
 init_devika()
 
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, request, jsonify, send_file, Response
 from flask_cors import CORS
 from src.socket_instance import socketio, emit_agent
 import os
@@ -22,9 +22,16 @@ from src.apis.project import project_bp
 from src.config import Config
 from src.logger import Logger, route_logger
 from src.project import ProjectManager, MessageSources
-from src.state import AgentState
+from src.state import AgentState, start_compaction_job
+from src.token_usage import TokenUsage
 from src.agents import Agent, Action
 from src.llm import LLM
+from src.llm.cache import ResponseCache
+from src.browser.search_cache import SearchCache
+from src.llm.scheduler import get_scheduler
+from src.llm.metrics import LLMMetrics, render_prometheus
+from src.llm.speculative import get_speculative_stats
+from src.templates import get_render_stats
 
 app = Flask(__name__)
 CORS(app)
@@ -64,8 +71,12 @@ def data():
 def get_messages():
     data = request.json
     project_name = data.get("project_name")
-    messages = manager.get_messages(project_name)
-    return jsonify({"messages": messages})
+    before = data.get("before")
+    limit = data.get("limit")
+    messages = manager.get_messages(project_name, before_id=before, limit=limit)
+    # The id of the oldest message returned is the cursor for the previous page.
+    cursor = messages[0]["id"] if limit and messages and len(messages) == limit else None
+    return jsonify({"messages": messages, "cursor": cursor})
 
 
 # Main socket
@@ -143,6 +154,16 @@ def get_agent_state():
     return jsonify({"state": state})
 
 
+@app.route("/api/get-agent-state-since", methods=["POST"])
+@route_logger(logger)
+def get_agent_state_since():
+    data = request.json
+    project_name = data.get("project_name")
+    since_seq = data.get("since_seq", -1)
+    states = agent_state.get_states_since(project_name, since_seq)
+    return jsonify({"states": states})
+
+
 @app.route("/api/get-browser-snapshot", methods=["GET"])
 @route_logger(logger)
 def browser_snapshot():
@@ -197,8 +218,44 @@ def calculate_tokens():
 @route_logger(logger)
 def token_usage():
     project_name = request.args.get("project_name")
-    token_count = agent_state.get_latest_token_usage(project_name)
-    return jsonify({"token_usage": token_count})
+    usage = TokenUsage()
+    return jsonify({
+        "token_usage": usage.get_total(project_name),
+        "by_agent": usage.get_usage_by_agent(project_name),
+        "by_model": usage.get_usage_by_model(project_name)
+    })
+
+
+@app.route("/api/llm-cache", methods=["GET"])
+@route_logger(logger)
+def llm_cache_stats():
+    return jsonify(ResponseCache().stats())
+
+
+@app.route("/api/search-cache", methods=["GET"])
+@route_logger(logger)
+def search_cache_stats():
+    return jsonify(SearchCache().stats())
+
+
+@app.route("/api/scheduler", methods=["GET"])
+@route_logger(logger)
+def scheduler_stats():
+    return jsonify(get_scheduler().stats())
+
+
+@app.route("/api/metrics", methods=["GET"])
+@route_logger(logger)
+def metrics():
+    text = render_prometheus(
+        LLMMetrics().get_summary(),
+        scheduler_stats=get_scheduler().stats(),
+        cache_stats=ResponseCache().stats(),
+        search_cache_stats=SearchCache().stats(),
+        speculative_stats=get_speculative_stats(),
+        template_stats=get_render_stats()
+    )
+    return Response(text, mimetype="text/plain; version=0.0.4")
 
 
 @app.route("/api/logs", methods=["GET"])
@@ -225,5 +282,6 @@ def get_settings():
 
 
 if __name__ == "__main__":
+    start_compaction_job()
     logger.info("Devika is up and running!")
     socketio.run(app, debug=False, port=1337, host="0.0.0.0")
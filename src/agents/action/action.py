@@ -1,21 +1,27 @@
 import subprocess
 from pathlib import Path
 
-from jinja2 import Environment, BaseLoader
 from termcolor import colored
 
 from src.config import Config
-from src.llm import LLM
+from src.llm import LLM, StructuredOutput, StructuredOutputError
+from src.llm.context_window import ContextWindowExceededError
+from src.llm.router import AllModelsFailedError
+from src.llm.structured_output import XML
+from src.memory import ConversationContext
+from src.memory.conversation import count_tokens
 from src.project import ProjectManager
 from src.state import AgentState
+from src.templates import get_template
 from src.utils import parse_xml_llm_response, ensure_dir_exists
 
-PROMPT = Path(__file__).parent.joinpath('prompt.jinja2').read_text().strip()
 
 project_manager = ProjectManager()
 
 
 class Action:
+    # Tokens left for the role markers of the messages.
+    MESSAGE_OVERHEAD_TOKENS = 64
     REQUIRED_XML_TAGS = ["comment", "action", "next", "actionParams", "fileName"]
 
     def __init__(self, project_name: str, base_model: str):
@@ -23,16 +29,32 @@ class Action:
         self.project_name = project_name
         self.project_dir = config.get_projects_dir()
         self.project_path = project_manager.get_project_path(project_name)
-        self.llm = LLM(model_id=base_model)
+        self.llm = LLM(model_id=base_model, agent=self.__class__.__name__)
+        self.structured_output = StructuredOutput(
+            self.llm, XML, self.validate_response,
+            "<root> with the tags " + ", ".join(self.REQUIRED_XML_TAGS) + ", where <next> is "
+            "proceed-to-next-step or need-users-answer and text values are wrapped in <![CDATA[ ]]>.",
+            required_tags=self.REQUIRED_XML_TAGS
+        )
         self.allowed_steps_left = 5
 
-    def render(self) -> str:
-        conversation = project_manager.get_all_messages_formatted(self.project_name)
-        env = Environment(loader=BaseLoader())
-        template = env.from_string(PROMPT)
-        return template.render(
-            conversation=conversation
-        )
+    def render(self) -> list:
+        """
+        The instructions as the system message, followed by the conversation
+        as user turns. The instructions do not change between steps and older
+        turns are replaced by their digests in fixed blocks, so each step
+        shares most of its prefix with the previous one.
+        The conversation gets what is left of the model's prompt budget after
+        the instructions, up to `[CONTEXT] TOKEN_BUDGET`.
+        """
+        instructions = get_template("agents/action/prompt.jinja2").render()
+        available = self.llm.get_prompt_budget() - count_tokens(instructions) - self.MESSAGE_OVERHEAD_TOKENS
+        token_budget = max(0, min(Config().get_context_token_budget(self.llm.model_id), available))
+
+        conversation = ConversationContext(token_budget).build_messages(self.project_name, self.llm.model_id)
+        if not conversation:
+            conversation.append({"role": "user", "content": "system: Continue with the next step."})
+        return [{"role": "system", "content": instructions}] + conversation
 
     def run_command(self, command: str):
         """
@@ -134,17 +156,20 @@ class Action:
         new_state["terminal_session"]["title"] = "Terminal"
         AgentState().add_to_current_state(self.project_name, new_state)
 
-        response = self.llm.inference(prompt, self.project_name)
-
-        llm_response = self.validate_response(response)
-
-        while not llm_response:
-            print(colored(f"{self.__class__.__name__}: Invalid response from the model: \n{response}, trying again...",
-                          "red"))
+        try:
+            llm_response = self.structured_output.run(prompt, self.project_name)
+        except StructuredOutputError as e:
             ProjectManager().add_system_message(
-                self.project_name, "Invalid response from the model, trying again..."
+                self.project_name, f"Invalid response from the model, stopping the conversation... ({e.error})"
             )
-            return self.execute()
+            AgentState().set_agent_completed(self.project_name, True)
+            return
+        except (ContextWindowExceededError, AllModelsFailedError) as e:
+            ProjectManager().add_system_message(
+                self.project_name, f"The request to the model failed, stopping the conversation... ({e})"
+            )
+            AgentState().set_agent_completed(self.project_name, True)
+            return
 
         project_manager.add_message_from_devika(self.project_name, llm_response["comment"])
 
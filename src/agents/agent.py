@@ -1,7 +1,10 @@
 import asyncio
+import inspect
 import json
 import platform
 import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
 
 import tiktoken
 
@@ -9,10 +12,15 @@ from src.bert.sentence import SentenceBert
 from src.browser import Browser
 from src.browser import start_interaction
 from src.browser.search import BingSearch, GoogleSearch, DuckDuckGoSearch
+from src.config import Config
 from src.documenter.pdf import PDF
 from src.filesystem import ReadCode
+from src.llm import StructuredOutputError
+from src.llm.aio import gather_bounded
+from src.llm.context_window import ContextWindowExceededError
+from src.llm.router import AllModelsFailedError
 from src.logger import Logger
-from src.memory import KnowledgeBase
+from src.memory import KnowledgeBase, ConversationContext
 from src.project import ProjectManager
 from src.services import Netlify
 from src.socket_instance import emit_agent
@@ -32,11 +40,46 @@ from .researcher import Researcher
 from .runner import Runner
 
 
+def stop_on_model_error(project_arg: str):
+    """
+    Wrap a top-level entry point of the agent flow, whose project name is
+    passed as `project_arg`, so that a model that keeps answering in the
+    wrong format or cannot be reached ends the run like it does in `Action`:
+    with a system message, and the agent marked completed instead of left
+    active. Only entry points are wrapped: the steps they call raise, so the
+    flow never continues with a missing result.
+    """
+    def decorator(method):
+        signature = inspect.signature(method)
+
+        @wraps(method)
+        def wrapper(self, *args, **kwargs):
+            self.current_project = signature.bind(self, *args, **kwargs).arguments.get(project_arg)
+            try:
+                return method(self, *args, **kwargs)
+            except (StructuredOutputError, ContextWindowExceededError, AllModelsFailedError) as e:
+                self.logger.error(f"{method.__name__} stopped: {e}")
+                if not self.current_project:
+                    raise
+                if isinstance(e, StructuredOutputError):
+                    message = f"Invalid response from the model, stopping the conversation... ({e.error})"
+                else:
+                    message = f"The request to the model failed, stopping the conversation... ({e})"
+                self.project_manager.add_system_message(self.current_project, message)
+                self.agent_state.set_agent_active(self.current_project, False)
+                self.agent_state.set_agent_completed(self.current_project, True)
+
+        return wrapper
+
+    return decorator
+
+
 class Agent:
     def __init__(self, base_model: str, search_engine: str, browser: Browser = None):
         if not base_model:
             raise ValueError("base_model is required")
 
+        self.base_model = base_model
         self.logger = Logger()
 
         """
@@ -64,6 +107,7 @@ class Agent:
         self.project_manager = ProjectManager()
         self.agent_state = AgentState()
         self.engine = search_engine
+        self.current_project = None
         self.tokenizer = tiktoken.get_encoding("cl100k_base")
 
     async def open_page(self, project_name, pdf_download_url):
@@ -76,44 +120,92 @@ class Agent:
 
         return browser, raw, data
 
-    def search_queries(self, queries: list, project_name: str) -> dict:
-        results = {}
-
-        knowledge_base = KnowledgeBase()
-        web_search = None
-
+    def get_search_engine(self):
         if self.engine == "bing":
-            web_search = BingSearch()
+            return BingSearch()
         elif self.engine == "google":
-            web_search = GoogleSearch()
+            return GoogleSearch()
         else:
-            web_search = DuckDuckGoSearch()
+            return DuckDuckGoSearch()
 
+    def search_queries(self, queries: list, project_name: str) -> dict:
+        """
+        Research all queries concurrently, in three stages: search, load the
+        first result of each in its own tab of one Chromium instance, and
+        summarize each page with the Formatter. At most `[RESEARCH]
+        MAX_CONCURRENCY` queries are in the same stage at once, and a query
+        that takes longer than `QUERY_TIMEOUT` in a stage is dropped without
+        holding up the others, or the research step. Results are returned in
+        query order.
+        """
         self.logger.info(f"\nSearch Engine :: {self.engine}")
-
-        for query in queries:
-            query = query.strip().lower()
-
-            # knowledge = knowledge_base.get_knowledge(tag=query)
-            # if knowledge:
-            #     results[query] = knowledge
-            #     continue
-
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-
-            web_search.search(query)
-
+        queries = list(dict.fromkeys(query.strip().lower() for query in queries))
+        return asyncio.run(self._research(queries, project_name))
+
+    async def _research(self, queries: list, project_name: str) -> dict:
+        config = Config()
+        limit = config.get_research_max_concurrency()
+        timeout = config.get_research_query_timeout()
+        # Searches block, so they run on their own threads rather than the
+        # default executor, which `asyncio.run` waits for on exit: a thread
+        # stuck on a query that timed out is left behind instead of stalling
+        # the step. Pages are formatted on the event loop through `AsyncLLM`.
+        # There is a thread per query, as `limit` is enforced by `run_stage`,
+        # so later queries never queue behind a stuck one.
+        executor = ThreadPoolExecutor(max_workers=max(1, len(queries)), thread_name_prefix="research")
+        loop = asyncio.get_running_loop()
+
+        async def search(query):
+            web_search = self.get_search_engine()
+            await loop.run_in_executor(executor, web_search.search, query)
             link = web_search.get_first_link()
             print("\nLink :: ", link, '\n')
-
-            browser, raw, data = loop.run_until_complete(self.open_page(project_name, link))
-            emit_agent("screenshot", {"data": raw, "project_name": project_name}, False)
-            results[query] = self.formatter.execute(data, project_name)
-
+            return link
+
+        async def fetch(browser, link):
+            tab = await browser.new_tab()
+            try:
+                await tab.go_to(link)
+                _, raw = await tab.screenshot(project_name)
+                emit_agent("screenshot", {"data": raw, "project_name": project_name}, False)
+                return await tab.extract_text()
+            finally:
+                await tab.close_tab()
+
+        async def run_stage(name, stage, inputs):
+            # `inputs` maps each query still in the running to the input of this stage.
+            outputs = await gather_bounded(
+                (asyncio.wait_for(stage(value), timeout) for value in inputs.values()),
+                limit,
+                return_exceptions=True
+            )
+            results = {}
+            for query, output in zip(inputs, outputs):
+                if isinstance(output, BaseException) or not output:
+                    reason = "timed out" if isinstance(output, asyncio.TimeoutError) else f"failed ({output!r})"
+                    self.logger.warning(f"Research: {name} {reason} for {query}")
+                else:
+                    results[query] = output
+            return results
+
+        try:
+            links = await run_stage("search", search, {query: query for query in queries})
+            if not links:
+                return {}
+
+            browser = await Browser().start()
+            try:
+                pages = await run_stage("fetch", lambda link: fetch(browser, link), links)
+            finally:
+                await browser.close()
+
+            formatted = await run_stage("format", lambda data: self.formatter.async_execute(data, project_name), pages)
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        for query in formatted:
             self.logger.info(f"got the search results for : {query}")
-            # knowledge_base.add_knowledge(tag=query, contents=results[query])
-        return results
+        return {query: formatted[query] for query in queries if query in formatted}
 
     def update_contextual_keywords(self, sentence: str):
         """
@@ -176,6 +268,7 @@ class Agent:
                 )
                 self.coder.save_code_to_project(code, project_name)
 
+    @stop_on_model_error("project_name")
     def subsequent_execute(self, prompt: str, project_name: str):
         """
         Subsequent flow of execution
@@ -185,7 +278,7 @@ class Agent:
 
         self.agent_state.set_agent_active(project_name, True)
 
-        conversation = self.project_manager.get_all_messages_formatted(project_name)
+        conversation = ConversationContext().build(project_name, self.base_model)
         code_markdown = ReadCode(project_name).code_set_to_markdown()
 
         response, action = self.action.execute(conversation, project_name)
@@ -273,6 +366,7 @@ class Agent:
         self.agent_state.set_agent_active(project_name, False)
         self.agent_state.set_agent_completed(project_name, True)
 
+    @stop_on_model_error("project_name_from_user")
     def execute(self, prompt: str, project_name_from_user: str = None) -> str:
         """
         Agentic flow of execution
@@ -296,6 +390,7 @@ class Agent:
             project_name = planner_response["project"]
             self.project_manager.create_project(project_name)
             self.project_manager.add_message_from_user(project_name, prompt)
+        self.current_project = project_name
 
         self.agent_state.set_agent_active(project_name, True)
 
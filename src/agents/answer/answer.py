@@ -1,27 +1,28 @@
 import json
-from pathlib import Path
-
-from jinja2 import Environment, BaseLoader
 
 from src.config import Config
-from src.llm import LLM
+from src.llm import LLM, StructuredOutput
+from src.llm.structured_output import XML
+from src.templates import get_template
 from src.utils import take_json_text_from_triple_quotes, parse_llm_response_to_json, parse_xml_llm_response
 
-PROMPT = Path(__file__).parent.joinpath('prompt.jinja2').read_text().strip()
-
 
 class Answer:
     def __init__(self, base_model: str):
         config = Config()
         self.project_dir = config.get_projects_dir()
         
-        self.llm = LLM(model_id=base_model)
+        self.llm = LLM(model_id=base_model, agent=self.__class__.__name__)
+        self.structured_output = StructuredOutput(
+            self.llm, XML, self.validate_response,
+            "<root><response><![CDATA[ your response ]]></response></root>",
+            required_tags=["response"]
+        )
 
     def render(
         self, conversation: str, code_markdown: str
     ) -> str:
-        env = Environment(loader=BaseLoader())
-        template = env.from_string(PROMPT)
+        template = get_template("agents/answer/prompt.jinja2")
         return template.render(
             conversation=conversation,
             code_markdown=code_markdown
@@ -38,12 +39,4 @@ class Answer:
     def execute(self, conversation: list, code_markdown: str, project_name: str) -> str:
         print(f"{self.__class__.__name__}: Executing...")
         prompt = self.render(conversation, code_markdown)
-        response = self.llm.inference(prompt, project_name)
-        
-        valid_response = self.validate_response(response)
-        
-        while not valid_response:
-            print(f"Answer: Invalid response from the model: {response}, trying again...")
-            return self.execute(conversation, code_markdown, project_name)
-
-        return valid_response
+        return self.structured_output.run(prompt, project_name)
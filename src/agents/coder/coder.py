@@ -1,16 +1,15 @@
 import os
 import time
-from pathlib import Path
 
-from jinja2 import Environment, BaseLoader
 from typing import List, Dict, Union
 
 from src.config import Config
-from src.llm import LLM
+from src.llm import LLM, StructuredOutput
+from src.llm.context_window import fit_prompt
+from src.llm.structured_output import CODE
 from src.state import AgentState
 from src.logger import Logger
-
-PROMPT = Path(__file__).parent.joinpath('prompt.jinja2').read_text().strip()
+from src.templates import get_template
 
 
 class Coder:
@@ -18,17 +17,24 @@ class Coder:
         config = Config()
         self.projects_dir = config.get_projects_dir()
         self.logger = Logger()
-        self.llm = LLM(model_id=base_model)
+        self.llm = LLM(model_id=base_model, agent=self.__class__.__name__)
+        self.structured_output = StructuredOutput(
+            self.llm, CODE, self.validate_response,
+            "The files wrapped in ~~~, each starting with a File: `path/to/file` line followed by its code in a ``` block."
+        )
 
     def render(
         self, step_by_step_plan: str, user_context: str, search_results: dict
     ) -> str:
-        env = Environment(loader=BaseLoader())
-        template = env.from_string(PROMPT)
-        return template.render(
-            step_by_step_plan=step_by_step_plan,
-            user_context=user_context,
-            search_results=search_results,
+        template = get_template("agents/coder/prompt.jinja2")
+        return fit_prompt(
+            lambda search_results: template.render(
+                step_by_step_plan=step_by_step_plan,
+                user_context=user_context,
+                search_results=search_results,
+            ),
+            {"search_results": search_results},
+            self.llm.get_prompt_budget()
         )
 
     def validate_response(self, response: str) -> Union[List[Dict[str, str]], bool]:
@@ -110,13 +116,7 @@ class Coder:
         project_name: str
     ) -> str:
         prompt = self.render(step_by_step_plan, user_context, search_results)
-        response = self.llm.inference(prompt, project_name)
-        
-        valid_response = self.validate_response(response)
-        
-        while not valid_response:
-            print(f"Code: Invalid response from the model: {response}, trying again...")
-            return self.execute(step_by_step_plan, user_context, search_results, project_name)
+        valid_response = self.structured_output.run(prompt, project_name)
         
         print(valid_response)
         
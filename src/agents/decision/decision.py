@@ -1,21 +1,21 @@
 import json
-from pathlib import Path
 
-from jinja2 import Environment, BaseLoader
-
-from src.llm import LLM
+from src.llm import LLM, StructuredOutput
+from src.llm.structured_output import JSON
+from src.templates import get_template
 from src.utils import take_json_text_from_triple_quotes
 
-PROMPT = Path(__file__).parent.joinpath('prompt.jinja2').read_text().strip()
-
 
 class Decision:
     def __init__(self, base_model: str):
-        self.llm = LLM(model_id=base_model)
+        self.llm = LLM(model_id=base_model, agent=self.__class__.__name__)
+        self.structured_output = StructuredOutput(
+            self.llm, JSON, self.validate_response,
+            'A JSON list of objects, each with the keys "function", "args" and "reply".'
+        )
 
     def render(self, prompt: str) -> str:
-        env = Environment(loader=BaseLoader())
-        template = env.from_string(PROMPT)
+        template = get_template("agents/decision/prompt.jinja2")
         return template.render(prompt=prompt)
 
     def validate_response(self, response: str):
@@ -38,12 +38,4 @@ class Decision:
 
     def execute(self, prompt: str, project_name: str) -> str:
         rendered_prompt = self.render(prompt)
-        response = self.llm.inference(rendered_prompt, project_name)
-        
-        valid_response = self.validate_response(response)
-        print(f"Model response: {response}")
-        while not valid_response:
-            print(f"Decision: Invalid response from the model: {response}, trying again...")
-            return self.execute(prompt, project_name)
-
-        return valid_response
+        return self.structured_output.run(rendered_prompt, project_name)
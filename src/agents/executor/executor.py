@@ -1,6 +1,5 @@
 import time
 import json
-from pathlib import Path
 import os
 import subprocess
 
@@ -8,23 +7,30 @@ from termcolor import colored
 
 from src.config import Config
 
-from jinja2 import Environment, BaseLoader
-
 from src.agents.patcher import Patcher
 
-from src.llm import LLM
+from src.llm import LLM, StructuredOutput
+from src.llm.structured_output import XML
 from src.state import AgentState
 from src.project import ProjectManager
+from src.templates import get_template
 from src.utils import take_json_text_from_triple_quotes, parse_xml_llm_response_commands, parse_xml_llm_response
 
-PROMPT = Path(__file__).parent.joinpath('prompt.jinja2').read_text().strip()
-RERUNNER_PROMPT = Path(__file__).parent.joinpath('rerunner.jinja2').read_text().strip()
-
 
 class Executor:
     def __init__(self, base_model: str):
         self.base_model = base_model
-        self.llm = LLM(model_id=base_model)
+        self.llm = LLM(model_id=base_model, agent=self.__class__.__name__)
+        self.structured_output = StructuredOutput(
+            self.llm, XML, self.validate_response,
+            "<root> with one <command><![CDATA[ ... ]]></command> per command to run.",
+            required_tags=["command"]
+        )
+        self.rerunner_structured_output = StructuredOutput(
+            self.llm, XML, self.validate_rerunner_response,
+            "<root> with <action> (command or patch), <response> and, for the command action, <command>; text values wrapped in <![CDATA[ ]]>.",
+            required_tags=["action", "response"]
+        )
         config = Config()
         self.projects_dir = config.get_projects_dir()
 
@@ -34,8 +40,7 @@ class Executor:
         code_markdown: str,
         system_os: str
     ) -> str:
-        env = Environment(loader=BaseLoader())
-        template = env.from_string(PROMPT)
+        template = get_template("agents/executor/prompt.jinja2")
         return template.render(
             conversation=conversation,
             code_markdown=code_markdown,
@@ -50,8 +55,7 @@ class Executor:
         commands: list,
         error: str
     ):
-        env = Environment(loader=BaseLoader())
-        template = env.from_string(RERUNNER_PROMPT)
+        template = get_template("agents/executor/rerunner.jinja2")
         return template.render(
             conversation=conversation,
             code_markdown=code_markdown,
@@ -147,20 +151,10 @@ class Executor:
                     error=command_output
                 )
                 
-                response = self.llm.inference(prompt, project_name)
-                
-                valid_response = self.validate_rerunner_response(response)
-                
-                while not valid_response and not AgentState().is_agent_interruped(project_name):
-                    print(colored(f"{self.__class__.__name__}: Invalid response from the model: {response}, trying again...", "red"))
-                    return self.run_code(
-                        commands,
-                        project_path,
-                        project_name,
-                        conversation,
-                        code_markdown,
-                        system_os
-                    )
+                valid_response = self.rerunner_structured_output.run(
+                    prompt, project_name,
+                    should_stop=lambda: AgentState().is_agent_interruped(project_name)
+                )
                 if AgentState().is_agent_interruped(project_name):
                     print(colored(f"{self.__class__.__name__}: Agent is interrupted", "yellow"))
                     break
@@ -246,13 +240,10 @@ class Executor:
     ) -> str:
         print(f"{self.__class__.__name__}: Executing...")
         prompt = self.render(conversation, code_markdown, os_system)
-        response = self.llm.inference(prompt, project_name)
-        
-        valid_response = self.validate_response(response)
-        
-        while not valid_response and not AgentState().is_agent_interruped(project_name):
-            print(colored(f"{self.__class__.__name__}: Invalid response from the model: {response}, trying again...", "red"))
-            return self.execute(conversation, code_markdown, os_system, project_path, project_name)
+        valid_response = self.structured_output.run(
+            prompt, project_name,
+            should_stop=lambda: AgentState().is_agent_interruped(project_name)
+        )
         if AgentState().is_agent_interruped(project_name):
             print(colored(f"{self.__class__.__name__}: Agent is interrupted", "yellow"))
             return None
@@ -1,16 +1,14 @@
 import os
 import time
-from pathlib import Path
 
-from jinja2 import Environment, BaseLoader
 from typing import List, Dict, Union
 
 from src.config import Config
-from src.llm import LLM
+from src.llm import LLM, StructuredOutput
+from src.llm.context_window import fit_prompt
+from src.llm.structured_output import CODE
 from src.state import AgentState
-
-PROMPT = Path(__file__).parent.joinpath('prompt.jinja2').read_text().strip()
-
+from src.templates import get_template
 
 
 class Feature:
@@ -18,7 +16,11 @@ class Feature:
         config = Config()
         self.project_dir = config.get_projects_dir()
         
-        self.llm = LLM(model_id=base_model)
+        self.llm = LLM(model_id=base_model, agent=self.__class__.__name__)
+        self.structured_output = StructuredOutput(
+            self.llm, CODE, self.validate_response,
+            "The files wrapped in ~~~, each starting with a File: `path/to/file` line followed by its code in a ``` block."
+        )
 
     def render(
         self,
@@ -26,12 +28,15 @@ class Feature:
         code_markdown: str,
         system_os: str
     ) -> str:
-        env = Environment(loader=BaseLoader())
-        template = env.from_string(PROMPT)
-        return template.render(
-            conversation=conversation,
-            code_markdown=code_markdown,
-            system_os=system_os
+        template = get_template("agents/feature/prompt.jinja2")
+        return fit_prompt(
+            lambda code_markdown: template.render(
+                conversation=conversation,
+                code_markdown=code_markdown,
+                system_os=system_os
+            ),
+            {"code_markdown": code_markdown},
+            self.llm.get_prompt_budget()
         )
 
     def validate_response(self, response: str) -> Union[List[Dict[str, str]], bool]:
@@ -107,13 +112,7 @@ class Feature:
     ) -> str:
         print(f"{self.__class__.__name__}: Executing...")
         prompt = self.render(conversation, code_markdown, system_os)
-        response = self.llm.inference(prompt, project_name)
-        
-        valid_response = self.validate_response(response)
-        
-        while not valid_response:
-            print(f"Feature: Invalid response from the model: {response}, trying again...")
-            return self.execute(conversation, code_markdown, system_os, project_name)
+        valid_response = self.structured_output.run(prompt, project_name)
         
         self.emulate_code_writing(valid_response, project_name)
 
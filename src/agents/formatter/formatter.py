@@ -1,17 +1,14 @@
-from jinja2 import Environment, BaseLoader
-from pathlib import Path
+from src.llm import LLM, AsyncLLM
+from src.templates import get_template
 
-from src.llm import LLM
-
-PROMPT = Path(__file__).parent.joinpath('prompt.jinja2').read_text().strip()
 
 class Formatter:
     def __init__(self, base_model: str):
-        self.llm = LLM(model_id=base_model)
+        self.llm = LLM(model_id=base_model, agent=self.__class__.__name__)
+        self.async_llm = AsyncLLM(model_id=base_model, agent=self.__class__.__name__)
 
     def render(self, raw_text: str) -> str:
-        env = Environment(loader=BaseLoader())
-        template = env.from_string(PROMPT)
+        template = get_template("agents/formatter/prompt.jinja2")
         return template.render(raw_text=raw_text)
     
     def validate_response(self, response: str) -> bool:
@@ -21,3 +18,12 @@ class Formatter:
         raw_text = self.render(raw_text)
         response = self.llm.inference(raw_text, project_name)
         return response
+
+    async def async_execute(self, raw_text: str, project_name: str) -> str:
+        """
+        `execute` on the event loop, so the pages of a research step are
+        formatted concurrently.
+        """
+        raw_text = self.render(raw_text)
+        response = await self.async_llm.inference(raw_text, project_name)
+        return response
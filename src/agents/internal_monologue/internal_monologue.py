@@ -1,21 +1,21 @@
 import json
-from pathlib import Path
 
-from jinja2 import Environment, BaseLoader
-
-from src.llm import LLM
+from src.llm import LLM, StructuredOutput
+from src.llm.structured_output import JSON
+from src.templates import get_template
 from src.utils import take_json_text_from_triple_quotes
 
-PROMPT = Path(__file__).parent.joinpath('prompt.jinja2').read_text().strip()
-
 
 class InternalMonologue:
     def __init__(self, base_model: str):
-        self.llm = LLM(model_id=base_model)
+        self.llm = LLM(model_id=base_model, agent=self.__class__.__name__)
+        self.structured_output = StructuredOutput(
+            self.llm, JSON, self.validate_response,
+            'A JSON object with the key "internal_monologue".'
+        )
 
     def render(self, current_prompt: str) -> str:
-        env = Environment(loader=BaseLoader())
-        template = env.from_string(PROMPT)
+        template = get_template("agents/internal_monologue/prompt.jinja2")
         return template.render(current_prompt=current_prompt)
 
     def validate_response(self, response: str):
@@ -39,13 +39,5 @@ class InternalMonologue:
 
     def execute(self, current_prompt: str, project_name: str) -> str:
         rendered_prompt = self.render(current_prompt)
-        response = self.llm.inference(rendered_prompt, project_name)
-        
-        valid_response = self.validate_response(response)
-        
-        while not valid_response:
-            print(f"Internal: Invalid response from the model: {response}, trying again...")
-            return self.execute(current_prompt, project_name)
-
-        return valid_response
+        return self.structured_output.run(rendered_prompt, project_name)
 
@@ -1,18 +1,13 @@
-from jinja2 import Environment, BaseLoader
-from pathlib import Path
-
 from src.llm import LLM
-
-PROMPT = Path(__file__).parent.joinpath('prompt.jinja2').read_text().strip()
+from src.templates import get_template
 
 
 class Planner:
     def __init__(self, base_model: str):
-        self.llm = LLM(model_id=base_model)
+        self.llm = LLM(model_id=base_model, agent=self.__class__.__name__)
 
     def render(self, prompt: str) -> str:
-        env = Environment(loader=BaseLoader())
-        template = env.from_string(PROMPT)
+        template = get_template("agents/planner/prompt.jinja2")
         return template.render(prompt=prompt)
     
     def validate_response(self, response: str) -> bool:
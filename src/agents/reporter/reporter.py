@@ -1,19 +1,18 @@
-from pathlib import Path
-
-from jinja2 import Environment, BaseLoader
-
-from src.llm import LLM
-
-PROMPT = Path(__file__).parent.joinpath('prompt.jinja2').read_text().strip()
+from src.llm import LLM, StructuredOutput
+from src.llm.structured_output import TEXT
+from src.templates import get_template
 
 
 class Reporter:
     def __init__(self, base_model: str):
-        self.llm = LLM(model_id=base_model)
+        self.llm = LLM(model_id=base_model, agent=self.__class__.__name__)
+        self.structured_output = StructuredOutput(
+            self.llm, TEXT, self.validate_response,
+            "The report in Markdown."
+        )
 
     def render(self, conversation: list, code_markdown: str) -> str:
-        env = Environment(loader=BaseLoader())
-        template = env.from_string(PROMPT)
+        template = get_template("agents/reporter/prompt.jinja2")
         return template.render(
             conversation=conversation,
             code_markdown=code_markdown
@@ -34,13 +33,5 @@ class Reporter:
     ) -> str:
         print(f"{self.__class__.__name__}: Executing...")
         prompt = self.render(conversation, code_markdown)
-        response = self.llm.inference(prompt, project_name)
-        
-        valid_response = self.validate_response(response)
-        
-        while not valid_response:
-            print(f"Reporter: Invalid response from the model: {response}, trying again...")
-            return self.execute(conversation, code_markdown, project_name)
-
-        return valid_response
+        return self.structured_output.run(prompt, project_name)
 
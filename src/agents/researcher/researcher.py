@@ -1,24 +1,24 @@
 import json
 from typing import List
-from pathlib import Path
 
-from jinja2 import Environment, BaseLoader
-
-from src.llm import LLM
+from src.llm import LLM, StructuredOutput
+from src.llm.structured_output import JSON
 from src.browser.search import BingSearch
+from src.templates import get_template
 from src.utils import take_json_text_from_triple_quotes
 
-PROMPT = Path(__file__).parent.joinpath('prompt.jinja2').read_text().strip()
-
 
 class Researcher:
     def __init__(self, base_model: str):
         self.bing_search = BingSearch()
-        self.llm = LLM(model_id=base_model)
+        self.llm = LLM(model_id=base_model, agent=self.__class__.__name__)
+        self.structured_output = StructuredOutput(
+            self.llm, JSON, self.validate_response,
+            'A JSON object with the keys "queries" (a list of search queries) and "ask_user".'
+        )
 
     def render(self, step_by_step_plan: str, contextual_keywords: str) -> str:
-        env = Environment(loader=BaseLoader())
-        template = env.from_string(PROMPT)
+        template = get_template("agents/researcher/prompt.jinja2")
         return template.render(
             step_by_step_plan=step_by_step_plan,
             contextual_keywords=contextual_keywords
@@ -49,12 +49,4 @@ class Researcher:
         contextual_keywords_str = ", ".join(map(lambda k: k.capitalize(), contextual_keywords))
         prompt = self.render(step_by_step_plan, contextual_keywords_str)
         
-        response = self.llm.inference(prompt, project_name)
-        
-        valid_response = self.validate_response(response)
-
-        while not valid_response:
-            print(f"Researched: Invalid response from the model: {response}, trying again...")
-            return self.execute(step_by_step_plan, contextual_keywords, project_name)
-
-        return valid_response
+        return self.structured_output.run(prompt, project_name)
@@ -1,24 +1,31 @@
 import json
 import subprocess
 import time
-from pathlib import Path
 
-from jinja2 import Environment, BaseLoader
 from termcolor import colored
 
 from src.agents.patcher import Patcher
-from src.llm import LLM
+from src.llm import LLM, StructuredOutput
+from src.llm.structured_output import JSON, XML
 from src.project import ProjectManager
 from src.state import AgentState
+from src.templates import get_template
 from src.utils import parse_xml_llm_response_commands
 
-PROMPT = Path(__file__).parent.joinpath('prompt.jinja2').read_text().strip()
-RERUNNER_PROMPT = Path(__file__).parent.joinpath('rerunner.jinja2').read_text().strip()
 
 class Runner:
     def __init__(self, base_model: str):
         self.base_model = base_model
-        self.llm = LLM(model_id=base_model)
+        self.llm = LLM(model_id=base_model, agent=self.__class__.__name__)
+        self.structured_output = StructuredOutput(
+            self.llm, XML, self.validate_response,
+            "<root> with one <command><![CDATA[ ... ]]></command> per command to run.",
+            required_tags=["command"]
+        )
+        self.rerunner_structured_output = StructuredOutput(
+            self.llm, JSON, self.validate_rerunner_response,
+            'A JSON object with the keys "action" (command or patch), "response" and, for the command action, "command".'
+        )
 
     def render(
         self,
@@ -26,8 +33,7 @@ class Runner:
         code_markdown: str,
         system_os: str
     ) -> str:
-        env = Environment(loader=BaseLoader())
-        template = env.from_string(PROMPT)
+        template = get_template("agents/runner/prompt.jinja2")
         return template.render(
             conversation=conversation,
             code_markdown=code_markdown,
@@ -42,8 +48,7 @@ class Runner:
         commands: list,
         error: str
     ):
-        env = Environment(loader=BaseLoader())
-        template = env.from_string(RERUNNER_PROMPT)
+        template = get_template("agents/runner/rerunner.jinja2")
         return template.render(
             conversation=conversation,
             code_markdown=code_markdown,
@@ -128,20 +133,10 @@ class Runner:
                     error=command_output
                 )
                 
-                response = self.llm.inference(prompt, project_name)
-                
-                valid_response = self.validate_rerunner_response(response)
-
-                while not valid_response and not AgentState().is_agent_interruped(project_name):
-                    print(colored(f"{self.__class__.__name__}: Invalid response from the model: {response}, trying again...", "red"))
-                    return self.run_code(
-                        commands,
-                        project_path,
-                        project_name,
-                        conversation,
-                        code_markdown,
-                        system_os
-                    )
+                valid_response = self.rerunner_structured_output.run(
+                    prompt, project_name,
+                    should_stop=lambda: AgentState().is_agent_interruped(project_name)
+                )
                 if AgentState().is_agent_interruped(project_name):
                     print(colored(f"{self.__class__.__name__}: Agent is interrupted", "yellow"))
                     break
@@ -229,13 +224,10 @@ class Runner:
     ) -> str:
         print(f"{self.__class__.__name__}: Executing...")
         prompt = self.render(conversation, code_markdown, os_system)
-        response = self.llm.inference(prompt, project_name)
-        
-        valid_response = self.validate_response(response)
-        
-        while not valid_response and not AgentState().is_agent_interruped(project_name):
-            print(colored(f"{self.__class__.__name__}: Invalid response from the model: {response}, trying again...", "red"))
-            return self.execute(conversation, code_markdown, os_system, project_path, project_name)
+        valid_response = self.structured_output.run(
+            prompt, project_name,
+            should_stop=lambda: AgentState().is_agent_interruped(project_name)
+        )
         if AgentState().is_agent_interruped(project_name):
             print(colored(f"{self.__class__.__name__}: Agent is interrupted", "yellow"))
             return None
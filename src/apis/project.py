@@ -1,8 +1,9 @@
-from flask import blueprints, request, jsonify, send_file, make_response
+from flask import blueprints, request, jsonify, send_file, make_response, Response, stream_with_context
 from src.logger import Logger, route_logger
 from src.config import Config
 from src.project import ProjectManager
 from ..state import AgentState
+from ..token_usage import TokenUsage
 
 import os
 
@@ -29,6 +30,7 @@ def delete_project():
     project_name = data.get("project_name")
     manager.delete_project(project_name)
     AgentState().delete_state(project_name)
+    TokenUsage().delete_usage(project_name)
     return jsonify({"message": "Project deleted"})
 
 
@@ -43,8 +45,17 @@ def delete_all_projects():
 @route_logger(logger)
 def download_project():
     project_name = request.args.get("project_name")
-    manager.project_to_zip(project_name)
-    project_path = manager.get_zip_path(project_name)
+
+    if request.args.get("stream") == "true":
+        filename = os.path.basename(manager.get_zip_path(project_name))
+        return Response(
+            stream_with_context(manager.stream_project_zip(project_name)),
+            mimetype="application/zip",
+            headers={"Content-Disposition": f"attachment; filename={filename}"},
+            direct_passthrough=True
+        )
+
+    project_path = manager.project_to_zip(project_name)
     return send_file(project_path, as_attachment=False)
 
 
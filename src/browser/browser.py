@@ -24,8 +24,20 @@ class Browser:
         self.page = await self.browser.new_page()
         return self
 
-    # def new_page(self):
-    #     return self.browser.new_page()
+    async def new_tab(self):
+        """
+        A `Browser` on a new page of this Chromium instance, so that several
+        pages can be loaded at once without launching Chromium for each.
+        Close it with `close_tab`.
+        """
+        tab = Browser()
+        tab.playwright = self.playwright
+        tab.browser = self.browser
+        tab.page = await self.browser.new_page()
+        return tab
+
+    async def close_tab(self):
+        await self.page.close()
 
     async def go_to(self, url):
         try:
@@ -2,6 +2,7 @@ import threading
 
 import requests
 from src.config import Config
+from src.browser.search_cache import SearchCache
 
 import re
 from urllib.parse import unquote
@@ -10,20 +11,29 @@ import orjson
 
 
 class BingSearch:
+    market = "en-US"
+
     def __init__(self):
         self.config = Config()
+        self.cache = SearchCache()
         self.bing_api_key = self.config.get_bing_api_key()
         self.bing_api_endpoint = self.config.get_bing_api_endpoint()
+        self.timeout = self.config.get_research_query_timeout()
         self.query_result = None
 
     def search(self, query):
+        self.query_result = self.cache.get("bing", query, self.market)
+        if self.query_result is not None:
+            return self.query_result
+
         headers = {"Ocp-Apim-Subscription-Key": self.bing_api_key}
-        params = {"q": query, "mkt": "en-US"}
+        params = {"q": query, "mkt": self.market}
 
         try:
-            response = requests.get(self.bing_api_endpoint, headers=headers, params=params)
+            response = requests.get(self.bing_api_endpoint, headers=headers, params=params, timeout=self.timeout)
             response.raise_for_status()
             self.query_result = response.json()
+            self.cache.put("bing", query, self.query_result, self.market)
             return self.query_result
         except Exception as error:
             return error
@@ -35,12 +45,19 @@ class BingSearch:
 class GoogleSearch:
     def __init__(self):
         self.config = Config()
+        self.cache = SearchCache()
         self.google_search_api_key = self.config.get_google_search_api_key()
         self.google_search_engine_ID = self.config.get_google_search_engine_id()
         self.google_search_api_endpoint = self.config.get_google_search_api_endpoint()
+        self.timeout = self.config.get_research_query_timeout()
         self.query_result = None
 
     def search(self, query):
+        # Results depend on the configured search engine, so it stands in for the market.
+        self.query_result = self.cache.get("google", query, self.google_search_engine_ID)
+        if self.query_result is not None:
+            return
+
         params = {
             "key": self.google_search_api_key,
             "cx": self.google_search_engine_ID,
@@ -48,9 +65,11 @@ class GoogleSearch:
         }
         try:
             print("Searching in Google...")
-            response = requests.get(self.google_search_api_endpoint, params=params)
+            response = requests.get(self.google_search_api_endpoint, params=params, timeout=self.timeout)
             # response.raise_for_status()
             self.query_result = response.json()
+            if response.ok:
+                self.cache.put("google", query, self.query_result, self.google_search_engine_ID)
         except Exception as error:
             return error
 
@@ -89,15 +108,19 @@ class DuckDuckGoSearch:
 
     currently, the package is not working with our current setup.
     """
+    market = "en-us"
+
     def __init__(self):
         from curl_cffi import requests as curl_requests
         self.query_result = None
+        self.cache = SearchCache()
+        self.timeout = Config().get_research_query_timeout()
         self.asession = curl_requests.Session(impersonate="chrome", allow_redirects=False)
         self.asession.headers["Referer"] = "https://duckduckgo.com/"
 
     def _get_url(self, method, url, data):
         try:
-            resp = self.asession.request(method, url, data=data)
+            resp = self.asession.request(method, url, data=data, timeout=self.timeout)
             if resp.status_code == 200:
                 return resp.content
             if resp.status_code == (202, 301, 403):
@@ -107,10 +130,14 @@ class DuckDuckGoSearch:
                 raise TimeoutError("Duckduckgo timed out error")
 
     def duck(self, query):
+        self.query_result = self.cache.get("duckduckgo", query, self.market)
+        if self.query_result is not None:
+            return
+
         resp = self._get_url("POST", "https://duckduckgo.com/", data={"q": query})
         vqd = self.extract_vqd(resp)
 
-        params = {"q": query, "kl": 'en-us', "p": "1", "s": "0", "df": "", "vqd": vqd, "ex": ""}
+        params = {"q": query, "kl": self.market, "p": "1", "s": "0", "df": "", "vqd": vqd, "ex": ""}
         resp = self._get_url("GET", "https://links.duckduckgo.com/d.js", params)
         page_data = self.text_extract_json(resp)
 
@@ -128,6 +155,8 @@ class DuckDuckGoSearch:
                     results.append(result)
 
         self.query_result = results
+        if results:
+            self.cache.put("duckduckgo", query, results, self.market)
 
     def search(self, query):
         self.duck(query)
@@ -0,0 +1,136 @@
+import hashlib
+import json
+import threading
+import time
+from typing import Optional
+
+from sqlalchemy import func
+from sqlmodel import Field, Session, SQLModel
+
+from src.config import Config
+from src.database import get_engine
+
+
+class SearchCacheModel(SQLModel, table=True):
+    """
+    Search results keyed by a hash of the engine, the normalized query and the
+    market. `created_at` decides when an entry expires, `last_used` orders
+    entries for LRU eviction.
+    """
+    __tablename__ = "search_cache"
+
+    key: str = Field(primary_key=True)
+    engine: str
+    query: str
+    market: str
+    result: str
+    hits: int = 0
+    created_at: float = Field(default_factory=time.time)
+    last_used: float = Field(default_factory=time.time, index=True)
+
+
+_counters = {"hits": 0, "misses": 0, "expired": 0}
+_counters_lock = threading.Lock()
+
+
+def _count(name: str):
+    with _counters_lock:
+        _counters[name] += 1
+
+
+class SearchCache:
+    """
+    Cache of web search results shared by all projects, so that a query that
+    was searched recently is not sent to the search API again. Entries expire
+    after `[SEARCH_CACHE] TTL` seconds; a TTL of 0 disables the cache.
+    """
+
+    def __init__(self):
+        config = Config()
+        self.engine = get_engine(config.get_sqlite_db())
+        self.ttl = config.get_search_cache_ttl()
+        self.max_entries = config.get_search_cache_max_entries()
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0
+
+    @staticmethod
+    def normalize_query(query: str) -> str:
+        return " ".join(query.lower().split())
+
+    @classmethod
+    def make_key(cls, engine: str, query: str, market: str = "") -> str:
+        payload = json.dumps([engine, cls.normalize_query(query), market or ""])
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(self, engine: str, query: str, market: str = ""):
+        if not self.enabled:
+            return None
+
+        key = self.make_key(engine, query, market)
+        with Session(self.engine) as session:
+            entry = session.get(SearchCacheModel, key)
+            if entry is None:
+                _count("misses")
+                return None
+
+            if time.time() - entry.created_at > self.ttl:
+                session.delete(entry)
+                session.commit()
+                _count("expired")
+                _count("misses")
+                return None
+
+            entry.hits += 1
+            entry.last_used = time.time()
+            result = entry.result
+            session.commit()
+
+        _count("hits")
+        return json.loads(result)
+
+    def put(self, engine: str, query: str, result, market: str = ""):
+        if not self.enabled:
+            return
+
+        with Session(self.engine) as session:
+            session.merge(SearchCacheModel(
+                key=self.make_key(engine, query, market),
+                engine=engine,
+                query=self.normalize_query(query),
+                market=market or "",
+                result=json.dumps(result)
+            ))
+            session.commit()
+            self._evict(session)
+
+    def _evict(self, session: Session):
+        count = session.query(func.count(SearchCacheModel.key)).scalar()
+        if count <= self.max_entries:
+            return
+
+        # Expired entries go first, then the least recently used.
+        session.query(SearchCacheModel).filter(
+            SearchCacheModel.created_at < time.time() - self.ttl
+        ).delete()
+        count = session.query(func.count(SearchCacheModel.key)).scalar()
+        if count > self.max_entries:
+            evicted = [
+                key for key, in session.query(SearchCacheModel.key)
+                .order_by(SearchCacheModel.last_used)
+                .limit(count - self.max_entries)
+            ]
+            session.query(SearchCacheModel).filter(SearchCacheModel.key.in_(evicted)).delete()
+        session.commit()
+
+    def clear(self):
+        with Session(self.engine) as session:
+            session.query(SearchCacheModel).delete()
+            session.commit()
+
+    def stats(self) -> dict:
+        with Session(self.engine) as session:
+            count = session.query(func.count(SearchCacheModel.key)).scalar()
+        with _counters_lock:
+            return {**_counters, "entries": count}
@@ -40,6 +40,18 @@ class Config:
     def get_ollama_api_endpoint(self):
         return self.config["API_ENDPOINTS"]["OLLAMA"]
 
+    def get_ollama_timeout(self):
+        return float(self.config.get("OLLAMA", {}).get("TIMEOUT", 600))
+
+    def get_ollama_discovery_timeout(self):
+        return float(self.config.get("OLLAMA", {}).get("DISCOVERY_TIMEOUT", 2))
+
+    def get_ollama_keep_alive(self):
+        return self.config.get("OLLAMA", {}).get("KEEP_ALIVE", "30m")
+
+    def get_ollama_models_ttl(self):
+        return float(self.config.get("OLLAMA", {}).get("MODELS_TTL", 60))
+
     def get_claude_api_key(self):
         return self.config["API_KEYS"]["CLAUDE"]
 
@@ -61,6 +73,164 @@ class Config:
     def get_sqlite_db(self):
         return self.config["STORAGE"]["SQLITE_DB"]
 
+    def get_sqlite_busy_timeout(self):
+        return int(self.config.get("DATABASE", {}).get("BUSY_TIMEOUT", 5000))
+
+    def get_sqlite_pool_size(self):
+        return int(self.config.get("DATABASE", {}).get("POOL_SIZE", 5))
+
+    def get_sqlite_pool_overflow(self):
+        return int(self.config.get("DATABASE", {}).get("POOL_OVERFLOW", 10))
+
+    def get_state_cache_mode(self):
+        return self.config.get("STATE", {}).get("CACHE_MODE", "write-through")
+
+    def get_state_flush_interval(self):
+        return float(self.config.get("STATE", {}).get("FLUSH_INTERVAL", 1.0))
+
+    def get_state_flush_batch_size(self):
+        return int(self.config.get("STATE", {}).get("FLUSH_BATCH_SIZE", 50))
+
+    def get_state_socket_protocol(self):
+        return self.config.get("STATE", {}).get("SOCKET_PROTOCOL", "full")
+
+    def get_state_hot_states(self):
+        return int(self.config.get("STATE", {}).get("HOT_STATES", 200))
+
+    def get_state_compaction_interval(self):
+        return float(self.config.get("STATE", {}).get("COMPACTION_INTERVAL", 0))
+
+    def get_state_archive(self):
+        return self.config.get("STATE", {}).get("ARCHIVE", "false") == "true"
+
+    def get_state_archive_dir(self):
+        return self.config.get("STATE", {}).get("ARCHIVE_DIR", "data/archive")
+
+    def get_context_token_budget(self, model_id: str = None):
+        context = self.config.get("CONTEXT", {})
+        budget = context.get("MODEL_TOKEN_BUDGETS", {}).get(model_id)
+        if budget is None:
+            budget = context.get("TOKEN_BUDGET", 8000)
+        return int(budget)
+
+    def get_context_window(self, model_id: str):
+        return self.config.get("CONTEXT", {}).get("MODEL_CONTEXT_WINDOWS", {}).get(model_id)
+
+    def get_context_default_window(self):
+        return int(self.config.get("CONTEXT", {}).get("DEFAULT_CONTEXT_WINDOW", 8192))
+
+    def get_context_response_tokens(self):
+        return int(self.config.get("CONTEXT", {}).get("RESPONSE_TOKENS", 1024))
+
+    def get_context_recent_messages(self):
+        return int(self.config.get("CONTEXT", {}).get("RECENT_MESSAGES", 12))
+
+    def get_context_max_message_tokens(self):
+        return int(self.config.get("CONTEXT", {}).get("MAX_MESSAGE_TOKENS", 1000))
+
+    def get_context_digest_chars(self):
+        return int(self.config.get("CONTEXT", {}).get("DIGEST_CHARS", 160))
+
+    def get_llm_stream(self):
+        return self.config.get("LLM", {}).get("STREAM", "false") == "true"
+
+    def get_llm_stream_flush_interval(self):
+        return float(self.config.get("LLM", {}).get("STREAM_FLUSH_INTERVAL", 0.1))
+
+    def get_llm_stream_flush_chars(self):
+        return int(self.config.get("LLM", {}).get("STREAM_FLUSH_CHARS", 80))
+
+    def get_research_max_concurrency(self):
+        return int(self.config.get("RESEARCH", {}).get("MAX_CONCURRENCY", 4))
+
+    def get_research_query_timeout(self):
+        return float(self.config.get("RESEARCH", {}).get("QUERY_TIMEOUT", 60))
+
+    def get_search_cache_ttl(self):
+        return float(self.config.get("SEARCH_CACHE", {}).get("TTL", 86400))
+
+    def get_search_cache_max_entries(self):
+        return int(self.config.get("SEARCH_CACHE", {}).get("MAX_ENTRIES", 5000))
+
+    def get_llm_max_concurrency(self):
+        return int(self.config.get("LLM", {}).get("MAX_CONCURRENCY", 4))
+
+    def get_llm_cache_agents(self):
+        return self.config.get("LLM", {}).get("CACHE_AGENTS", [])
+
+    def get_llm_cache_max_entries(self):
+        return int(self.config.get("LLM", {}).get("CACHE_MAX_ENTRIES", 10000))
+
+    def get_llm_cache_max_size_mb(self):
+        return float(self.config.get("LLM", {}).get("CACHE_MAX_SIZE_MB", 100))
+
+    def get_llm_cache_ttl(self):
+        return float(self.config.get("LLM", {}).get("CACHE_TTL", 0))
+
+    def get_llm_metrics_max_rows(self):
+        return int(self.config.get("LLM", {}).get("METRICS_MAX_ROWS", 100000))
+
+    def get_router_max_retries(self):
+        return int(self.config.get("ROUTER", {}).get("MAX_RETRIES", 3))
+
+    def get_router_backoff_base(self):
+        return float(self.config.get("ROUTER", {}).get("BACKOFF_BASE", 1.0))
+
+    def get_router_backoff_max(self):
+        return float(self.config.get("ROUTER", {}).get("BACKOFF_MAX", 30.0))
+
+    def get_router_failure_threshold(self):
+        return int(self.config.get("ROUTER", {}).get("FAILURE_THRESHOLD", 5))
+
+    def get_router_reset_timeout(self):
+        return float(self.config.get("ROUTER", {}).get("RESET_TIMEOUT", 60.0))
+
+    def get_router_hedge(self):
+        return self.config.get("ROUTER", {}).get("HEDGE", "false") == "true"
+
+    def get_router_hedge_min_samples(self):
+        return int(self.config.get("ROUTER", {}).get("HEDGE_MIN_SAMPLES", 20))
+
+    def get_router_latency_window(self):
+        return int(self.config.get("ROUTER", {}).get("LATENCY_WINDOW", 100))
+
+    def get_router_fallbacks(self, model_id):
+        fallbacks = self.config.get("ROUTER", {}).get("FALLBACKS", {})
+        return fallbacks.get(model_id, fallbacks.get("*", []))
+
+    def get_scheduler_limits(self, provider):
+        return self.config.get("SCHEDULER", {}).get("LIMITS", {}).get(provider, {})
+
+    def get_scheduler_interactive_agents(self):
+        return self.config.get("SCHEDULER", {}).get("INTERACTIVE_AGENTS", ["Action"])
+
+    def get_scheduler_background_agents(self):
+        return self.config.get("SCHEDULER", {}).get("BACKGROUND_AGENTS", ["Formatter", "InternalMonologue"])
+
+    def get_speculative_settings(self, agent):
+        return self.config.get("SPECULATIVE", {}).get(agent, {})
+
+    def get_replay_mode(self):
+        return self.config.get("REPLAY", {}).get("MODE", "off")
+
+    def get_replay_cassette(self):
+        return self.config.get("REPLAY", {}).get("CASSETTE", "data/cassettes/session.jsonl")
+
+    def get_replay_simulate_latency(self):
+        return self.config.get("REPLAY", {}).get("SIMULATE_LATENCY", "false") == "true"
+
+    def get_templates_bytecode_cache(self):
+        return self.config.get("TEMPLATES", {}).get("BYTECODE_CACHE", "false") == "true"
+
+    def get_templates_bytecode_cache_dir(self):
+        return self.config.get("TEMPLATES", {}).get("BYTECODE_CACHE_DIR", "data/template_cache")
+
+    def get_structured_output_max_retries(self):
+        return int(self.config.get("STRUCTURED_OUTPUT", {}).get("MAX_RETRIES", 2))
+
+    def get_zip_exclude(self):
+        return self.config.get("PROJECTS", {}).get("ZIP_EXCLUDE", [])
+
     def get_screenshots_dir(self):
         return self.config["STORAGE"]["SCREENSHOTS_DIR"]
 
@@ -0,0 +1,77 @@
+import threading
+
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
+from sqlmodel import SQLModel, create_engine
+
+from src.config import Config
+
+"""
+One SQLAlchemy engine per SQLite database, shared by every `AgentState`,
+`ProjectManager` and `KnowledgeBase` in the process.
+"""
+
+_engines = {}
+_created_tables = {}
+_lock = threading.Lock()
+
+
+def _create_sqlite_engine(sqlite_path: str):
+    config = Config()
+    busy_timeout = config.get_sqlite_busy_timeout()
+
+    engine = create_engine(
+        f"sqlite:///{sqlite_path}",
+        poolclass=QueuePool,
+        pool_size=config.get_sqlite_pool_size(),
+        max_overflow=config.get_sqlite_pool_overflow(),
+        # gevent runs every greenlet on the same OS thread, but connections are
+        # still handed out by the pool to whichever greenlet asks next.
+        connect_args={"check_same_thread": False, "timeout": busy_timeout / 1000},
+    )
+
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, _connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA busy_timeout={int(busy_timeout)}")
+        cursor.close()
+
+    return engine
+
+
+def get_engine(sqlite_path: str = None):
+    """
+    Return the shared engine for `sqlite_path` (the configured database by default),
+    creating it and any table registered since the last call on the way.
+    """
+    sqlite_path = sqlite_path or Config().get_sqlite_db()
+
+    engine = _engines.get(sqlite_path)
+    if engine is not None and not SQLModel.metadata.tables.keys() - _created_tables[sqlite_path]:
+        return engine
+
+    with _lock:
+        engine = _engines.get(sqlite_path)
+        if engine is None:
+            engine = _create_sqlite_engine(sqlite_path)
+            _engines[sqlite_path] = engine
+            _created_tables[sqlite_path] = set()
+
+        missing = SQLModel.metadata.tables.keys() - _created_tables[sqlite_path]
+        if missing:
+            SQLModel.metadata.create_all(
+                engine, tables=[SQLModel.metadata.tables[name] for name in missing]
+            )
+            _created_tables[sqlite_path] |= missing
+
+    return engine
+
+
+def dispose_engines():
+    with _lock:
+        for engine in _engines.values():
+            engine.dispose()
+        _engines.clear()
+        _created_tables.clear()
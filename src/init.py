@@ -21,6 +21,11 @@ def init_devika():
     os.makedirs(projects_dir, exist_ok=True)
     os.makedirs(logs_dir, exist_ok=True)
 
+    from src.templates import preload
+
+    logger.info("Compiling prompt templates...")
+    logger.info(f"{preload()} prompt templates compiled.")
+
     from src.bert.sentence import SentenceBert
 
     logger.info("Loading sentence-transformer BERT models...")
@@ -1 +1,3 @@
-from .llm import LLM
\ No newline at end of file
+from .llm import LLM
+from .async_llm import AsyncLLM
+from .structured_output import StructuredOutput, StructuredOutputError
@@ -0,0 +1,41 @@
+import asyncio
+import weakref
+
+from src.config import Config
+
+
+def loop_local(clients: weakref.WeakKeyDictionary, factory):
+    """
+    Return the client created by `factory` for the running event loop. Async SDK
+    clients keep connections bound to the loop they were first used on, so each
+    loop gets its own client, dropped together with the loop.
+    """
+    loop = asyncio.get_running_loop()
+    client = clients.get(loop)
+    if client is None:
+        client = clients[loop] = factory()
+    return client
+
+
+async def gather_bounded(coroutines, limit: int = None, return_exceptions: bool = False) -> list:
+    """
+    Like `asyncio.gather`, but with at most `limit` coroutines running at a time.
+    Results are returned in the order of `coroutines`.
+    """
+    semaphore = asyncio.Semaphore(limit or Config().get_llm_max_concurrency())
+
+    async def bounded(coroutine):
+        async with semaphore:
+            return await coroutine
+
+    return await asyncio.gather(
+        *(bounded(coroutine) for coroutine in coroutines),
+        return_exceptions=return_exceptions
+    )
+
+
+def run_concurrently(coroutines, limit: int = None, return_exceptions: bool = False) -> list:
+    """
+    Run `coroutines` with bounded concurrency from synchronous code, e.g. an agent.
+    """
+    return asyncio.run(gather_bounded(coroutines, limit, return_exceptions))
@@ -0,0 +1,76 @@
+import time
+
+from termcolor import colored
+
+from src.config import Config
+from src.logger import Logger
+
+from .llm import LLM, TIKTOKEN_ENC
+from .cache import ResponseCache
+from .aio import gather_bounded, run_concurrently
+from .scheduler import get_scheduler
+from .replay import record_response
+from .metrics import LLMMetrics
+from .messages import to_text
+
+logger = Logger()
+
+
+class AsyncLLM:
+    """
+    asyncio counterpart of `LLM`, built on each provider's async client. It shares
+    the model list, router, scheduler, token accounting and response cache of
+    `LLM`, so independent calls can be overlapped with `gather_bounded` or, from
+    synchronous code, `run_concurrently`:
+
+        llm = AsyncLLM(model_id, agent="Formatter")
+        results = run_concurrently(llm.inference(prompt, project) for prompt in prompts)
+    """
+
+    def __init__(self, model_id: str = None, agent: str = None):
+        self.llm = LLM(model_id=model_id, agent=agent)
+        self.model_id = model_id
+        self.agent = agent
+        self.log_prompts = Config().get_logging_prompts()
+
+    def list_models(self) -> dict:
+        return self.llm.list_models()
+
+    async def inference(self, prompt: str | list, project_name: str) -> str:
+        if not ResponseCache.is_enabled(self.agent):
+            return (await self._inference(prompt, project_name))[0]
+
+        cache = ResponseCache()
+        response = cache.get(self.llm.get_cache_key(self.model_id, prompt))
+        if response is not None:
+            print(colored(f"Cached response from {self.model_id} for {self.agent}", "light_blue"))
+            return response
+
+        response, model_id = await self._inference(prompt, project_name)
+        cache.put(self.llm.get_cache_key(model_id, prompt), model_id, response, agent=self.agent)
+        return response
+
+    async def _inference(self, prompt: str | list, project_name: str) -> tuple:
+        print(colored(f"Prompting {self.model_id} model (async): \n====\n...{to_text(prompt).split('<root>')[0][-2000:]}\n====\n", "light_green"))
+        start = time.monotonic()
+        prompt_tokens = len(TIKTOKEN_ENC.encode(to_text(prompt)))
+        response, model_id = await self.llm.route_async(
+            lambda model, model_id: model.async_inference(model_id, prompt), prompt_tokens
+        )
+        wall_time = time.monotonic() - start
+        record_response(model_id, prompt, response, wall_time)
+        response = response.strip()
+        print(colored(f"Model response ({model_id}): \n====\n{response}\n====\n", "light_blue"))
+
+        if self.log_prompts:
+            logger.debug(f"Response ({model_id}): --> {response}")
+
+        self.llm.update_global_token_usage(prompt, project_name, "prompt", model_id, prompt_tokens)
+        response_tokens = self.llm.update_global_token_usage(response, project_name, "response", model_id)
+        get_scheduler().consume(self.llm.model_id_to_enum_mapping()[model_id], response_tokens)
+        LLMMetrics().record(project_name, self.agent, model_id, prompt_tokens, response_tokens, wall_time)
+
+        return response, model_id
+
+
+__all__ = ["AsyncLLM", "gather_bounded", "run_concurrently"]
@@ -0,0 +1,130 @@
+import hashlib
+import json
+import threading
+import time
+from typing import Optional
+
+from sqlalchemy import func
+from sqlmodel import Field, Session, SQLModel
+
+from src.config import Config
+from src.database import get_engine
+
+
+class LLMCacheModel(SQLModel, table=True):
+    """
+    Responses keyed by a hash of the model, the rendered prompt and the sampling
+    parameters. `created_at` decides when an entry expires, `last_used` orders
+    entries for LRU eviction.
+    """
+    __tablename__ = "llm_cache"
+
+    key: str = Field(primary_key=True)
+    model: str
+    agent: Optional[str] = None
+    response: str
+    size: int
+    hits: int = 0
+    created_at: float = Field(default_factory=time.time)
+    last_used: float = Field(default_factory=time.time, index=True)
+
+
+_counters = {"hits": 0, "misses": 0, "expired": 0}
+_counters_lock = threading.Lock()
+
+
+def _count(name: str):
+    with _counters_lock:
+        _counters[name] += 1
+
+
+class ResponseCache:
+    """
+    Opt-in cache of LLM responses, enabled per agent through `[LLM] CACHE_AGENTS`.
+    Only deterministic agents should be listed: a cached agent always gets the
+    same answer for the same prompt. Entries expire after `[LLM] CACHE_TTL`
+    seconds, or never if it is 0.
+    """
+
+    def __init__(self):
+        config = Config()
+        self.engine = get_engine(config.get_sqlite_db())
+        self.max_entries = config.get_llm_cache_max_entries()
+        self.max_size = config.get_llm_cache_max_size_mb() * 1024 * 1024
+        self.ttl = config.get_llm_cache_ttl()
+
+    @staticmethod
+    def is_enabled(agent: str) -> bool:
+        agents = Config().get_llm_cache_agents()
+        return "*" in agents or agent in agents
+
+    @staticmethod
+    def make_key(model_id: str, prompt: str | list, params: dict = None) -> str:
+        payload = json.dumps([model_id, prompt, params or {}], sort_keys=True)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        with Session(self.engine) as session:
+            entry = session.get(LLMCacheModel, key)
+            if entry is None:
+                _count("misses")
+                return None
+
+            if self.ttl > 0 and time.time() - entry.created_at > self.ttl:
+                session.delete(entry)
+                session.commit()
+                _count("expired")
+                _count("misses")
+                return None
+
+            entry.hits += 1
+            entry.last_used = time.time()
+            response = entry.response
+            session.commit()
+
+        _count("hits")
+        return response
+
+    def put(self, key: str, model_id: str, response: str, agent: str = None):
+        with Session(self.engine) as session:
+            session.merge(LLMCacheModel(
+                key=key,
+                model=model_id,
+                agent=agent,
+                response=response,
+                size=len(response.encode())
+            ))
+            session.commit()
+            self._evict(session)
+
+    def _evict(self, session: Session):
+        count, size = session.query(
+            func.count(LLMCacheModel.key), func.coalesce(func.sum(LLMCacheModel.size), 0)
+        ).one()
+        if count <= self.max_entries and size <= self.max_size:
+            return
+
+        evicted = []
+        entries = session.query(LLMCacheModel.key, LLMCacheModel.size).order_by(LLMCacheModel.last_used)
+        for key, entry_size in entries:
+            if count <= self.max_entries and size <= self.max_size:
+                break
+            evicted.append(key)
+            count -= 1
+            size -= entry_size
+
+        session.query(LLMCacheModel).filter(LLMCacheModel.key.in_(evicted)).delete()
+        session.commit()
+
+    def clear(self):
+        with Session(self.engine) as session:
+            session.query(LLMCacheModel).delete()
+            session.commit()
+
+    def stats(self) -> dict:
+        with Session(self.engine) as session:
+            count, size = session.query(
+                func.count(LLMCacheModel.key), func.coalesce(func.sum(LLMCacheModel.size), 0)
+            ).one()
+        with _counters_lock:
+            return {**_counters, "entries": count, "size": size}
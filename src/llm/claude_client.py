@@ -1,25 +1,80 @@
-from anthropic import Anthropic
+import weakref
+
+from anthropic import Anthropic, AsyncAnthropic
 
 from src.config import Config
+from .aio import loop_local
+from .messages import split_system
 
 class Claude:
+    SAMPLING_PARAMS = {"max_tokens": 4096}
+
     def __init__(self):
         config = Config()
         api_key = config.get_claude_api_key()
         self.client = Anthropic(
             api_key=api_key,
         )
+        self.api_key = api_key
+        self.async_clients = weakref.WeakKeyDictionary()
+
+    @staticmethod
+    def _messages(prompt) -> dict:
+        # The template instructions go in the system parameter.
+        system, messages = split_system(prompt)
+        if isinstance(prompt, str):
+            return {"messages": messages}
 
-    def inference(self, model_id: str, prompt: str) -> str:
+        # A chat prompt is only appended to between turns, so it is marked for
+        # prompt caching: the instructions, which never change, and the whole
+        # prompt, which is the prefix of the next turn. Anthropic looks up the
+        # cache at content block boundaries, so turns of the same role are
+        # merged as separate blocks: this request's breakpoint is still a block
+        # boundary in the next one. Prefixes shorter than the model's minimum
+        # are simply not cached.
+        cache_control = {"type": "ephemeral"}
+        messages = []
+        for message in prompt:
+            if message["role"] == "system":
+                continue
+            block = {"type": "text", "text": message["content"].strip()}
+            if messages and messages[-1]["role"] == message["role"]:
+                messages[-1]["content"].append(block)
+            else:
+                messages.append({"role": message["role"], "content": [block]})
+        if messages:
+            messages[-1]["content"][-1]["cache_control"] = cache_control
+        if system is None:
+            return {"messages": messages}
+        return {
+            "system": [{"type": "text", "text": system, "cache_control": cache_control}],
+            "messages": messages,
+        }
+
+    def inference(self, model_id: str, prompt: str | list) -> str:
         message = self.client.messages.create(
-            max_tokens=4096,
-            messages=[
-                {
-                    "role": "user",
-                    "content": prompt.strip(),
-                }
-            ],
             model=model_id,
+            **self.SAMPLING_PARAMS,
+            **self._messages(prompt),
+        )
+
+        return message.content[0].text
+
+    def stream(self, model_id: str, prompt: str | list):
+        with self.client.messages.stream(
+            model=model_id,
+            **self.SAMPLING_PARAMS,
+            **self._messages(prompt),
+        ) as stream:
+            for text in stream.text_stream:
+                yield text
+
+    async def async_inference(self, model_id: str, prompt: str | list) -> str:
+        client = loop_local(self.async_clients, lambda: AsyncAnthropic(api_key=self.api_key))
+        message = await client.messages.create(
+            model=model_id,
+            **self.SAMPLING_PARAMS,
+            **self._messages(prompt),
         )
 
         return message.content[0].text
@@ -0,0 +1,64 @@
+import threading
+
+from src.config import Config
+
+from .ollama_client import Ollama
+from .claude_client import Claude
+from .openai_client import OpenAi
+from .gemini_client import Gemini
+from .mistral_client import MistralAi
+from .groq_client import Groq
+from .replay import Replay
+
+"""
+Process-wide registry of provider clients. Each client is created the first time
+its provider is used and then shared by every `LLM`, so its HTTP connection pool
+is reused across prompts. A client is rebuilt when the credential it was created
+with changes, e.g. after the keys are updated through `/api/settings`.
+"""
+
+PROVIDERS = {
+    "OLLAMA": (Ollama, Config.get_ollama_api_endpoint),
+    "CLAUDE": (Claude, Config.get_claude_api_key),
+    "OPENAI": (OpenAi, Config.get_openai_api_key),
+    "GOOGLE": (Gemini, Config.get_gemini_api_key),
+    "MISTRAL": (MistralAi, Config.get_mistral_api_key),
+    "GROQ": (Groq, Config.get_groq_api_key),
+    "REPLAY": (Replay, Config.get_replay_cassette),
+}
+
+_clients = {}  # provider -> (credential, client)
+_lock = threading.Lock()
+
+
+def get_client(provider: str):
+    if provider not in PROVIDERS:
+        raise ValueError(f"Model {provider} not supported")
+
+    client_class, get_credential = PROVIDERS[provider]
+    credential = get_credential(Config())
+
+    cached = _clients.get(provider)
+    if cached is not None and cached[0] == credential:
+        return cached[1]
+
+    with _lock:
+        cached = _clients.get(provider)
+        if cached is None or cached[0] != credential:
+            cached = (credential, client_class())
+            _clients[provider] = cached
+        return cached[1]
+
+
+def get_sampling_params(provider: str) -> dict:
+    """
+    Parameters besides the model and the prompt that the provider's client
+    sends with every request, e.g. `max_tokens` for Claude.
+    """
+    client_class, _ = PROVIDERS.get(provider, (None, None))
+    return dict(getattr(client_class, "SAMPLING_PARAMS", {}))
+
+
+def reset_clients():
+    with _lock:
+        _clients.clear()
@@ -0,0 +1,80 @@
+from src.memory.conversation import count_tokens, elide
+
+"""
+Preflight fitting of prompts into a model's context window. A prompt template
+is rendered with some of its variables marked as trimmable sections; if the
+prompt would not fit, those sections are shortened, lowest priority first,
+instead of sending a request the provider is going to reject.
+"""
+
+# Tokens left for the elision markers added while trimming a section.
+_MARGIN = 32
+
+
+class ContextWindowExceededError(Exception):
+    def __init__(self, model_id: str, prompt_tokens: int, max_tokens: int):
+        self.model_id = model_id
+        self.prompt_tokens = prompt_tokens
+        self.max_tokens = max_tokens
+        super().__init__(
+            f"Prompt of {prompt_tokens} tokens does not fit into the {max_tokens} prompt tokens of {model_id}"
+        )
+
+
+def _empty(value):
+    return type(value)() if isinstance(value, (dict, list)) else ""
+
+
+def _size(value) -> int:
+    if isinstance(value, dict):
+        return sum(count_tokens(f"{key}\n{item}") for key, item in value.items())
+    if isinstance(value, list):
+        return sum(count_tokens(str(item)) for item in value)
+    return count_tokens(str(value))
+
+
+def _shrink(value, max_tokens: int):
+    """
+    Shorten `value` to about `max_tokens`. The first entries of dicts and lists
+    are kept whole and the rest are elided or dropped, so that they should be
+    ordered by relevance.
+    """
+    if isinstance(value, (dict, list)):
+        items = value.items() if isinstance(value, dict) else enumerate(value)
+        shrunk = []
+        left = max_tokens
+        for key, item in items:
+            if left <= _MARGIN:
+                break
+            tokens = _size({key: item}) if isinstance(value, dict) else _size(item)
+            if tokens > left:
+                item = elide(str(item), left - _MARGIN)
+            shrunk.append((key, item))
+            left -= min(tokens, left)
+        return dict(shrunk) if isinstance(value, dict) else [item for _, item in shrunk]
+
+    if max_tokens <= _MARGIN:
+        return "[omitted, it does not fit into the model's context window]"
+    return elide(str(value), max_tokens - _MARGIN)
+
+
+def fit_prompt(render, sections: dict, max_tokens: int) -> str:
+    """
+    Render `render(**sections)` so that it fits into `max_tokens`, trimming the
+    sections in the order given, i.e. the lowest priority one first. Tokens are
+    counted once for each section and once for the rest of the template.
+    """
+    sizes = {name: _size(value) for name, value in sections.items()}
+    fixed = count_tokens(render(**{name: _empty(value) for name, value in sections.items()}))
+    overflow = fixed + sum(sizes.values()) - max_tokens
+    if overflow <= 0:
+        return render(**sections)
+
+    trimmed = dict(sections)
+    for name, value in sections.items():
+        if overflow <= 0:
+            break
+        keep = max(0, sizes[name] - overflow)
+        trimmed[name] = _shrink(value, keep)
+        overflow -= sizes[name] - keep
+    return render(**trimmed)
@@ -1,14 +1,52 @@
+import weakref
+
 import google.generativeai as genai
 
 from src.config import Config
+from .aio import loop_local
+from .messages import split_system
 
 class Gemini:
     def __init__(self):
         config = Config()
         api_key = config.get_gemini_api_key()
         genai.configure(api_key=api_key)
+        self.models = {}
+        self.async_models = weakref.WeakKeyDictionary()
+
+    def inference(self, model_id: str, prompt: str | list) -> str:
+        system, contents = self._contents(prompt)
+        response = self._get_model(self.models, model_id, system).generate_content(contents)
+        return response.text
 
-    def inference(self, model_id: str, prompt: str) -> str:
-        model = genai.GenerativeModel(model_id)
-        response = model.generate_content(prompt)
+    def stream(self, model_id: str, prompt: str | list):
+        system, contents = self._contents(prompt)
+        response = self._get_model(self.models, model_id, system).generate_content(contents, stream=True)
+        for chunk in response:
+            if chunk.parts:
+                yield chunk.text
+
+    async def async_inference(self, model_id: str, prompt: str | list) -> str:
+        system, contents = self._contents(prompt)
+        model = self._get_model(loop_local(self.async_models, dict), model_id, system)
+        response = await model.generate_content_async(contents)
         return response.text
+
+    @staticmethod
+    def _contents(prompt) -> tuple:
+        if isinstance(prompt, str):
+            return None, prompt
+        system, messages = split_system(prompt)
+        contents = [
+            {"role": "model" if message["role"] == "assistant" else "user", "parts": [message["content"]]}
+            for message in messages
+        ]
+        return system, contents
+
+    @staticmethod
+    def _get_model(models: dict, model_id: str, system: str = None):
+        # The system instructions are part of the model object in this SDK.
+        model = models.get((model_id, system))
+        if model is None:
+            model = models[(model_id, system)] = genai.GenerativeModel(model_id, system_instruction=system)
+        return model
@@ -1,6 +1,10 @@
-from groq import Groq as _Groq
+import weakref
+
+from groq import Groq as _Groq, AsyncGroq as _AsyncGroq
 
 from src.config import Config
+from .aio import loop_local
+from .messages import to_messages
 
 
 class Groq:
@@ -8,16 +12,31 @@ class Groq:
         config = Config()
         api_key = config.get_groq_api_key()
         self.client = _Groq(api_key=api_key)
+        self.api_key = api_key
+        self.async_clients = weakref.WeakKeyDictionary()
 
-    def inference(self, model_id: str, prompt: str) -> str:
+    def inference(self, model_id: str, prompt: str | list) -> str:
         chat_completion = self.client.chat.completions.create(
-            messages=[
-                {
-                    "role": "user",
-                    "content": prompt.strip(),
-                }
-            ],
+            messages=to_messages(prompt),
+            model=model_id,
+        )
+
+        return chat_completion.choices[0].message.content
+
+    def stream(self, model_id: str, prompt: str | list):
+        chunks = self.client.chat.completions.create(
+            messages=to_messages(prompt),
             model=model_id,
+            stream=True,
         )
+        for chunk in chunks:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
 
+    async def async_inference(self, model_id: str, prompt: str | list) -> str:
+        client = loop_local(self.async_clients, lambda: _AsyncGroq(api_key=self.api_key))
+        chat_completion = await client.chat.completions.create(
+            messages=to_messages(prompt),
+            model=model_id,
+        )
         return chat_completion.choices[0].message.content
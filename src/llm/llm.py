@@ -1,31 +1,37 @@
+import asyncio
+import time
+from itertools import chain
+
 import tiktoken
 from typing import List, Tuple
 from termcolor import colored
 
 from src.socket_instance import emit_agent
-from .ollama_client import Ollama
-from .claude_client import Claude
-from .openai_client import OpenAi
-from .gemini_client import Gemini
-from .mistral_client import MistralAi
-from .groq_client import Groq
+from .client_pool import get_client, get_sampling_params
+from .cache import ResponseCache
+from .router import get_router
+from .scheduler import get_scheduler
+from .replay import is_replaying, record_response
+from .metrics import LLMMetrics
+from .context_window import ContextWindowExceededError
+from .messages import to_text
 
-from src.state import AgentState
+from src.token_usage import TokenUsage
 
 from src.config import Config
 from src.logger import Logger
 
 TIKTOKEN_ENC = tiktoken.get_encoding("cl100k_base")
 
-ollama = Ollama()
 logger = Logger()
-agentState = AgentState()
 
 
 class LLM:
-    def __init__(self, model_id: str = None):
+    def __init__(self, model_id: str = None, agent: str = None):
         self.model_id = model_id
+        self.agent = agent
         self.log_prompts = Config().get_logging_prompts()
+        self.token_usage = TokenUsage()
         self.models = {
             "CLAUDE": [
                 ("Claude 3 Opus", "claude-3-opus-20240229"),
@@ -53,56 +59,277 @@ class LLM:
             ],
             "OLLAMA": []
         }
-        if ollama.client:
-            self.models["OLLAMA"] = [(model["name"].split(":")[0], model["name"]) for model in
-                                     ollama.models]
+        # Context window of each model in tokens, prompt and response together.
+        # Other models, e.g. Ollama ones, get `[CONTEXT] DEFAULT_CONTEXT_WINDOW`.
+        self.context_windows = {
+            "claude-3-opus-20240229": 200000,
+            "claude-3-sonnet-20240229": 200000,
+            "claude-3-haiku-20240307": 200000,
+            "gpt-4-0125-preview": 128000,
+            "gpt-3.5-turbo-0125": 16385,
+            "gemini-pro": 32760,
+            "open-mistral-7b": 32000,
+            "open-mixtral-8x7b": 32000,
+            "mistral-medium-latest": 32000,
+            "mistral-small-latest": 32000,
+            "mistral-large-latest": 32000,
+            "mixtral-8x7b-32768": 32768,
+            "llama2-70b-4096": 4096,
+            "gemma-7b-it": 8192,
+        }
+        self._model_enum_mapping = None
+        self.refresh_ollama_models()
+
+    def refresh_ollama_models(self, wait: bool = False):
+        """
+        Pick up the cached list of Ollama models. Without `wait` this never blocks:
+        a stale list is refreshed in the background and shows up on a later call.
+        """
+        models = get_client("OLLAMA").get_models(wait=wait)
+        ollama_models = [(model["name"].split(":")[0], model["name"]) for model in models]
+        if ollama_models != self.models["OLLAMA"]:
+            self.models["OLLAMA"] = ollama_models
+            self._model_enum_mapping = None
 
     def list_models(self) -> dict:
+        self.refresh_ollama_models()
         return self.models
 
     def model_id_to_enum_mapping(self) -> dict:
-        mapping = {}
-        for enum_name, models in self.models.items():
-            for model_name, model_id in models:
-                mapping[model_id] = enum_name
-        return mapping
-
-    @staticmethod
-    def update_global_token_usage(string: str, project_name: str):
-        token_usage = len(TIKTOKEN_ENC.encode(string))
-        agentState.update_token_usage(project_name, token_usage)
-
-        total = agentState.get_latest_token_usage(project_name) + token_usage
+        if self._model_enum_mapping is None:
+            mapping = {}
+            for enum_name, models in self.models.items():
+                for model_name, model_id in models:
+                    mapping[model_id] = enum_name
+            if is_replaying():
+                # Every model, including ones that are not available here, is served from the cassette.
+                mapping = {model_id: "REPLAY" for model_id in [*mapping, self.model_id] if model_id}
+            self._model_enum_mapping = mapping
+        return self._model_enum_mapping
+
+    def get_context_window(self, model_id: str = None) -> int:
+        model_id = model_id or self.model_id
+        config = Config()
+        window = config.get_context_window(model_id) or self.context_windows.get(model_id)
+        return int(window or config.get_context_default_window())
+
+    def get_prompt_budget(self, model_id: str = None) -> int:
+        """
+        The most prompt tokens `model_id` accepts, leaving `[CONTEXT] RESPONSE_TOKENS`
+        of its context window for the response.
+        """
+        return self.get_context_window(model_id) - Config().get_context_response_tokens()
+
+    def check_context_window(self, prompt_tokens: int, model_id: str = None):
+        budget = self.get_prompt_budget(model_id)
+        if prompt_tokens > budget:
+            raise ContextWindowExceededError(model_id or self.model_id, prompt_tokens, budget)
+
+    def update_global_token_usage(
+        self,
+        string: str,
+        project_name: str,
+        direction: str,
+        model_id: str = None,
+        tokens: int = None
+    ):
+        token_usage = len(TIKTOKEN_ENC.encode(string)) if tokens is None else tokens
+        self.token_usage.record(project_name, token_usage, direction, agent=self.agent, model=model_id or self.model_id)
+
+        total = self.token_usage.get_total(project_name)
         emit_agent("tokens", {"token_usage": total})
+        return token_usage
 
-    def inference(self, prompt: str, project_name: str) -> str:
-        self.update_global_token_usage(prompt, project_name)
+    def get_provider(self) -> str:
+        if self.model_id not in self.model_id_to_enum_mapping():
+            # Possibly an Ollama model that is not in the cached list yet.
+            self.refresh_ollama_models(wait=True)
 
         model_enum = self.model_id_to_enum_mapping().get(self.model_id)
         # print(f"Model: {self.model_id}, Enum: {model_enum}")
         if model_enum is None:
             raise ValueError(f"Model {self.model_id} not supported")
+        return model_enum
 
-        model_mapping = {
-            "OLLAMA": ollama,
-            "CLAUDE": Claude(),
-            "OPENAI": OpenAi(),
-            "GOOGLE": Gemini(),
-            "MISTRAL": MistralAi(),
-            "GROQ": Groq()
-        }
+    def get_model_client(self):
+        return get_client(self.get_provider())
+
+    def get_candidates(self) -> list:
+        """
+        The selected model followed by its configured fallbacks.
+        """
+        self.get_provider()
+        mapping = self.model_id_to_enum_mapping()
+        fallbacks = Config().get_router_fallbacks(self.model_id)
+        return [self.model_id] + [model_id for model_id in fallbacks if model_id in mapping]
+
+    def route(self, call, tokens: int = 0):
+        """
+        Run `call(client, model_id)` through the router, which retries, falls back
+        to other models and hedges slow requests. Every attempt first waits for
+        the scheduler to admit `tokens` prompt tokens. Models whose context window
+        is too small for them are skipped, and if that is every model, nothing is
+        sent. Returns `(result, model_id)`.
+        """
+        mapping = self.model_id_to_enum_mapping()
+        scheduler = get_scheduler()
+
+        def attempt(model_id):
+            scheduler.acquire(mapping[model_id], tokens, self.agent)
+            return call(get_client(mapping[model_id]), model_id)
+
+        return get_router().route(self.get_fitting_candidates(tokens), attempt, provider_of=mapping.get)
+
+    async def route_async(self, call, tokens: int = 0):
+        """
+        `route` for a coroutine function `call(client, model_id)`, with the same
+        retries, fallbacks, circuit breakers and context window checks. Waiting
+        for the scheduler happens on a thread, so other calls keep running.
+        """
+        mapping = self.model_id_to_enum_mapping()
+        scheduler = get_scheduler()
+
+        async def attempt(model_id):
+            await asyncio.to_thread(scheduler.acquire, mapping[model_id], tokens, self.agent)
+            return await call(get_client(mapping[model_id]), model_id)
+
+        return await get_router().route_async(self.get_fitting_candidates(tokens), attempt, provider_of=mapping.get)
 
+    def get_fitting_candidates(self, tokens: int) -> list:
+        """
+        The candidates whose context window fits `tokens` prompt tokens. Raises
+        `ContextWindowExceededError` if there are none.
+        """
+        candidates = [model_id for model_id in self.get_candidates() if tokens <= self.get_prompt_budget(model_id)]
+        if not candidates:
+            self.check_context_window(tokens)
+        return candidates
+
+    def stream_inference(self, prompt: str | list, project_name: str):
+        """
+        Yield the response as it is generated. Partial output is forwarded to the UI
+        on `inference-chunk`, coalesced into at most one message per
+        `STREAM_FLUSH_INTERVAL` seconds or `STREAM_FLUSH_CHARS` characters. The
+        generator returns the id of the model that answered.
+        """
+        config = Config()
+        flush_interval = config.get_llm_stream_flush_interval()
+        flush_chars = config.get_llm_stream_flush_chars()
+
+        print(colored(f"Streaming {self.model_id} model: \n====\n...{to_text(prompt).split('<root>')[0][-2000:]}\n====\n", "light_green"))
+
+        def start_stream(model, model_id):
+            # Wait for the first chunk so that failures are routed like any other request.
+            chunks = iter(model.stream(model_id, prompt))
+            return next(chunks, ""), chunks
+
+        start = time.monotonic()
+        prompt_tokens = len(TIKTOKEN_ENC.encode(to_text(prompt)))
+        (first_chunk, chunks), model_id = self.route(start_stream, prompt_tokens)
+        ttft = time.monotonic() - start
+        self.update_global_token_usage(prompt, project_name, "prompt", model_id, prompt_tokens)
+        prompt_total = self.token_usage.get_total(project_name)
+
+        response_tokens = 0
+        buffer = []
+        buffered_chars = 0
+        last_flush = time.monotonic()
+
+        def flush(done=False):
+            emit_agent("inference-chunk", {
+                "project_name": project_name,
+                "agent": self.agent,
+                "text": "".join(buffer),
+                "done": done,
+            }, False)
+            emit_agent("tokens", {"token_usage": prompt_total + response_tokens}, False)
+            buffer.clear()
+
+        response = []
         try:
-            model = model_mapping[model_enum]
-            print(colored(f"Prompting {self.model_id} model: \n====\n...{prompt.split('<root>')[0][-2000:]}\n====\n", "light_green"))
-            response = model.inference(self.model_id, prompt).strip()
-            print(colored(f"Model response: \n====\n{response}\n====\n", "light_blue"))
-        except KeyError:
-            raise ValueError(f"Model {model_enum} not supported")
+            for text in chain([first_chunk], chunks):
+                if not text:
+                    continue
+                response.append(text)
+                response_tokens += len(TIKTOKEN_ENC.encode(text))
+                buffer.append(text)
+                buffered_chars += len(text)
+
+                now = time.monotonic()
+                if buffered_chars >= flush_chars or now - last_flush >= flush_interval:
+                    flush()
+                    buffered_chars = 0
+                    last_flush = now
+                yield text
+        finally:
+            flush(done=True)
+            self.token_usage.record(project_name, response_tokens, "response", agent=self.agent, model=model_id)
+            get_scheduler().consume(self.model_id_to_enum_mapping()[model_id], response_tokens)
 
+        response = "".join(response)
+        wall_time = time.monotonic() - start
+        record_response(model_id, prompt, response, wall_time)
+        LLMMetrics().record(project_name, self.agent, model_id, prompt_tokens, response_tokens, wall_time, ttft)
+        print(colored(f"Model response: \n====\n{response}\n====\n", "light_blue"))
         if self.log_prompts:
-            logger.debug(f"Response ({model}): --> {response}")
+            logger.debug(f"Response ({model_id}): --> {response}")
+        return model_id
 
-        self.update_global_token_usage(response, project_name)
+    def get_cache_key(self, model_id: str, prompt: str | list) -> str:
+        """
+        Key of the response of `model_id` to `prompt` in the `ResponseCache`,
+        with the sampling parameters its provider's client sends.
+        """
+        provider = self.model_id_to_enum_mapping().get(model_id)
+        return ResponseCache.make_key(model_id, prompt, get_sampling_params(provider))
 
+    def inference(self, prompt: str | list, project_name: str) -> str:
+        """
+        `prompt` is a string or a list of chat messages, see `src/llm/messages.py`.
+        """
+        if not ResponseCache.is_enabled(self.agent):
+            return self._inference(prompt, project_name)[0]
+
+        cache = ResponseCache()
+        response = cache.get(self.get_cache_key(self.model_id, prompt))
+        if response is not None:
+            print(colored(f"Cached response from {self.model_id} for {self.agent}", "light_blue"))
+            return response
+
+        response, model_id = self._inference(prompt, project_name)
+        # Stored under the model that answered, so the response of a fallback
+        # model is never served for the selected one.
+        cache.put(self.get_cache_key(model_id, prompt), model_id, response, agent=self.agent)
         return response
+
+    def _inference(self, prompt: str | list, project_name: str) -> tuple:
+        """
+        Returns `(response, model_id)` of the model that answered.
+        """
+        if Config().get_llm_stream():
+            chunks = self.stream_inference(prompt, project_name)
+            response = []
+            while True:
+                try:
+                    response.append(next(chunks))
+                except StopIteration as stop:
+                    return "".join(response).strip(), stop.value
+
+        print(colored(f"Prompting {self.model_id} model: \n====\n...{to_text(prompt).split('<root>')[0][-2000:]}\n====\n", "light_green"))
+        start = time.monotonic()
+        prompt_tokens = len(TIKTOKEN_ENC.encode(to_text(prompt)))
+        response, model_id = self.route(lambda model, model_id: model.inference(model_id, prompt), prompt_tokens)
+        wall_time = time.monotonic() - start
+        record_response(model_id, prompt, response, wall_time)
+        response = response.strip()
+        print(colored(f"Model response ({model_id}): \n====\n{response}\n====\n", "light_blue"))
+
+        if self.log_prompts:
+            logger.debug(f"Response ({model_id}): --> {response}")
+
+        self.update_global_token_usage(prompt, project_name, "prompt", model_id, prompt_tokens)
+        response_tokens = self.update_global_token_usage(response, project_name, "response", model_id)
+        get_scheduler().consume(self.model_id_to_enum_mapping()[model_id], response_tokens)
+        LLMMetrics().record(project_name, self.agent, model_id, prompt_tokens, response_tokens, wall_time)
+
+        return response, model_id
@@ -0,0 +1,49 @@
+"""
+A prompt is either a string, sent as a single user message, or a list of chat
+messages: `{"role": "system" | "user" | "assistant", "content": str}`.
+
+With a list, a leading system message holds the instructions of the prompt
+template, which are the same on every turn. The turns after it come from
+`ConversationContext.build_messages`, which replaces older turns by their
+digests in fixed blocks: between block boundaries the conversation is only
+appended to, and at a boundary the digests of earlier blocks stay the same. That keeps most
+of the request stable, so providers that cache prompt prefixes, and Ollama,
+which keeps the KV cache of a loaded model, mostly process the new turns.
+"""
+
+
+def to_messages(prompt) -> list:
+    """
+    The prompt as chat messages, with consecutive messages of the same role
+    merged, since some providers require user and assistant turns to alternate.
+    """
+    if isinstance(prompt, str):
+        return [{"role": "user", "content": prompt.strip()}]
+
+    messages = []
+    for message in prompt:
+        content = message["content"].strip()
+        if messages and messages[-1]["role"] == message["role"]:
+            messages[-1]["content"] += f"\n\n{content}"
+        else:
+            messages.append({"role": message["role"], "content": content})
+    return messages
+
+
+def split_system(prompt) -> tuple:
+    """
+    `(system, messages)`: the system instructions, or None, and the turns after them.
+    """
+    messages = to_messages(prompt)
+    if messages and messages[0]["role"] == "system":
+        return messages[0]["content"], messages[1:]
+    return None, messages
+
+
+def to_text(prompt) -> str:
+    """
+    The prompt as a single string, for counting tokens and logging.
+    """
+    if isinstance(prompt, str):
+        return prompt
+    return "\n\n".join(f"{message['role']}: {message['content']}" for message in prompt)
@@ -0,0 +1,261 @@
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import func
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.dialects.sqlite import insert
+from sqlmodel import Field, Index, Session, SQLModel
+
+from src.config import Config
+from src.database import get_engine
+
+
+class LLMMetricModel(SQLModel, table=True):
+    """
+    Timing of every model call: one row per call, written after the response
+    is complete. `ttft` (time to first token) is only known for streamed calls.
+    """
+    __tablename__ = "llm_metrics"
+    __table_args__ = (
+        Index("ix_llm_metrics_agent_model", "agent", "model"),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    project: Optional[str] = None
+    agent: Optional[str] = None
+    model: str
+    prompt_tokens: int
+    completion_tokens: int
+    wall_time: float
+    ttft: Optional[float] = None
+    tokens_per_second: float
+    timestamp: str = Field(default_factory=lambda: datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+
+
+class LLMMetricTotalModel(SQLModel, table=True):
+    """
+    Sums of the `llm_metrics` rows of each agent and model that have been
+    rolled up to keep that table small.
+    """
+    __tablename__ = "llm_metrics_totals"
+
+    agent: str = Field(primary_key=True)
+    model: str = Field(primary_key=True)
+    requests: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    wall_time: float = 0.0
+    streamed_requests: int = 0
+    ttft: float = 0.0
+    tokens_per_second: float = 0.0  # Sum over the requests, for the average.
+
+
+_SUMMARY_KEYS = [
+    "requests", "prompt_tokens", "completion_tokens", "wall_time", "streamed_requests", "ttft", "tokens_per_second"
+]
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(**labels) -> str:
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+class LLMMetrics:
+    def __init__(self):
+        config = Config()
+        self.engine = get_engine(config.get_sqlite_db())
+        self.max_rows = config.get_llm_metrics_max_rows()
+
+    def record(
+        self,
+        project: str,
+        agent: str,
+        model: str,
+        prompt_tokens: int,
+        completion_tokens: int,
+        wall_time: float,
+        ttft: float = None
+    ):
+        # Generation speed, i.e. after the first token when it is known.
+        generation_time = wall_time - (ttft or 0)
+        tokens_per_second = completion_tokens / generation_time if generation_time > 0 else 0.0
+
+        with Session(self.engine) as session:
+            row = LLMMetricModel(
+                project=project,
+                agent=agent,
+                model=model,
+                prompt_tokens=prompt_tokens,
+                completion_tokens=completion_tokens,
+                wall_time=wall_time,
+                ttft=ttft,
+                tokens_per_second=tokens_per_second
+            )
+            session.add(row)
+            session.commit()
+
+            if self.max_rows > 0:
+                oldest = session.query(func.min(LLMMetricModel.id)).scalar()
+                if row.id - oldest >= self.max_rows:
+                    try:
+                        self.roll_up(session, row.id - self.max_rows // 2)
+                    except OperationalError:
+                        # Another call rolled up the same rows first.
+                        session.rollback()
+
+    def _aggregate(self, session: Session, *conditions) -> list:
+        return session.query(
+            func.coalesce(LLMMetricModel.agent, "unknown"),
+            LLMMetricModel.model,
+            func.count(LLMMetricModel.id),
+            func.coalesce(func.sum(LLMMetricModel.prompt_tokens), 0),
+            func.coalesce(func.sum(LLMMetricModel.completion_tokens), 0),
+            func.coalesce(func.sum(LLMMetricModel.wall_time), 0.0),
+            func.count(LLMMetricModel.ttft),
+            func.coalesce(func.sum(LLMMetricModel.ttft), 0.0),
+            func.coalesce(func.sum(LLMMetricModel.tokens_per_second), 0.0),
+        ).filter(*conditions).group_by(
+            func.coalesce(LLMMetricModel.agent, "unknown"), LLMMetricModel.model
+        ).all()
+
+    def roll_up(self, session: Session, up_to_id: int):
+        """
+        Add the rows up to `up_to_id` to the totals and delete them.
+        """
+        for agent, model, *sums in self._aggregate(session, LLMMetricModel.id <= up_to_id):
+            values = dict(zip(_SUMMARY_KEYS, sums))
+            session.execute(
+                insert(LLMMetricTotalModel).values(agent=agent, model=model, **values).on_conflict_do_update(
+                    index_elements=["agent", "model"],
+                    set_={key: getattr(LLMMetricTotalModel, key) + value for key, value in values.items()}
+                )
+            )
+        session.query(LLMMetricModel).filter(LLMMetricModel.id <= up_to_id).delete()
+        session.commit()
+
+    def get_summary(self) -> list:
+        with Session(self.engine) as session:
+            totals = {
+                (total.agent, total.model): {key: getattr(total, key) for key in _SUMMARY_KEYS}
+                for total in session.query(LLMMetricTotalModel).all()
+            }
+            for agent, model, *sums in self._aggregate(session):
+                summary = totals.setdefault((agent, model), dict.fromkeys(_SUMMARY_KEYS, 0))
+                for key, value in zip(_SUMMARY_KEYS, sums):
+                    summary[key] += value
+
+        return [
+            {
+                "agent": agent,
+                "model": model,
+                **summary,
+                "tokens_per_second": summary["tokens_per_second"] / summary["requests"] if summary["requests"] else 0.0,
+            }
+            for (agent, model), summary in sorted(totals.items())
+        ]
+
+
+def render_prometheus(
+    summary: list,
+    scheduler_stats: dict = None,
+    cache_stats: dict = None,
+    search_cache_stats: dict = None,
+    speculative_stats: dict = None,
+    template_stats: dict = None
+) -> str:
+    """
+    Format the per agent and model summary, and optionally the scheduler,
+    response cache, search cache, speculative sampling and prompt template
+    statistics, in the Prometheus text exposition format.
+    """
+    metrics = [
+        ("devika_llm_requests_total", "counter", "Model calls.", "requests"),
+        ("devika_llm_prompt_tokens_total", "counter", "Prompt tokens sent.", "prompt_tokens"),
+        ("devika_llm_completion_tokens_total", "counter", "Completion tokens received.", "completion_tokens"),
+        ("devika_llm_wall_seconds_total", "counter", "Total wall time of model calls.", "wall_time"),
+        ("devika_llm_streamed_requests_total", "counter", "Streamed model calls.", "streamed_requests"),
+        ("devika_llm_ttft_seconds_total", "counter", "Total time to first token of streamed calls.", "ttft"),
+        ("devika_llm_tokens_per_second", "gauge", "Average completion tokens per second.", "tokens_per_second"),
+    ]
+
+    lines = []
+    for name, kind, description, key in metrics:
+        lines += [f"# HELP {name} {description}", f"# TYPE {name} {kind}"]
+        for row in summary:
+            lines.append(f"{name}{_labels(agent=row['agent'], model=row['model'])} {row[key]}")
+
+    if scheduler_stats is not None:
+        lines += [
+            "# HELP devika_scheduler_queue_depth Model calls waiting for their provider's rate limits.",
+            "# TYPE devika_scheduler_queue_depth gauge",
+        ]
+        for provider, stats in scheduler_stats.items():
+            lines.append(f"devika_scheduler_queue_depth{_labels(provider=provider)} {stats['queue_depth']}")
+        lines += [
+            "# HELP devika_scheduler_wait_seconds_max Longest wait for a provider's rate limits.",
+            "# TYPE devika_scheduler_wait_seconds_max gauge",
+        ]
+        for provider, stats in scheduler_stats.items():
+            for priority, priority_stats in stats["by_priority"].items():
+                labels = _labels(provider=provider, priority=priority)
+                lines.append(f"devika_scheduler_wait_seconds_max{labels} {priority_stats['max_wait']}")
+
+    if cache_stats is not None:
+        lines += [
+            "# HELP devika_llm_cache_requests_total Response cache lookups.",
+            "# TYPE devika_llm_cache_requests_total counter",
+            f"devika_llm_cache_requests_total{_labels(result='hit')} {cache_stats['hits']}",
+            f"devika_llm_cache_requests_total{_labels(result='miss')} {cache_stats['misses']}",
+            "# HELP devika_llm_cache_entries Responses in the cache.",
+            "# TYPE devika_llm_cache_entries gauge",
+            f"devika_llm_cache_entries {cache_stats['entries']}",
+        ]
+
+    if search_cache_stats is not None:
+        lines += [
+            "# HELP devika_search_cache_requests_total Search cache lookups.",
+            "# TYPE devika_search_cache_requests_total counter",
+            f"devika_search_cache_requests_total{_labels(result='hit')} {search_cache_stats['hits']}",
+            f"devika_search_cache_requests_total{_labels(result='miss')} {search_cache_stats['misses']}",
+            "# HELP devika_search_cache_expired_total Lookups that found an expired entry.",
+            "# TYPE devika_search_cache_expired_total counter",
+            f"devika_search_cache_expired_total {search_cache_stats['expired']}",
+            "# HELP devika_search_cache_entries Search results in the cache.",
+            "# TYPE devika_search_cache_entries gauge",
+            f"devika_search_cache_entries {search_cache_stats['entries']}",
+        ]
+
+    if speculative_stats is not None:
+        speculative_metrics = [
+            ("devika_speculative_requests_total", "Requests sent to several candidates.", "requests"),
+            ("devika_speculative_candidates_total", "Candidate requests sent.", "candidates"),
+            ("devika_speculative_extra_tokens_total", "Tokens spent on candidates that were not used.", "extra_tokens"),
+            ("devika_speculative_latency_saved_seconds_total", "Estimated latency saved by speculation.", "latency_saved"),
+        ]
+        for name, description, key in speculative_metrics:
+            lines += [f"# HELP {name} {description}", f"# TYPE {name} counter"]
+            for agent, stats in speculative_stats.items():
+                lines.append(f"{name}{_labels(agent=agent)} {stats[key]}")
+        lines += [
+            "# HELP devika_speculative_wins_total Requests by the candidate whose response was used.",
+            "# TYPE devika_speculative_wins_total counter",
+        ]
+        for agent, stats in speculative_stats.items():
+            for winner, key in [("primary", "primary_wins"), ("other", "other_wins"), ("none", "no_valid_response")]:
+                lines.append(f"devika_speculative_wins_total{_labels(agent=agent, winner=winner)} {stats[key]}")
+
+    if template_stats is not None:
+        template_metrics = [
+            ("devika_template_renders_total", "counter", "Prompt template renders.", "renders"),
+            ("devika_template_render_seconds_total", "counter", "Total time spent rendering prompt templates.", "total_time"),
+            ("devika_template_render_seconds_max", "gauge", "Slowest render of a prompt template.", "max_time"),
+        ]
+        for name, kind, description, key in template_metrics:
+            lines += [f"# HELP {name} {description}", f"# TYPE {name} {kind}"]
+            for template, stats in template_stats.items():
+                lines.append(f"{name}{_labels(template=template)} {stats[key]}")
+
+    return "\n".join(lines) + "\n"
@@ -1,7 +1,12 @@
+import weakref
+
 from mistralai.client import MistralClient
+from mistralai.async_client import MistralAsyncClient
 from mistralai.models.chat_completion import ChatMessage
 
 from src.config import Config
+from .aio import loop_local
+from .messages import to_messages
 
 
 class MistralAi:
@@ -9,13 +14,29 @@ class MistralAi:
         config = Config()
         api_key = config.get_mistral_api_key()
         self.client = MistralClient(api_key=api_key)
+        self.api_key = api_key
+        self.async_clients = weakref.WeakKeyDictionary()
 
-    def inference(self, model_id: str, prompt: str) -> str:
-        print("prompt", prompt.strip())
+    def inference(self, model_id: str, prompt: str | list) -> str:
         chat_completion = self.client.chat(
             model=model_id,
-            messages=[
-                ChatMessage(role="user", content=prompt.strip())
-            ]
+            messages=[ChatMessage(**message) for message in to_messages(prompt)]
+        )
+        return chat_completion.choices[0].message.content
+
+    def stream(self, model_id: str, prompt: str | list):
+        chunks = self.client.chat_stream(
+            model=model_id,
+            messages=[ChatMessage(**message) for message in to_messages(prompt)]
+        )
+        for chunk in chunks:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+    async def async_inference(self, model_id: str, prompt: str | list) -> str:
+        client = loop_local(self.async_clients, lambda: MistralAsyncClient(api_key=self.api_key))
+        chat_completion = await client.chat(
+            model=model_id,
+            messages=[ChatMessage(**message) for message in to_messages(prompt)]
         )
         return chat_completion.choices[0].message.content
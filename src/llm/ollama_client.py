@@ -1,24 +1,103 @@
+import threading
+import time
+import weakref
+
 import ollama
 from src.logger import Logger
 from src.config import Config
+from .aio import loop_local
+from .messages import to_messages
 
 log = Logger()
 
 
 class Ollama:
+    """
+    The list of local models is fetched lazily and cached for `MODELS_TTL`
+    seconds. A stale list is refreshed in a background thread while callers keep
+    getting the cached one, so neither startup nor `/api/data` waits on Ollama.
+
+    Requests go through the chat endpoint with `KEEP_ALIVE`, so the model stays
+    loaded and Ollama can reuse the KV cache of the prompt prefix shared with the
+    previous request instead of processing the whole conversation again.
+    """
+
     def __init__(self):
+        config = Config()
+        endpoint = config.get_ollama_api_endpoint()
+        self.client = ollama.Client(endpoint, timeout=config.get_ollama_timeout())
+        self.discovery_client = ollama.Client(endpoint, timeout=config.get_ollama_discovery_timeout())
+        self.async_clients = weakref.WeakKeyDictionary()
+        self.keep_alive = config.get_ollama_keep_alive()
+
+        self.models = []
+        self.available = None
+        self.models_ttl = config.get_ollama_models_ttl()
+        self.fetched_at = None
+        self.refresh_thread = None
+        self.lock = threading.Lock()
+
+    def refresh_models(self):
         try:
-            self.client = ollama.Client(Config().get_ollama_api_endpoint())
-            self.models = self.client.list()["models"]
-            log.info("Ollama available")
-        except:
-            self.client = None
-            log.warning("Ollama not available")
-            log.warning("run ollama server to use ollama models otherwise use other models")
-
-    def inference(self, model_id: str, prompt: str) -> str:
-        response = self.client.generate(
+            models = self.discovery_client.list()["models"]
+            available = True
+        except Exception:
+            models = []
+            available = False
+
+        if available != self.available:
+            if available:
+                log.info("Ollama available")
+            else:
+                log.warning("Ollama not available")
+                log.warning("run ollama server to use ollama models otherwise use other models")
+
+        self.models = models
+        self.available = available
+        self.fetched_at = time.monotonic()
+
+    def get_models(self, wait: bool = False) -> list:
+        """
+        Return the cached models, starting a background refresh if they are stale.
+        With `wait`, a stale list is refreshed before returning.
+        """
+        with self.lock:
+            stale = self.fetched_at is None or time.monotonic() - self.fetched_at >= self.models_ttl
+            if stale and (self.refresh_thread is None or not self.refresh_thread.is_alive()):
+                self.refresh_thread = threading.Thread(target=self.refresh_models, daemon=True)
+                self.refresh_thread.start()
+            refresh_thread = self.refresh_thread
+
+        if stale and wait:
+            refresh_thread.join()
+        return self.models
+
+    def inference(self, model_id: str, prompt: str | list) -> str:
+        response = self.client.chat(
+            model=model_id,
+            messages=to_messages(prompt),
+            keep_alive=self.keep_alive
+        )
+        return response['message']['content']
+
+    def stream(self, model_id: str, prompt: str | list):
+        chunks = self.client.chat(
+            model=model_id,
+            messages=to_messages(prompt),
+            keep_alive=self.keep_alive,
+            stream=True
+        )
+        for chunk in chunks:
+            if chunk['message']['content']:
+                yield chunk['message']['content']
+
+    async def async_inference(self, model_id: str, prompt: str | list) -> str:
+        client = loop_local(self.async_clients, lambda: ollama.AsyncClient(
+            Config().get_ollama_api_endpoint(), timeout=Config().get_ollama_timeout()
+        ))
+        response = await client.chat(
             model=model_id,
-            prompt=prompt.strip()
+            messages=to_messages(prompt),
+            keep_alive=self.keep_alive
         )
-        return response['response']
+        return response['message']['content']
@@ -1,6 +1,10 @@
-from openai import OpenAI
+import weakref
+
+from openai import OpenAI, AsyncOpenAI
 
 from src.config import Config
+from .aio import loop_local
+from .messages import to_messages
 
 
 class OpenAi:
@@ -8,15 +12,30 @@ class OpenAi:
         config = Config()
         api_key = config.get_openai_api_key()
         self.client = OpenAI(api_key=api_key)
+        self.api_key = api_key
+        self.async_clients = weakref.WeakKeyDictionary()
 
-    def inference(self, model_id: str, prompt: str) -> str:
+    def inference(self, model_id: str, prompt: str | list) -> str:
         chat_completion = self.client.chat.completions.create(
-            messages=[
-                {
-                    "role": "user",
-                    "content": prompt.strip(),
-                }
-            ],
+            messages=to_messages(prompt),
+            model=model_id,
+        )
+        return chat_completion.choices[0].message.content
+
+    def stream(self, model_id: str, prompt: str | list):
+        chunks = self.client.chat.completions.create(
+            messages=to_messages(prompt),
+            model=model_id,
+            stream=True,
+        )
+        for chunk in chunks:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+    async def async_inference(self, model_id: str, prompt: str | list) -> str:
+        client = loop_local(self.async_clients, lambda: AsyncOpenAI(api_key=self.api_key))
+        chat_completion = await client.chat.completions.create(
+            messages=to_messages(prompt),
             model=model_id,
         )
         return chat_completion.choices[0].message.content
@@ -0,0 +1,107 @@
+import asyncio
+import json
+import os
+import threading
+import time
+
+from src.config import Config
+
+from .cache import ResponseCache
+
+"""
+Record/replay of model calls. With `[REPLAY] MODE = "record"`, every response
+is appended to a JSON Lines cassette together with how long it took. With
+`MODE = "replay"`, every model is served by the `Replay` provider from that
+cassette, so the agents can be run, profiled and load-tested without network
+access or API keys.
+"""
+
+_cassettes = {}
+_cassettes_lock = threading.Lock()
+
+
+class ReplayMissError(Exception):
+    pass
+
+
+class Cassette:
+    def __init__(self, path: str):
+        self.path = path
+        self.entries = {}
+        self.lock = threading.Lock()
+
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self.entries[entry["key"]] = entry
+
+    def get(self, model_id: str, prompt: str | list):
+        return self.entries.get(ResponseCache.make_key(model_id, prompt))
+
+    def record(self, model_id: str, prompt: str | list, response: str, latency: float):
+        entry = {
+            "key": ResponseCache.make_key(model_id, prompt),
+            "model": model_id,
+            "response": response,
+            "latency": round(latency, 3),
+        }
+        with self.lock:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "a") as f:
+                f.write(json.dumps(entry) + "\n")
+            self.entries[entry["key"]] = entry
+
+
+def get_cassette(path: str = None) -> Cassette:
+    path = path or Config().get_replay_cassette()
+    with _cassettes_lock:
+        if path not in _cassettes:
+            _cassettes[path] = Cassette(path)
+        return _cassettes[path]
+
+
+def is_replaying() -> bool:
+    return Config().get_replay_mode() == "replay"
+
+
+def record_response(model_id: str, prompt: str | list, response: str, latency: float):
+    if Config().get_replay_mode() == "record":
+        get_cassette().record(model_id, prompt, response, latency)
+
+
+class Replay:
+    STREAM_CHUNKS = 20
+
+    def __init__(self):
+        self.cassette = get_cassette()
+        self.simulate_latency = Config().get_replay_simulate_latency()
+
+    def _lookup(self, model_id: str, prompt: str | list) -> dict:
+        entry = self.cassette.get(model_id, prompt)
+        if entry is None:
+            raise ReplayMissError(f"No recorded response for {model_id} in {self.cassette.path}")
+        return entry
+
+    def inference(self, model_id: str, prompt: str | list) -> str:
+        entry = self._lookup(model_id, prompt)
+        if self.simulate_latency:
+            time.sleep(entry["latency"])
+        return entry["response"]
+
+    def stream(self, model_id: str, prompt: str | list):
+        entry = self._lookup(model_id, prompt)
+        response = entry["response"]
+        size = max(1, len(response) // self.STREAM_CHUNKS + 1)
+        chunks = [response[i:i + size] for i in range(0, len(response), size)]
+        for chunk in chunks:
+            if self.simulate_latency:
+                time.sleep(entry["latency"] / len(chunks))
+            yield chunk
+
+    async def async_inference(self, model_id: str, prompt: str | list) -> str:
+        entry = self._lookup(model_id, prompt)
+        if self.simulate_latency:
+            await asyncio.sleep(entry["latency"])
+        return entry["response"]
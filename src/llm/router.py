@@ -0,0 +1,362 @@
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
+
+from src.config import Config
+from src.logger import Logger
+
+logger = Logger()
+
+RETRIABLE_STATUS_CODES = {408, 409, 425, 429}
+
+
+class AllModelsFailedError(Exception):
+    def __init__(self, errors: list):
+        self.errors = errors
+        details = "; ".join(f"{model_id}: {error}" for model_id, error in errors)
+        super().__init__(f"All models failed: {details}")
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+def get_status_code(error: Exception):
+    status = getattr(error, "status_code", None) or getattr(error, "status", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def is_retriable(error: Exception) -> bool:
+    """
+    Rate limits, server errors, timeouts and dropped connections are worth
+    retrying; anything else (bad request, invalid key, ...) is not.
+    """
+    status = get_status_code(error)
+    if status is not None:
+        return status in RETRIABLE_STATUS_CODES or status >= 500
+
+    name = type(error).__name__.lower()
+    return isinstance(error, (TimeoutError, ConnectionError)) or "timeout" in name or "connection" in name
+
+
+def get_retry_after(error: Exception):
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class CircuitBreaker:
+    """
+    Stops sending requests to a provider after `failure_threshold` consecutive
+    retriable failures. After `reset_timeout` seconds requests are let through
+    again; the first failure re-opens the circuit, the first success closes it.
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self.lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self.lock:
+            if self.opened_at is None:
+                return "closed"
+            if self.clock() - self.opened_at >= self.reset_timeout:
+                return "half-open"
+            return "open"
+
+    def allow(self) -> bool:
+        return self.state != "open"
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                self.opened_at = self.clock()
+
+
+class LatencyTracker:
+    def __init__(self, window: int, min_samples: int):
+        self.min_samples = min_samples
+        self.samples = deque(maxlen=window)
+        self.lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self.lock:
+            self.samples.append(seconds)
+
+    def p95(self):
+        with self.lock:
+            if len(self.samples) < self.min_samples:
+                return None
+            ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+
+class Router:
+    """
+    Sends a request to the first healthy model of an ordered list of candidates:
+
+    - retriable errors are retried on the same model with exponential backoff;
+    - a model that keeps failing is replaced by the next candidate;
+    - providers whose circuit breaker is open are skipped;
+    - with hedging enabled, a request that takes longer than the model's p95
+      latency is duplicated to the next candidate and the first answer wins.
+
+    `call(model_id)` performs the actual request, so the routing decisions do
+    not depend on any provider SDK.
+    """
+
+    def __init__(
+        self,
+        max_retries: int = None,
+        backoff_base: float = None,
+        backoff_max: float = None,
+        failure_threshold: int = None,
+        reset_timeout: float = None,
+        hedge: bool = None,
+        hedge_min_samples: int = None,
+        latency_window: int = None,
+        sleep=time.sleep,
+        clock=time.monotonic
+    ):
+        config = Config()
+        self.max_retries = config.get_router_max_retries() if max_retries is None else max_retries
+        self.backoff_base = config.get_router_backoff_base() if backoff_base is None else backoff_base
+        self.backoff_max = config.get_router_backoff_max() if backoff_max is None else backoff_max
+        self.failure_threshold = config.get_router_failure_threshold() if failure_threshold is None else failure_threshold
+        self.reset_timeout = config.get_router_reset_timeout() if reset_timeout is None else reset_timeout
+        self.hedge = config.get_router_hedge() if hedge is None else hedge
+        self.hedge_min_samples = config.get_router_hedge_min_samples() if hedge_min_samples is None else hedge_min_samples
+        self.latency_window = config.get_router_latency_window() if latency_window is None else latency_window
+        self.sleep = sleep
+        self.clock = clock
+
+        self.breakers = {}
+        self.latencies = {}
+        self.lock = threading.Lock()
+
+    def get_breaker(self, provider: str) -> CircuitBreaker:
+        with self.lock:
+            if provider not in self.breakers:
+                self.breakers[provider] = CircuitBreaker(self.failure_threshold, self.reset_timeout, self.clock)
+            return self.breakers[provider]
+
+    def get_latency(self, model_id: str) -> LatencyTracker:
+        with self.lock:
+            if model_id not in self.latencies:
+                self.latencies[model_id] = LatencyTracker(self.latency_window, self.hedge_min_samples)
+            return self.latencies[model_id]
+
+    def backoff(self, attempt: int, error: Exception) -> float:
+        retry_after = get_retry_after(error)
+        if retry_after is not None:
+            return min(self.backoff_max, retry_after)
+        delay = min(self.backoff_max, self.backoff_base * 2 ** attempt)
+        return delay * random.uniform(0.5, 1.0)
+
+    def attempt(self, model_id: str, call, provider: str):
+        """
+        Call one model, retrying retriable errors. Returns `(response, model_id)`.
+        """
+        breaker = self.get_breaker(provider)
+        for attempt in range(self.max_retries + 1):
+            if not breaker.allow():
+                raise CircuitOpenError(f"Circuit open for {provider}")
+
+            start = time.monotonic()
+            try:
+                response = call(model_id)
+            except Exception as e:
+                if not is_retriable(e):
+                    raise
+                breaker.record_failure()
+                if attempt == self.max_retries:
+                    raise
+                delay = self.backoff(attempt, e)
+                logger.warning(f"{model_id} failed ({e}), retrying in {delay:.1f}s")
+                self.sleep(delay)
+                continue
+
+            breaker.record_success()
+            self.get_latency(model_id).record(time.monotonic() - start)
+            return response, model_id
+
+    def hedged_attempt(self, model_id: str, hedge_model_id: str, call, provider_of, threshold: float):
+        executor = ThreadPoolExecutor(max_workers=2)
+        try:
+            primary = executor.submit(self.attempt, model_id, call, provider_of(model_id))
+            done, _ = wait([primary], timeout=threshold)
+            if done:
+                return primary.result()
+
+            logger.info(f"{model_id} slower than {threshold:.1f}s, hedging with {hedge_model_id}")
+            hedge = executor.submit(self.attempt, hedge_model_id, call, provider_of(hedge_model_id))
+            error = None
+            for future in as_completed([primary, hedge]):
+                try:
+                    return future.result()
+                except Exception as e:
+                    error = e
+            raise error
+        finally:
+            # The slower request cannot be cancelled; its result is discarded.
+            executor.shutdown(wait=False)
+
+    async def attempt_async(self, model_id: str, call, provider: str):
+        """
+        `attempt` for a coroutine function `call`, backing off without blocking
+        the event loop.
+        """
+        breaker = self.get_breaker(provider)
+        for attempt in range(self.max_retries + 1):
+            if not breaker.allow():
+                raise CircuitOpenError(f"Circuit open for {provider}")
+
+            start = time.monotonic()
+            try:
+                response = await call(model_id)
+            except Exception as e:
+                if not is_retriable(e):
+                    raise
+                breaker.record_failure()
+                if attempt == self.max_retries:
+                    raise
+                delay = self.backoff(attempt, e)
+                logger.warning(f"{model_id} failed ({e}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                continue
+
+            breaker.record_success()
+            self.get_latency(model_id).record(time.monotonic() - start)
+            return response, model_id
+
+    async def hedged_attempt_async(self, model_id: str, hedge_model_id: str, call, provider_of, threshold: float):
+        primary = asyncio.ensure_future(self.attempt_async(model_id, call, provider_of(model_id)))
+        tasks = [primary]
+        try:
+            done, _ = await asyncio.wait([primary], timeout=threshold)
+            if done:
+                return primary.result()
+
+            logger.info(f"{model_id} slower than {threshold:.1f}s, hedging with {hedge_model_id}")
+            tasks.append(asyncio.ensure_future(self.attempt_async(hedge_model_id, call, provider_of(hedge_model_id))))
+            error = None
+            for future in asyncio.as_completed(tasks):
+                try:
+                    return await future
+                except Exception as e:
+                    error = e
+            raise error
+        finally:
+            # Unlike threads, the slower request can be cancelled.
+            for task in tasks:
+                task.cancel()
+
+    def _next_candidate(self, remaining: list, errors: list, provider_of):
+        """
+        Pop the next candidate whose circuit is not open from `remaining`, and
+        the one to hedge it with, if any. Returns `(model_id, hedge_model_id,
+        threshold)`, or None when no candidate is left.
+        """
+        while remaining:
+            model_id = remaining.pop(0)
+            if not self.get_breaker(provider_of(model_id)).allow():
+                errors.append((model_id, CircuitOpenError(f"Circuit open for {provider_of(model_id)}")))
+                continue
+
+            hedge_model_id = None
+            threshold = self.get_latency(model_id).p95() if self.hedge else None
+            if threshold is not None:
+                hedge_model_id = next(
+                    (m for m in remaining if self.get_breaker(provider_of(m)).allow()), None
+                )
+                if hedge_model_id is not None:
+                    remaining.remove(hedge_model_id)
+            return model_id, hedge_model_id, threshold
+        return None
+
+    def route(self, candidates: list, call, provider_of=None):
+        """
+        Returns `(response, model_id)` of the first candidate that answered, or
+        raises `AllModelsFailedError` with the error of every candidate.
+        """
+        provider_of = provider_of or (lambda model_id: model_id)
+        remaining = list(dict.fromkeys(candidates))
+        errors = []
+
+        while (candidate := self._next_candidate(remaining, errors, provider_of)) is not None:
+            model_id, hedge_model_id, threshold = candidate
+            try:
+                if hedge_model_id is not None:
+                    return self.hedged_attempt(model_id, hedge_model_id, call, provider_of, threshold)
+                return self.attempt(model_id, call, provider_of(model_id))
+            except Exception as e:
+                errors.append((model_id, e))
+                if remaining:
+                    logger.warning(f"{model_id} failed ({e}), falling back to {remaining[0]}")
+
+        raise AllModelsFailedError(errors)
+
+    async def route_async(self, candidates: list, call, provider_of=None):
+        """
+        `route` for a coroutine function `call`, sharing the circuit breakers
+        and latencies of synchronous requests.
+        """
+        provider_of = provider_of or (lambda model_id: model_id)
+        remaining = list(dict.fromkeys(candidates))
+        errors = []
+
+        while (candidate := self._next_candidate(remaining, errors, provider_of)) is not None:
+            model_id, hedge_model_id, threshold = candidate
+            try:
+                if hedge_model_id is not None:
+                    return await self.hedged_attempt_async(model_id, hedge_model_id, call, provider_of, threshold)
+                return await self.attempt_async(model_id, call, provider_of(model_id))
+            except Exception as e:
+                errors.append((model_id, e))
+                if remaining:
+                    logger.warning(f"{model_id} failed ({e}), falling back to {remaining[0]}")
+
+        raise AllModelsFailedError(errors)
+
+    def stats(self) -> dict:
+        with self.lock:
+            breakers = dict(self.breakers)
+            latencies = dict(self.latencies)
+        return {
+            "breakers": {provider: breaker.state for provider, breaker in breakers.items()},
+            "p95_latency": {model_id: tracker.p95() for model_id, tracker in latencies.items()},
+        }
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_router() -> Router:
+    """
+    The process-wide router, so circuit breakers and latencies are shared by
+    every `LLM`.
+    """
+    global _router
+    with _router_lock:
+        if _router is None:
+            _router = Router()
+        return _router
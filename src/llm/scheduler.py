@@ -0,0 +1,184 @@
+import heapq
+import itertools
+import threading
+import time
+
+from src.config import Config
+
+INTERACTIVE = 0
+NORMAL = 1
+BACKGROUND = 2
+
+PRIORITY_NAMES = {INTERACTIVE: "interactive", NORMAL: "normal", BACKGROUND: "background"}
+
+
+class TokenBucket:
+    """
+    Allows `per_minute` units per minute, in bursts of up to a minute's worth.
+    The level may go negative when more is consumed than was reserved, which
+    delays the next requests.
+    """
+
+    def __init__(self, per_minute: float, clock=time.monotonic):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.level = per_minute
+        self.clock = clock
+        self.updated = clock()
+
+    def _refill(self):
+        now = self.clock()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, amount: float) -> float:
+        self._refill()
+        if self.level >= amount:
+            return 0
+        return (amount - self.level) / self.rate
+
+    def take(self, amount: float):
+        self._refill()
+        self.level -= amount
+
+
+class ProviderLimiter:
+    """
+    Requests-per-minute and tokens-per-minute limits of one provider key.
+    Waiting requests are served by priority, then in arrival order.
+    """
+
+    def __init__(self, rpm: float = None, tpm: float = None, clock=time.monotonic):
+        self.requests = TokenBucket(rpm, clock) if rpm else None
+        self.tokens = TokenBucket(tpm, clock) if tpm else None
+        self.clock = clock
+        self.condition = threading.Condition()
+        self.waiting = []
+        self.counter = itertools.count()
+        self.stats = {
+            name: {"requests": 0, "total_wait": 0.0, "max_wait": 0.0}
+            for name in PRIORITY_NAMES.values()
+        }
+
+    def _delay(self, tokens: int) -> float:
+        delays = [0]
+        if self.requests:
+            delays.append(self.requests.delay(1))
+        if self.tokens:
+            delays.append(self.tokens.delay(tokens))
+        return max(delays)
+
+    def acquire(self, tokens: int = 0, priority: int = NORMAL) -> float:
+        """
+        Block until the request fits within the limits. Returns the time waited.
+        """
+        if self.tokens:
+            tokens = min(tokens, self.tokens.capacity)
+        start = self.clock()
+        ticket = (priority, next(self.counter))
+
+        with self.condition:
+            heapq.heappush(self.waiting, ticket)
+            try:
+                while True:
+                    timeout = None
+                    if self.waiting[0] == ticket:
+                        timeout = self._delay(tokens)
+                        if timeout <= 0:
+                            break
+                    self.condition.wait(timeout)
+
+                if self.requests:
+                    self.requests.take(1)
+                if self.tokens:
+                    self.tokens.take(tokens)
+            finally:
+                self.waiting.remove(ticket)
+                heapq.heapify(self.waiting)
+                self.condition.notify_all()
+
+            waited = self.clock() - start
+            stats = self.stats[PRIORITY_NAMES[priority]]
+            stats["requests"] += 1
+            stats["total_wait"] += waited
+            stats["max_wait"] = max(stats["max_wait"], waited)
+        return waited
+
+    def consume(self, tokens: int):
+        """
+        Charge tokens that were not known when the request was admitted,
+        e.g. those of the response.
+        """
+        if self.tokens:
+            with self.condition:
+                self.tokens.take(tokens)
+
+    def get_stats(self) -> dict:
+        with self.condition:
+            by_priority = {}
+            for name, stats in self.stats.items():
+                average = stats["total_wait"] / stats["requests"] if stats["requests"] else 0.0
+                by_priority[name] = {
+                    "requests": stats["requests"],
+                    "average_wait": round(average, 3),
+                    "max_wait": round(stats["max_wait"], 3),
+                }
+            return {
+                "queue_depth": len(self.waiting),
+                "rpm": self.requests.capacity if self.requests else None,
+                "tpm": self.tokens.capacity if self.tokens else None,
+                "by_priority": by_priority,
+            }
+
+
+class Scheduler:
+    """
+    Coordinates every model call in the process, across projects, so that calls
+    sharing an API key stay within its rate limits instead of being rejected
+    and retried. Limits are set per provider in `[SCHEDULER.LIMITS]`;
+    providers without limits are not throttled.
+    """
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.limiters = {}
+        self.lock = threading.Lock()
+
+    def get_limiter(self, provider: str) -> ProviderLimiter:
+        with self.lock:
+            if provider not in self.limiters:
+                limits = Config().get_scheduler_limits(provider)
+                self.limiters[provider] = ProviderLimiter(limits.get("RPM"), limits.get("TPM"), self.clock)
+            return self.limiters[provider]
+
+    @staticmethod
+    def get_priority(agent: str) -> int:
+        config = Config()
+        if agent in config.get_scheduler_interactive_agents():
+            return INTERACTIVE
+        if agent in config.get_scheduler_background_agents():
+            return BACKGROUND
+        return NORMAL
+
+    def acquire(self, provider: str, tokens: int = 0, agent: str = None) -> float:
+        return self.get_limiter(provider).acquire(tokens, self.get_priority(agent))
+
+    def consume(self, provider: str, tokens: int):
+        self.get_limiter(provider).consume(tokens)
+
+    def stats(self) -> dict:
+        with self.lock:
+            limiters = dict(self.limiters)
+        return {provider: limiter.get_stats() for provider, limiter in limiters.items()}
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> Scheduler:
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = Scheduler()
+        return _scheduler
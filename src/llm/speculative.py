@@ -0,0 +1,141 @@
+import asyncio
+import threading
+import time
+
+from termcolor import colored
+
+from src.config import Config
+
+from .llm import TIKTOKEN_ENC
+from .async_llm import AsyncLLM
+from .messages import to_text
+
+"""
+Speculative sampling: for agents configured with `[SPECULATIVE.<Agent>]
+CANDIDATES` > 1, the prompt is sent to several candidates at once, possibly
+of different models, and the first response the agent accepts wins. The
+other requests are cancelled. This trades tokens for latency when a model
+often answers in the wrong format, so the cost is reported next to the
+latency saved.
+"""
+
+_stats = {}  # agent -> counters
+_stats_lock = threading.Lock()
+
+
+def get_speculative_stats() -> dict:
+    with _stats_lock:
+        return {agent: dict(stats) for agent, stats in _stats.items()}
+
+
+def _record(agent: str, candidates: int, winner: int, extra_tokens: int, latency_saved: float):
+    with _stats_lock:
+        stats = _stats.setdefault(agent, {
+            "requests": 0,
+            "candidates": 0,
+            "primary_wins": 0,
+            "other_wins": 0,
+            "no_valid_response": 0,
+            "extra_tokens": 0,
+            "latency_saved": 0.0,
+        })
+        stats["requests"] += 1
+        stats["candidates"] += candidates
+        if winner is None:
+            stats["no_valid_response"] += 1
+        elif winner == 0:
+            stats["primary_wins"] += 1
+        else:
+            stats["other_wins"] += 1
+        stats["extra_tokens"] += extra_tokens
+        stats["latency_saved"] += latency_saved
+
+
+class Speculative:
+    def __init__(self, llm):
+        settings = Config().get_speculative_settings(llm.agent)
+        self.llm = llm
+        self.candidates = int(settings.get("CANDIDATES", 1))
+        self.models = [llm.model_id] + list(settings.get("MODELS", []))
+        self.max_extra_tokens = settings.get("MAX_EXTRA_TOKENS")
+
+    @staticmethod
+    def is_enabled(agent: str) -> bool:
+        return int(Config().get_speculative_settings(agent).get("CANDIDATES", 1)) > 1
+
+    def get_candidate_models(self, prompt_tokens: int) -> list:
+        """
+        Models of the candidates, the agent's own model first, capped so that
+        the extra copies of the prompt stay within `MAX_EXTRA_TOKENS`.
+        """
+        candidates = self.candidates
+        if self.max_extra_tokens is not None:
+            candidates = min(candidates, 1 + int(self.max_extra_tokens) // max(1, prompt_tokens))
+        return [self.models[index % len(self.models)] for index in range(max(1, candidates))]
+
+    def run(self, prompt: str | list, project_name: str, accept) -> tuple:
+        """
+        Returns `(response, result)` of the first response for which `accept`
+        returns a result. If no candidate is accepted, the response of the
+        first candidate that answered, in candidate order, is returned with
+        `result` False for the caller to repair.
+        """
+        prompt_tokens = len(TIKTOKEN_ENC.encode(to_text(prompt)))
+        models = self.get_candidate_models(prompt_tokens)
+        if len(models) == 1:
+            response = self.llm.inference(prompt, project_name)
+            return response, accept(response)
+        return asyncio.run(self._race(models, prompt, prompt_tokens, project_name, accept))
+
+    async def _race(self, models: list, prompt: str | list, prompt_tokens: int, project_name: str, accept) -> tuple:
+        start = time.monotonic()
+        tasks = {
+            asyncio.create_task(AsyncLLM(model_id, self.llm.agent).inference(prompt, project_name)): index
+            for index, model_id in enumerate(models)
+        }
+        pending = set(tasks)
+        finished = {}  # index -> (elapsed, response or None if it failed)
+        errors = []
+        winner = None
+
+        try:
+            while pending and winner is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in sorted(done, key=tasks.get):
+                    index = tasks[task]
+                    elapsed = time.monotonic() - start
+                    if task.exception() is not None:
+                        errors.append(task.exception())
+                        finished[index] = (elapsed, None)
+                        continue
+                    response = task.result()
+                    finished[index] = (elapsed, response)
+                    result = accept(response)
+                    if result and winner is None:
+                        winner = (index, response, result)
+        finally:
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+        answered = sorted(index for index, (_, response) in finished.items() if response is not None)
+        if winner is None and not answered:
+            raise errors[0]
+        used = winner[0] if winner is not None else answered[0]
+
+        # Extra spend: the prompt of every candidate but the first, and the
+        # responses that were received but not used.
+        extra_tokens = prompt_tokens * (len(models) - 1) + sum(
+            len(TIKTOKEN_ENC.encode(finished[index][1])) for index in answered if index != used
+        )
+        # Without speculation, a rejected first response would have cost a
+        # round trip on top of the winner's, so at least that long was saved.
+        latency_saved = 0.0
+        if winner is not None and winner[0] != 0 and 0 in finished:
+            latency_saved = finished[0][0]
+        _record(self.llm.agent, len(models), winner[0] if winner else None, extra_tokens, latency_saved)
+
+        if winner is not None:
+            print(colored(f"{self.llm.agent}: candidate {winner[0] + 1} of {len(models)} ({models[winner[0]]}) accepted", "light_blue"))
+            return winner[1], winner[2]
+        return finished[used][1], False
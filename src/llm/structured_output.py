@@ -0,0 +1,228 @@
+import json
+import re
+import xml.etree.ElementTree as ET
+
+from termcolor import colored
+
+from src.config import Config
+from src.templates import get_template
+from src.token_usage import TokenUsage
+from src.utils import find_xml_structure, fix_bad_json, take_json_text_from_triple_quotes
+
+from .llm import TIKTOKEN_ENC
+from .speculative import Speculative
+from .messages import to_text
+
+
+JSON = "json"
+XML = "xml"
+CODE = "code"
+TEXT = "text"
+
+
+class StructuredOutputError(Exception):
+    def __init__(self, agent: str, attempts: int, error: str, response: str):
+        self.agent = agent
+        self.attempts = attempts
+        self.error = error
+        self.response = response
+        super().__init__(f"{agent}: no valid response after {attempts} attempts: {error}")
+
+
+def _extract_json(response: str) -> str:
+    response = response.strip().replace("```json", "```")
+    response = take_json_text_from_triple_quotes(response)
+    if response.startswith("```") and response.endswith("```"):
+        response = response[3:-3].strip()
+    return response
+
+
+def diagnose(response: str, output_format: str, required_tags: list = None) -> str:
+    """
+    Describe why `response` is not in `output_format`, as precisely as possible,
+    for the repair prompt.
+    """
+    if not response.strip():
+        return "The response is empty."
+
+    if output_format == JSON:
+        try:
+            json.loads(_extract_json(response))
+        except Exception as e:
+            return f"The response is not valid JSON: {e}."
+        return "The JSON does not have the required keys."
+
+    if output_format == XML:
+        xml = find_xml_structure(response)
+        if xml is None:
+            return "The response does not contain a <root>...</root> element."
+        try:
+            root = ET.fromstring(xml)
+        except ET.ParseError as e:
+            return f"The XML is not well-formed: {e}. Wrap text that contains <, > or & in <![CDATA[ ]]>."
+        missing = [tag for tag in required_tags or [] if root.find(tag) is None]
+        if missing:
+            return f"The XML is missing these tags: {', '.join(missing)}."
+        return "The XML tags do not have valid values."
+
+    if output_format == CODE:
+        if "~~~" not in response:
+            return "The files are not wrapped in ~~~."
+        if "File: `" not in response:
+            return "No file starts with a File: `path/to/file` line."
+        return "The files could not be read."
+
+    return "The response is not in the required format."
+
+
+def _repair_json(response: str) -> list:
+    text = _extract_json(response)
+    start = min([i for i in (text.find("{"), text.find("[")) if i >= 0], default=-1)
+    end = max(text.rfind("}"), text.rfind("]"))
+    if start < 0 or end < start:
+        return []
+    text = text[start:end + 1]
+
+    candidates = [text]
+    text = text.replace("“", "\"").replace("”", "\"").replace("’", "'")
+    text = re.sub(r",\s*([}\]])", r"\1", text)
+    candidates.append(text)
+    try:
+        candidates.append(fix_bad_json(text))
+    except Exception:
+        pass
+    return candidates
+
+
+def _repair_xml(response: str, required_tags: list = None) -> list:
+    text = response.strip()
+    if "<root>" not in text and re.search(r"<\w+>", text):
+        text = f"<root>\n{text}\n</root>"
+    elif "<root>" in text and "</root>" not in text:
+        text += "\n</root>"
+
+    candidates = [text]
+    text = re.sub(r"&(?!(amp|lt|gt|quot|apos|#\d+);)", "&amp;", text)
+    candidates.append(text)
+
+    for tag in required_tags or []:
+        text = re.sub(
+            rf"<{tag}>(?!\s*<!\[CDATA\[)(.*?)</{tag}>",
+            lambda match: f"<{tag}><![CDATA[{match.group(1)}]]></{tag}>",
+            text,
+            flags=re.DOTALL
+        )
+    candidates.append(text)
+    return candidates
+
+
+def _repair_code(response: str) -> list:
+    text = response.strip()
+    if "~~~" not in text and "File: `" in text:
+        return [f"~~~\n{text}\n~~~"]
+    if text.count("~~~") == 1:
+        return [f"{text}\n~~~"]
+    return []
+
+
+def local_repairs(response: str, output_format: str, required_tags: list = None) -> list:
+    """
+    Deterministic fixups of common formatting mistakes, tried before asking the
+    model again.
+    """
+    if output_format == JSON:
+        return _repair_json(response)
+    if output_format == XML:
+        return _repair_xml(response, required_tags)
+    if output_format == CODE:
+        return _repair_code(response)
+    return []
+
+
+class StructuredOutput:
+    """
+    Gets a response that `validate` accepts from `llm`, within a retry budget:
+
+    1. the prompt is sent once, or to several candidates at once when
+       speculative sampling is configured for the agent;
+    2. an invalid response first goes through local, deterministic repairs;
+    3. then the model is asked to fix its own response with a short repair
+       prompt that contains the parse error and the response, not the original
+       prompt (unless the response is empty, in which case the prompt is resent);
+    4. after `MAX_RETRIES` failed repairs, `StructuredOutputError` is raised.
+
+    Tokens of invalid responses and of repair prompts are also recorded in the
+    token ledger as "wasted" for the agent.
+    """
+
+    def __init__(
+        self,
+        llm,
+        output_format: str,
+        validate,
+        format_hint: str,
+        required_tags: list = None,
+        max_retries: int = None
+    ):
+        self.llm = llm
+        self.output_format = output_format
+        self.validate = validate
+        self.format_hint = format_hint
+        self.required_tags = required_tags
+        self.max_retries = Config().get_structured_output_max_retries() if max_retries is None else max_retries
+
+    def _validate(self, response: str):
+        try:
+            return self.validate(response)
+        except Exception:
+            return False
+
+    def _accept(self, response: str):
+        """
+        The validated response, possibly after local repairs, or False.
+        """
+        result = self._validate(response)
+        if result:
+            return result
+        for candidate in local_repairs(response, self.output_format, self.required_tags):
+            result = self._validate(candidate)
+            if result:
+                return result
+        return False
+
+    def _repair_prompt(self, response: str, error: str) -> str:
+        template = get_template("llm/repair_prompt.jinja2")
+        return template.render(error=error, format_hint=self.format_hint, response=response)
+
+    def _record_waste(self, project_name: str, text: str | list):
+        tokens = len(TIKTOKEN_ENC.encode(to_text(text)))
+        TokenUsage().record(project_name, tokens, "wasted", agent=self.llm.agent, model=self.llm.model_id)
+
+    def run(self, prompt: str | list, project_name: str, should_stop=None):
+        """
+        Returns the validated response, or None if `should_stop()` becomes true
+        between attempts (e.g. the agent was interrupted).
+        """
+        if Speculative.is_enabled(self.llm.agent):
+            response, result = Speculative(self.llm).run(prompt, project_name, self._accept)
+        else:
+            response = self.llm.inference(prompt, project_name)
+            result = self._accept(response)
+
+        for attempt in range(self.max_retries + 1):
+            if result:
+                return result
+
+            error = diagnose(response, self.output_format, self.required_tags)
+            self._record_waste(project_name, response)
+            print(colored(f"{self.llm.agent}: Invalid response from the model ({error})", "red"))
+
+            if attempt == self.max_retries:
+                raise StructuredOutputError(self.llm.agent, attempt + 1, error, response)
+            if should_stop is not None and should_stop():
+                return None
+
+            repair_prompt = self._repair_prompt(response, error) if response.strip() else prompt
+            self._record_waste(project_name, repair_prompt)
+            response = self.llm.inference(repair_prompt, project_name)
+            result = self._accept(response)
@@ -0,0 +1,190 @@
+import threading
+from collections import OrderedDict
+
+import tiktoken
+
+from src.config import Config
+from src.project import ProjectManager
+
+TIKTOKEN_ENC = tiktoken.get_encoding("cl100k_base")
+
+"""
+Messages never change once written, so their token counts and one-line digests
+are computed once per message and kept in a bounded LRU cache. The key includes
+the text because SQLite may reuse the ids of deleted messages.
+"""
+_CACHE_SIZE = 20000
+_message_cache = OrderedDict()  # (message id, text) -> (tokens, digest, digest tokens)
+_message_cache_lock = threading.Lock()
+
+
+def count_tokens(text: str) -> int:
+    return len(TIKTOKEN_ENC.encode(text))
+
+
+def elide(text: str, max_tokens: int) -> str:
+    """
+    Keep the head and the tail of `text` so that it fits in about `max_tokens`.
+    """
+    tokens = TIKTOKEN_ENC.encode(text)
+    if len(tokens) <= max_tokens:
+        return text
+
+    half = max(1, max_tokens // 2)
+    elided = len(tokens) - 2 * half
+    return (
+        f"{TIKTOKEN_ENC.decode(tokens[:half])}\n"
+        f"... [{elided} tokens elided] ...\n"
+        f"{TIKTOKEN_ENC.decode(tokens[-half:])}"
+    )
+
+
+class ConversationContext:
+    """
+    Builds the `conversation` list rendered into agent prompts so that it fits
+    into a token budget:
+
+    - the most recent messages are kept verbatim, except that messages longer
+      than `MAX_MESSAGE_TOKENS`, from any source, keep only their beginning and
+      end;
+    - older messages are replaced by their digests: the first line of each,
+      cut to `DIGEST_CHARS`. No model is asked to summarize them. The oldest
+      digests are dropped if even they do not fit.
+    """
+
+    def __init__(self, token_budget: int = None):
+        config = Config()
+        self.token_budget = token_budget
+        self.recent_messages = config.get_context_recent_messages()
+        self.max_message_tokens = config.get_context_max_message_tokens()
+        self.digest_chars = config.get_context_digest_chars()
+        self.project_manager = ProjectManager()
+
+    def get_token_budget(self, model_id: str = None) -> int:
+        if self.token_budget is not None:
+            return self.token_budget
+        return Config().get_context_token_budget(model_id)
+
+    def _describe(self, message: dict):
+        key = (message["id"], message["message"])
+        with _message_cache_lock:
+            cached = _message_cache.get(key)
+            if cached is not None:
+                _message_cache.move_to_end(key)
+                return cached
+
+        text = f"{message['source']}: {message['message']}"
+        first_line = message["message"].strip().split("\n", 1)[0]
+        if len(first_line) > self.digest_chars or "\n" in message["message"].strip():
+            first_line = first_line[:self.digest_chars].rstrip() + " ..."
+        digest = f"- {message['source']}: {first_line}"
+        described = (count_tokens(text), digest, count_tokens(digest))
+
+        with _message_cache_lock:
+            _message_cache[key] = described
+            if len(_message_cache) > _CACHE_SIZE:
+                _message_cache.popitem(last=False)
+        return described
+
+    def _format_recent(self, message: dict) -> tuple:
+        tokens, _, _ = self._describe(message)
+        text = f"{message['source']}: {message['message']}"
+        if tokens > self.max_message_tokens:
+            text = f"{message['source']}: {elide(message['message'], self.max_message_tokens)}"
+            tokens = self.max_message_tokens + 16
+        return text, tokens
+
+    def _select(self, project: str, model_id: str = None) -> tuple:
+        """
+        `(summary, recent)`: the digests of older messages under one header, or
+        None, and the recent messages as `(message, text)` pairs.
+        """
+        messages = self.project_manager.get_messages(project) or []
+        budget = self.get_token_budget(model_id)
+
+        recent = []
+        used = 0
+        older = messages
+        for index in range(len(messages) - 1, -1, -1):
+            text, tokens = self._format_recent(messages[index])
+            is_last = index == len(messages) - 1
+            if not is_last and (len(recent) >= self.recent_messages or used + tokens > budget):
+                older = messages[:index + 1]
+                break
+            recent.append((messages[index], text))
+            used += tokens
+        else:
+            older = []
+        recent.reverse()
+
+        if not older:
+            return None, recent
+
+        digests = []
+        for message in reversed(older):
+            _, digest, digest_tokens = self._describe(message)
+            if used + digest_tokens > budget:
+                break
+            digests.append(digest)
+            used += digest_tokens
+        digests.reverse()
+
+        omitted = len(older) - len(digests)
+        header = f"system: First lines of {len(older)} earlier messages"
+        if omitted:
+            header += f" ({omitted} oldest not shown)"
+        return "\n".join([header + ":"] + digests), recent
+
+    def _select_blocks(self, project: str, model_id: str = None) -> tuple:
+        """
+        `(summaries, recent)` like `_select`, but the digests of older messages
+        are grouped in blocks of `RECENT_MESSAGES`, and the recent messages start
+        at a block boundary. A block's digests never change once it is complete,
+        so until the next boundary the conversation is only appended to, and
+        after it only the first recent turns are replaced by their digests.
+        Falls back to `_select` if that does not fit into the budget.
+        """
+        messages = self.project_manager.get_messages(project) or []
+        budget = self.get_token_budget(model_id)
+        block = max(1, self.recent_messages)
+        # Between `block` and `2 * block - 1` recent messages.
+        start = max(0, (len(messages) - block) // block * block)
+
+        recent = []
+        used = 0
+        for message in messages[start:]:
+            text, tokens = self._format_recent(message)
+            recent.append((message, text))
+            used += tokens
+
+        summaries = []
+        for first in range(0, start, block):
+            header = f"system: First lines of messages {first + 1} to {first + block}:"
+            digests = [header]
+            used += count_tokens(header)
+            for message in messages[first:first + block]:
+                _, digest, digest_tokens = self._describe(message)
+                digests.append(digest)
+                used += digest_tokens
+            summaries.append("\n".join(digests))
+
+        if used > budget:
+            summary, recent = self._select(project, model_id)
+            return [summary] if summary else [], recent
+        return summaries, recent
+
+    def build(self, project: str, model_id: str = None) -> list:
+        summary, recent = self._select(project, model_id)
+        return ([summary] if summary else []) + [text for _, text in recent]
+
+    def build_messages(self, project: str, model_id: str = None) -> list:
+        """
+        The same conversation as chat messages, one user turn per message with
+        its source, like `build`. Devika's messages are context too, not
+        assistant turns: only their comment is stored, and replaying that as the
+        model's own answers would contradict the format it has to answer in.
+        Older turns are replaced by their digests in fixed blocks (see
+        `_select_blocks`), so that consecutive prompts share their prefix.
+        """
+        summaries, recent = self._select_blocks(project, model_id)
+        return [{"role": "user", "content": text} for text in summaries + [text for _, text in recent]]
@@ -1,7 +1,8 @@
 from typing import Optional
-from sqlmodel import Field, Session, SQLModel, create_engine
+from sqlmodel import Field, Session, SQLModel
 
 from src.config import Config
+from src.database import get_engine
 
 """
 TODO: The tag check should be a BM25 search, it's just a simple equality check now.
@@ -14,10 +15,8 @@ class Knowledge(SQLModel, table=True):
 
 class KnowledgeBase:
     def __init__(self):
-        config = Config()
-        sqlite_path = config.get_sqlite_db()
-        self.engine = create_engine(f"sqlite:///{sqlite_path}")
-        SQLModel.metadata.create_all(self.engine)
+        sqlite_path = Config().get_sqlite_db()
+        self.engine = get_engine(sqlite_path)
 
     def add_knowledge(self, tag: str, contents: str):
         knowledge = Knowledge(tag=tag, contents=contents)
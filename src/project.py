@@ -4,21 +4,50 @@ from typing import Type, TypeVar
 from typing import Literal
 
 import os
+import io
 import json
+import fnmatch
+import hashlib
+import tempfile
 import zipfile
 from datetime import datetime
 from typing import Optional
 from src.socket_instance import emit_agent
-from sqlmodel import Field, Session, SQLModel, create_engine
+from sqlmodel import Field, Index, Session, SQLModel
 from src.config import Config
+from src.database import get_engine
 
 
 class Projects(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     project: str
+    # Legacy storage of the conversation, kept empty since messages moved to `MessageModel`.
     message_stack_json: str
 
 
+class MessageModel(SQLModel, table=True):
+    __tablename__ = "messages"
+    __table_args__ = (
+        Index("ix_messages_project_id", "project", "id"),
+        Index("ix_messages_project_source", "project", "source", "id"),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    project: str
+    source: str
+    message: str
+    timestamp: str
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "source": self.source,
+            "from_devika": self.source == MessageSources.DEVIKA.value,
+            "message": self.message,
+            "timestamp": self.timestamp
+        }
+
+
 from enum import Enum
 from typing import Literal
 from dataclasses import dataclass
@@ -49,13 +78,91 @@ class Message:
         }
 
 
+_migrated_databases = set()
+
+ZIP_CHUNK_SIZE = 64 * 1024
+
+
+def _is_excluded(relative_path: str, name: str, patterns: list) -> bool:
+    return any(fnmatch.fnmatch(name, pattern) or fnmatch.fnmatch(relative_path, pattern) for pattern in patterns)
+
+
+def _write_atomically(path: str, mode: str, write):
+    """
+    Call `write(f)` on a temporary file of its own next to `path` and move it
+    into place, so that concurrent writers never mix their output.
+    """
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=f"{os.path.basename(path)}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, mode) as f:
+            write(f)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+
+
+class ZipStream(io.RawIOBase):
+    """
+    Write-only, non-seekable file object that buffers what `zipfile` writes
+    until it is taken out with `take`.
+    """
+
+    def __init__(self):
+        self.chunks = []
+        self.size = 0
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.size += len(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def buffered(self) -> int:
+        return self.size
+
+    def take(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks = []
+        self.size = 0
+        return data
+
+
+def migrate_message_stacks(engine):
+    """
+    Move conversations stored in `Projects.message_stack_json` into the `messages` table.
+    """
+    with Session(engine) as session:
+        for project_state in session.query(Projects).filter(Projects.message_stack_json != "[]").all():
+            for message in json.loads(project_state.message_stack_json):
+                session.add(MessageModel(
+                    project=project_state.project,
+                    source=message["source"],
+                    message=message["message"],
+                    timestamp=message["timestamp"]
+                ))
+            project_state.message_stack_json = json.dumps([])
+        session.commit()
+
+
 class ProjectManager:
     def __init__(self):
         config = Config()
         sqlite_path = config.get_sqlite_db()
         self.projects_root_dir = config.get_projects_dir()
-        self.engine = create_engine(f"sqlite:///{sqlite_path}")
-        SQLModel.metadata.create_all(self.engine)
+        self.engine = get_engine(sqlite_path)
+
+        if sqlite_path not in _migrated_databases:
+            migrate_message_stacks(self.engine)
+            _migrated_databases.add(sqlite_path)
 
     def new_message(self, source: T_MessageSources, message: str) -> Message:
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
@@ -75,10 +182,8 @@ class ProjectManager:
 
     def clear_conversation(self, project: str):
         with Session(self.engine) as session:
-            project_state = session.query(Projects).filter(Projects.project == project).first()
-            if project_state:
-                project_state.message_stack_json = json.dumps([])
-                session.commit()
+            session.query(MessageModel).filter(MessageModel.project == project).delete()
+            session.commit()
 
     def create_project(self, project: str):
         with Session(self.engine) as session:
@@ -88,80 +193,93 @@ class ProjectManager:
 
     def delete_project(self, project: str):
         with Session(self.engine) as session:
+            session.query(MessageModel).filter(MessageModel.project == project).delete()
             project_state = session.query(Projects).filter(Projects.project == project).first()
             if project_state:
                 session.delete(project_state)
-                session.commit()
+            session.commit()
 
     def delete_all_projects(self):
         with Session(self.engine) as session:
+            session.query(MessageModel).delete()
             session.query(Projects).delete()
             session.commit()
 
-    def add_message_to_project(self, project: str, message: Message):
+    def add_message_to_project(self, project: str, message: Message) -> dict:
         with Session(self.engine) as session:
-            project_state = session.query(Projects).filter(Projects.project == project).first()
-            if project_state:
-                message_stack = json.loads(project_state.message_stack_json)
-                message_stack.append(message.to_dict())
-                project_state.message_stack_json = json.dumps(message_stack)
-                session.commit()
-            else:
-                message_stack = [message.to_dict()]
-                project_state = Projects(project=project, message_stack_json=json.dumps(message_stack))
-                session.add(project_state)
-                session.commit()
+            if not session.query(Projects.id).filter(Projects.project == project).first():
+                session.add(Projects(project=project, message_stack_json=json.dumps([])))
+
+            message_row = MessageModel(
+                project=project,
+                source=message.source.value,
+                message=message.message,
+                timestamp=message.timestamp
+            )
+            session.add(message_row)
+            session.commit()
+            return message_row.to_dict()
 
     def add_message_from_devika(self, project: str, message: str):
         new_message = self.new_message(MessageSources.DEVIKA, message)
-        emit_agent("server-message", {"messages": new_message.to_dict()})
-        self.add_message_to_project(project, new_message)
+        emit_agent("server-message", {"messages": self.add_message_to_project(project, new_message)})
 
     def add_message_from_user(self, project: str, message: str):
         new_message = self.new_message(MessageSources.USER, message)
-        emit_agent("server-message", {"messages": new_message.to_dict()})
-        self.add_message_to_project(project, new_message)
+        emit_agent("server-message", {"messages": self.add_message_to_project(project, new_message)})
 
     def add_system_message(self, project: str, message: str):
         new_message = self.new_message(MessageSources.SYSTEM, message)
-        emit_agent("server-message", {"messages": new_message.to_dict()})
-        self.add_message_to_project(project, new_message)
+        emit_agent("server-message", {"messages": self.add_message_to_project(project, new_message)})
+
+    def get_messages(self, project: str, before_id: int = None, limit: int = None):
+        """
+        Messages of a project, oldest first. With `limit`, only the `limit` newest
+        messages older than `before_id` (when given) are returned, so the whole
+        history can be paged through backwards using the id of the first message
+        of each page as the next cursor.
+        """
+        with Session(self.engine) as session:
+            query = session.query(MessageModel).filter(MessageModel.project == project)
+            if before_id is not None:
+                query = query.filter(MessageModel.id < before_id)
+
+            if limit is None:
+                messages = query.order_by(MessageModel.id).all()
+            else:
+                messages = list(reversed(query.order_by(MessageModel.id.desc()).limit(limit).all()))
 
-    def get_messages(self, project: str):
+            if not messages and not session.query(Projects.id).filter(Projects.project == project).first():
+                return None
+            return [message.to_dict() for message in messages]
+
+    def _get_latest_message(self, project: str, sources: list):
+        # One indexed lookup per source instead of scanning back through the conversation.
         with Session(self.engine) as session:
-            project_state = session.query(Projects).filter(Projects.project == project).first()
-            if project_state:
-                return json.loads(project_state.message_stack_json)
-            return None
+            latest = None
+            for source in sources:
+                message = session.query(MessageModel).filter(
+                    MessageModel.project == project,
+                    MessageModel.source == source.value
+                ).order_by(MessageModel.id.desc()).first()
+                if message and (latest is None or message.id > latest.id):
+                    latest = message
+            return latest.to_dict() if latest else None
 
     def get_latest_message_from_user(self, project: str):
-        with Session(self.engine) as session:
-            project_state = session.query(Projects).filter(Projects.project == project).first()
-            if project_state:
-                message_stack = json.loads(project_state.message_stack_json)
-                for message in reversed(message_stack):
-                    if not message["from_devika"]:
-                        return message
-            return None
+        return self._get_latest_message(project, [MessageSources.USER, MessageSources.SYSTEM])
 
     def validate_last_message_is_from_user(self, project: str):
         with Session(self.engine) as session:
-            project_state = session.query(Projects).filter(Projects.project == project).first()
-            if project_state:
-                message_stack = json.loads(project_state.message_stack_json)
-                if message_stack:
-                    return not message_stack[-1]["from_devika"]
+            message = session.query(MessageModel).filter(
+                MessageModel.project == project
+            ).order_by(MessageModel.id.desc()).first()
+            if message:
+                return message.source != MessageSources.DEVIKA.value
             return False
 
     def get_latest_message_from_devika(self, project: str):
-        with Session(self.engine) as session:
-            project_state = session.query(Projects).filter(Projects.project == project).first()
-            if project_state:
-                message_stack = json.loads(project_state.message_stack_json)
-                for message in reversed(message_stack):
-                    if message["from_devika"]:
-                        return message
-            return None
+        return self._get_latest_message(project, [MessageSources.DEVIKA])
 
     def get_project_list(self):
         with Session(self.engine) as session:
@@ -169,31 +287,87 @@ class ProjectManager:
             return [project.project for project in projects]
 
     def get_all_messages_formatted(self, project: str):
-        formatted_messages = []
-
         with Session(self.engine) as session:
-            project_state = session.query(Projects).filter(Projects.project == project).first()
-            if project_state:
-                message_stack = json.loads(project_state.message_stack_json)
-                for message in message_stack:
-                    formatted_messages.append(f"{message['source']}: {message['message']}")
-
-            return formatted_messages
+            messages = session.query(MessageModel.source, MessageModel.message).filter(
+                MessageModel.project == project
+            ).order_by(MessageModel.id).all()
+            return [f"{source}: {message}" for source, message in messages]
 
     def get_project_path(self, project: str):
         return os.path.join(self.projects_root_dir, project.lower().replace(" ", "-"))
 
-    def project_to_zip(self, project: str):
+    def _iter_project_files(self, project_path: str, exclude: list):
+        for root, dirs, files in os.walk(project_path):
+            relative_root = os.path.relpath(root, project_path)
+            dirs[:] = sorted(
+                d for d in dirs
+                if not _is_excluded(os.path.normpath(os.path.join(relative_root, d)), d, exclude)
+            )
+            for file in sorted(files):
+                relative_path = os.path.normpath(os.path.join(relative_root, file))
+                if not _is_excluded(relative_path, file, exclude):
+                    yield os.path.join(root, file)
+
+    def get_project_fingerprint(self, project: str) -> str:
+        """
+        Hash of the path, size and modification time of every file that goes into
+        the project zip. It changes whenever the zip would have to be rebuilt.
+        """
         project_path = self.get_project_path(project)
-        zip_path = f"{project_path}.zip"
+        exclude = Config().get_zip_exclude()
 
-        with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            for root, dirs, files in os.walk(project_path):
-                for file in files:
-                    relative_path = os.path.relpath(os.path.join(root, file), os.path.join(project_path, '..'))
-                    zipf.write(os.path.join(root, file), arcname=relative_path)
+        fingerprint = hashlib.sha256(json.dumps(exclude).encode())
+        for file_path in self._iter_project_files(project_path, exclude):
+            stat = os.stat(file_path)
+            relative_path = os.path.relpath(file_path, project_path)
+            fingerprint.update(f"{relative_path}\0{stat.st_size}\0{stat.st_mtime_ns}\n".encode())
+        return fingerprint.hexdigest()
+
+    def _write_zip(self, project: str, fileobj):
+        project_path = self.get_project_path(project)
+        with zipfile.ZipFile(fileobj, 'w', zipfile.ZIP_DEFLATED) as zipf:
+            for file_path in self._iter_project_files(project_path, Config().get_zip_exclude()):
+                relative_path = os.path.relpath(file_path, os.path.join(project_path, '..'))
+                zip_info = zipfile.ZipInfo.from_file(file_path, arcname=relative_path)
+                zip_info.compress_type = zipfile.ZIP_DEFLATED
+                with open(file_path, "rb") as source, zipf.open(zip_info, 'w', force_zip64=True) as target:
+                    while chunk := source.read(ZIP_CHUNK_SIZE):
+                        target.write(chunk)
+                        yield
+
+    def project_to_zip(self, project: str):
+        """
+        Build the project zip, unless the one built last time is still up to date.
+        """
+        zip_path = self.get_zip_path(project)
+        fingerprint_path = f"{zip_path}.fingerprint"
+        fingerprint = self.get_project_fingerprint(project)
+
+        if os.path.exists(zip_path) and os.path.exists(fingerprint_path):
+            with open(fingerprint_path) as f:
+                if f.read() == fingerprint:
+                    return zip_path
+
+        def write_zip(f):
+            # Written like the streamed download, so both are the same bytes.
+            for chunk in self.stream_project_zip(project):
+                f.write(chunk)
+
+        _write_atomically(zip_path, "wb", write_zip)
+        _write_atomically(fingerprint_path, "w", lambda f: f.write(fingerprint))
 
         return zip_path
 
+    def stream_project_zip(self, project: str):
+        """
+        Yield the project zip chunk by chunk while it is being compressed,
+        without writing it to disk.
+        """
+        stream = ZipStream()
+        for _ in self._write_zip(project, stream):
+            if stream.buffered() >= ZIP_CHUNK_SIZE:
+                yield stream.take()
+        yield stream.take()
+
     def get_zip_path(self, project: str):
         return f"{self.get_project_path(project)}.zip"
@@ -1,12 +1,25 @@
+import atexit
+import copy
+import gzip
 import json
+import os
+import threading
+import time
 from datetime import datetime
 from typing import Optional
-from sqlmodel import Field, Session, SQLModel, create_engine
+from sqlmodel import Field, Index, Session, SQLModel
 from src.socket_instance import emit_agent
 from src.config import Config
+from src.database import get_engine
+from src.logger import Logger
+from src.token_usage import TokenUsage, migrate_token_totals
 
 
 class AgentStateModel(SQLModel, table=True):
+    """
+    Legacy storage: the whole state stack of a project as one JSON blob.
+    Only read to migrate old databases to `agent_state_events`.
+    """
     __tablename__ = "agent_state"
 
     id: Optional[int] = Field(default=None, primary_key=True)
@@ -14,12 +27,272 @@ class AgentStateModel(SQLModel, table=True):
     state_stack_json: str
 
 
+class AgentStateEvent(SQLModel, table=True):
+    """
+    One row per state in the history of a project. Rows are appended, only the
+    latest one (highest `seq`) is ever rewritten.
+    """
+    __tablename__ = "agent_state_events"
+    __table_args__ = (
+        Index("ix_agent_state_events_project_seq", "project", "seq", unique=True),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    project: str
+    seq: int
+    state_json: str
+
+
+class AgentStateLatest(SQLModel, table=True):
+    """
+    Copy of the latest state of every project, so the hot path never has to
+    touch the event history.
+    """
+    __tablename__ = "agent_state_latest"
+
+    project: str = Field(primary_key=True)
+    seq: int
+    state_json: str
+
+
+class AgentStateCompaction(SQLModel, table=True):
+    """
+    Highest `seq` of each project whose event has already been compacted.
+    """
+    __tablename__ = "agent_state_compaction"
+
+    project: str = Field(primary_key=True)
+    compacted_seq: int
+
+
+_migrated_databases = set()
+_state_caches = {}
+_state_caches_lock = threading.Lock()
+_compaction_job = None
+
+
+def migrate_legacy_state(engine):
+    """
+    Move `agent_state` JSON blobs into the `agent_state_events` table.
+    Projects that already have events are left alone.
+    """
+    with Session(engine) as session:
+        for legacy in session.query(AgentStateModel).all():
+            if session.get(AgentStateLatest, legacy.project) is None:
+                state_stack = json.loads(legacy.state_stack_json)
+                for seq, state in enumerate(state_stack):
+                    session.add(AgentStateEvent(project=legacy.project, seq=seq, state_json=json.dumps(state)))
+                if state_stack:
+                    session.add(AgentStateLatest(
+                        project=legacy.project,
+                        seq=len(state_stack) - 1,
+                        state_json=json.dumps(state_stack[-1])
+                    ))
+            session.delete(legacy)
+        session.commit()
+
+
+def seed_token_usage(engine):
+    """
+    Carry the token totals that states used to hold over into the `token_usage`
+    ledger, as one "legacy" row per project that has no usage recorded yet.
+    """
+    migrate_token_totals(engine)
+    token_usage = TokenUsage()
+    with Session(engine) as session:
+        latest_states = session.query(AgentStateLatest.project, AgentStateLatest.state_json).all()
+    for project, state_json in latest_states:
+        tokens = json.loads(state_json).get("token_usage") or 0
+        if tokens and not token_usage.has_usage(project):
+            token_usage.record(project, tokens, "legacy")
+
+
+class StateCache:
+    """
+    Write-behind cache for `AgentState`.
+
+    Keeps the latest state of every project in memory and buffers writes, which
+    are flushed to SQLite in one transaction every `flush_interval` seconds, as
+    soon as `batch_size` writes are pending, when an agent completes and on
+    interpreter shutdown. Replacing the latest state while it is still pending
+    only updates the buffer, so bursts of UI updates cost a single row write.
+    """
+
+    def __init__(self, engine, flush_interval: float, batch_size: int):
+        self.engine = engine
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+
+        self.lock = threading.RLock()
+        self.latest = {}   # project -> (seq, state), None when the project has no state
+        self.pending = {}  # project -> {seq: state}
+        self.pending_count = 0
+        self.flusher = None
+
+    def _load_latest(self, project: str):
+        if project not in self.latest:
+            with Session(self.engine) as session:
+                latest = session.get(AgentStateLatest, project)
+                self.latest[project] = (latest.seq, json.loads(latest.state_json)) if latest else None
+        return self.latest[project]
+
+    def get_latest(self, project: str):
+        with self.lock:
+            latest = self._load_latest(project)
+            return copy.deepcopy(latest[1]) if latest else None
+
+    def write(self, project: str, state: dict, append: bool) -> int:
+        with self.lock:
+            latest = self._load_latest(project)
+            if latest is None:
+                seq = 0
+            else:
+                seq = latest[0] + 1 if append else latest[0]
+
+            state = copy.deepcopy(state)
+            self.latest[project] = (seq, state)
+            project_pending = self.pending.setdefault(project, {})
+            if seq not in project_pending:
+                self.pending_count += 1
+            project_pending[seq] = state
+
+            should_flush = self.pending_count >= self.batch_size
+
+        if should_flush:
+            self.flush()
+        else:
+            self._start_flusher()
+        return seq
+
+    def get_pending(self, project: str) -> dict:
+        with self.lock:
+            return copy.deepcopy(self.pending.get(project, {}))
+
+    def delete(self, project: str):
+        with self.lock:
+            self.pending_count -= len(self.pending.pop(project, {}))
+            self.latest.pop(project, None)
+
+    def flush(self, project: str = None):
+        with self.lock:
+            if project is None:
+                batch, self.pending = self.pending, {}
+                self.pending_count = 0
+            elif project in self.pending:
+                batch = {project: self.pending.pop(project)}
+                self.pending_count -= len(batch[project])
+            else:
+                return
+
+            if not batch:
+                return
+
+            # Written while holding the lock so that a concurrent flush cannot
+            # commit an older copy of the same row after this one.
+            try:
+                with Session(self.engine) as session:
+                    for project_name, states in batch.items():
+                        session.query(AgentStateEvent).filter(
+                            AgentStateEvent.project == project_name,
+                            AgentStateEvent.seq.in_(list(states))
+                        ).delete(synchronize_session=False)
+                        for seq, state in states.items():
+                            session.add(AgentStateEvent(project=project_name, seq=seq, state_json=json.dumps(state)))
+
+                        seq, state = self.latest[project_name]
+                        session.merge(AgentStateLatest(project=project_name, seq=seq, state_json=json.dumps(state)))
+                    session.commit()
+            except Exception:
+                # Nothing can have been written to the buffer since it was taken,
+                # as the lock is held, so the batch goes back as it was.
+                for project_name, states in batch.items():
+                    self.pending.setdefault(project_name, {}).update(states)
+                    self.pending_count += len(states)
+                raise
+
+    def _start_flusher(self):
+        if self.flusher is not None:
+            return
+        with self.lock:
+            if self.flusher is None:
+                self.flusher = threading.Thread(target=self._flush_periodically, daemon=True)
+                self.flusher.start()
+
+    def _flush_periodically(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                Logger().error(f"Flushing agent states failed, retrying in {self.flush_interval}s: {e}")
+
+
+def get_state_cache(engine, sqlite_path: str) -> StateCache:
+    with _state_caches_lock:
+        if sqlite_path not in _state_caches:
+            config = Config()
+            _state_caches[sqlite_path] = StateCache(
+                engine,
+                flush_interval=config.get_state_flush_interval(),
+                batch_size=config.get_state_flush_batch_size()
+            )
+        return _state_caches[sqlite_path]
+
+
+@atexit.register
+def flush_state_caches():
+    for cache in list(_state_caches.values()):
+        cache.flush()
+
+
+def compact_state(state: dict) -> dict:
+    """
+    Drop the bulky parts of an old state (terminal output) and keep its metadata.
+    """
+    terminal_session = state.get("terminal_session")
+    if terminal_session and terminal_session.get("output"):
+        terminal_session["output"] = None
+    state["compacted"] = True
+    return state
+
+
+def start_compaction_job():
+    """
+    Compact the state history of every project every `COMPACTION_INTERVAL` seconds.
+    Compaction drops terminal output, so the job only runs when it is enabled.
+    """
+    global _compaction_job
+
+    interval = Config().get_state_compaction_interval()
+    if interval <= 0 or _compaction_job is not None:
+        return
+
+    def compact_periodically():
+        while True:
+            time.sleep(interval)
+            try:
+                AgentState().compact_all()
+            except Exception as e:
+                Logger().error(f"State compaction failed: {e}")
+
+    _compaction_job = threading.Thread(target=compact_periodically, daemon=True)
+    _compaction_job.start()
+
+
 class AgentState:
     def __init__(self):
         config = Config()
         sqlite_path = config.get_sqlite_db()
-        self.engine = create_engine(f"sqlite:///{sqlite_path}")
-        SQLModel.metadata.create_all(self.engine)
+        self.engine = get_engine(sqlite_path)
+
+        if sqlite_path not in _migrated_databases:
+            migrate_legacy_state(self.engine)
+            seed_token_usage(self.engine)
+            _migrated_databases.add(sqlite_path)
+
+        self.cache = None
+        if config.get_state_cache_mode() == "write-behind":
+            self.cache = get_state_cache(self.engine, sqlite_path)
 
     def new_state(self):
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
@@ -39,133 +312,214 @@ class AgentState:
             "message": None,
             "completed": False,
             "agent_is_active": True,
-            "token_usage": 0,
             "timestamp": timestamp
         }
 
+    def _append_state(self, session: Session, project: str, state: dict) -> int:
+        state_json = json.dumps(state)
+        latest = session.get(AgentStateLatest, project)
+        if latest:
+            latest.seq += 1
+            latest.state_json = state_json
+        else:
+            latest = AgentStateLatest(project=project, seq=0, state_json=state_json)
+            session.add(latest)
+        session.add(AgentStateEvent(project=project, seq=latest.seq, state_json=state_json))
+        return latest.seq
+
+    def _replace_latest_state(self, session: Session, project: str, state: dict) -> int:
+        latest = session.get(AgentStateLatest, project)
+        if not latest:
+            return self._append_state(session, project, state)
+
+        latest.state_json = json.dumps(state)
+        session.query(AgentStateEvent).filter(
+            AgentStateEvent.project == project,
+            AgentStateEvent.seq == latest.seq
+        ).update({"state_json": latest.state_json})
+        return latest.seq
+
+    def _write_state(self, project: str, state: dict, append: bool) -> int:
+        if self.cache:
+            return self.cache.write(project, state, append)
+
+        with Session(self.engine) as session:
+            if append:
+                seq = self._append_state(session, project, state)
+            else:
+                seq = self._replace_latest_state(session, project, state)
+            session.commit()
+        return seq
+
+    def flush(self, project: str = None):
+        if self.cache:
+            self.cache.flush(project)
+
     def delete_state(self, project: str):
+        if self.cache:
+            self.cache.delete(project)
+
         with Session(self.engine) as session:
-            agent_state = session.query(AgentStateModel).filter(AgentStateModel.project == project).first()
-            if agent_state:
-                session.delete(agent_state)
-                session.commit()
+            session.query(AgentStateEvent).filter(AgentStateEvent.project == project).delete()
+            session.query(AgentStateLatest).filter(AgentStateLatest.project == project).delete()
+            session.query(AgentStateCompaction).filter(AgentStateCompaction.project == project).delete()
+            session.commit()
+
+    def _emit_state(self, project: str, seq: int, state: dict, op: str):
+        """
+        In the "full" protocol every update sends the whole state history on
+        `agent-state`. In the "delta" protocol only the appended or replaced state
+        is sent on `agent-state-delta`, together with its sequence number, and
+        clients that miss one catch up with `get_states_since`.
+        """
+        if Config().get_state_socket_protocol() == "delta":
+            emit_agent("agent-state-delta", {
+                "project_name": project,
+                "op": op,
+                "seq": seq,
+                "state": state
+            })
+        else:
+            emit_agent("agent-state", self.get_current_state(project))
 
     def add_to_current_state(self, project: str, state: dict):
-        with Session(self.engine) as session:
-            agent_state = session.query(AgentStateModel).filter(AgentStateModel.project == project).first()
-            if agent_state:
-                state_stack = json.loads(agent_state.state_stack_json)
-                state_stack.append(state)
-                agent_state.state_stack_json = json.dumps(state_stack)
-                session.commit()
-            else:
-                state_stack = [state]
-                agent_state = AgentStateModel(project=project, state_stack_json=json.dumps(state_stack))
-                session.add(agent_state)
-                session.commit()
-            emit_agent("agent-state", state_stack)
+        seq = self._write_state(project, state, append=True)
+        self._emit_state(project, seq, state, "append")
 
     def get_current_state(self, project: str):
         with Session(self.engine) as session:
-            agent_state = session.query(AgentStateModel).filter(AgentStateModel.project == project).first()
-            if agent_state:
-                return json.loads(agent_state.state_stack_json)
-            return None
+            events = session.query(AgentStateEvent).filter(
+                AgentStateEvent.project == project
+            ).order_by(AgentStateEvent.seq).all()
+            state_stack = {event.seq: json.loads(event.state_json) for event in events}
 
-    def update_latest_state(self, project: str, state: dict):
+        if self.cache:
+            state_stack.update(self.cache.get_pending(project))
+
+        if state_stack:
+            return [state_stack[seq] for seq in sorted(state_stack)]
+        return None
+
+    def get_states_since(self, project: str, since_seq: int) -> list:
         with Session(self.engine) as session:
-            agent_state = session.query(AgentStateModel).filter(AgentStateModel.project == project).first()
-            if agent_state:
-                state_stack = json.loads(agent_state.state_stack_json)
-                state_stack[-1] = state
-                agent_state.state_stack_json = json.dumps(state_stack)
-                session.commit()
-            else:
-                state_stack = [state]
-                agent_state = AgentStateModel(project=project, state_stack_json=json.dumps(state_stack))
-                session.add(agent_state)
-                session.commit()
-            emit_agent("agent-state", state_stack)
+            events = session.query(AgentStateEvent).filter(
+                AgentStateEvent.project == project,
+                AgentStateEvent.seq > since_seq
+            ).order_by(AgentStateEvent.seq).all()
+            states = {event.seq: json.loads(event.state_json) for event in events}
+
+        if self.cache:
+            states.update({
+                seq: state for seq, state in self.cache.get_pending(project).items() if seq > since_seq
+            })
+
+        return [{"seq": seq, "state": states[seq]} for seq in sorted(states)]
+
+    def update_latest_state(self, project: str, state: dict):
+        seq = self._write_state(project, state, append=False)
+        self._emit_state(project, seq, state, "replace")
 
     def get_latest_state(self, project: str):
+        if self.cache:
+            return self.cache.get_latest(project)
+
         with Session(self.engine) as session:
-            agent_state = session.query(AgentStateModel).filter(AgentStateModel.project == project).first()
-            if agent_state:
-                return json.loads(agent_state.state_stack_json)[-1]
+            latest = session.get(AgentStateLatest, project)
+            if latest:
+                return json.loads(latest.state_json)
             return None
 
     def set_agent_active(self, project: str, is_active: bool):
-        with Session(self.engine) as session:
-            agent_state = session.query(AgentStateModel).filter(AgentStateModel.project == project).first()
-            if agent_state:
-                state_stack = json.loads(agent_state.state_stack_json)
-                state_stack[-1]["agent_is_active"] = is_active
-                agent_state.state_stack_json = json.dumps(state_stack)
-                session.commit()
-            else:
-                state_stack = [self.new_state()]
-                state_stack[-1]["agent_is_active"] = is_active
-                agent_state = AgentStateModel(project=project, state_stack_json=json.dumps(state_stack))
-                session.add(agent_state)
-                session.commit()
-            emit_agent("agent-state", state_stack)
+        state = self.get_latest_state(project) or self.new_state()
+        state["agent_is_active"] = is_active
+        seq = self._write_state(project, state, append=False)
+        self._emit_state(project, seq, state, "replace")
 
     def is_agent_active(self, project: str):
-        with Session(self.engine) as session:
-            agent_state = session.query(AgentStateModel).filter(AgentStateModel.project == project).first()
-            if agent_state:
-                return json.loads(agent_state.state_stack_json)[-1]["agent_is_active"]
-            return None
+        state = self.get_latest_state(project)
+        if state:
+            return state["agent_is_active"]
+        return None
 
     def is_agent_interruped(self, project: str):
-        with Session(self.engine) as session:
-            agent_state = session.query(AgentStateModel).filter(AgentStateModel.project == project).first()
-            if agent_state:
-                return json.loads(agent_state.state_stack_json)[-1]["internal_monologue"] == "Interrupted by user"
-            return None
+        state = self.get_latest_state(project)
+        if state:
+            return state["internal_monologue"] == "Interrupted by user"
+        return None
 
     def set_agent_completed(self, project: str, is_completed: bool):
-        with Session(self.engine) as session:
-            agent_state = session.query(AgentStateModel).filter(AgentStateModel.project == project).first()
-            if agent_state:
-                state_stack = json.loads(agent_state.state_stack_json)
-                state_stack[-1]["internal_monologue"] = "Agent is chilling..."
-                state_stack[-1]["completed"] = is_completed
-                agent_state.state_stack_json = json.dumps(state_stack)
-                session.commit()
-            else:
-                state_stack = [self.new_state()]
-                state_stack[-1]["completed"] = is_completed
-                agent_state = AgentStateModel(project=project, state_stack_json=json.dumps(state_stack))
-                session.add(agent_state)
-                session.commit()
-            emit_agent("agent-state", state_stack)
+        state = self.get_latest_state(project)
+        if state:
+            state["internal_monologue"] = "Agent is chilling..."
+        else:
+            state = self.new_state()
+        state["completed"] = is_completed
+        seq = self._write_state(project, state, append=False)
+        self.flush(project)
+        self._emit_state(project, seq, state, "replace")
 
     def is_agent_completed(self, project: str):
+        state = self.get_latest_state(project)
+        if state:
+            return state["completed"]
+        return None
+
+    def _archive_states(self, project: str, events: list):
+        archive_dir = os.path.join(Config().get_state_archive_dir(), project.lower().replace(" ", "-"))
+        os.makedirs(archive_dir, exist_ok=True)
+
+        archive_path = os.path.join(archive_dir, f"{events[0].seq}-{events[-1].seq}.jsonl.gz")
+        with gzip.open(archive_path, "wt", encoding="utf-8") as f:
+            for event in events:
+                f.write(json.dumps({"seq": event.seq, "state": json.loads(event.state_json)}) + "\n")
+        return archive_path
+
+    def compact_history(self, project: str) -> int:
+        """
+        Keep the last `HOT_STATES` states of a project intact and compact the
+        older ones, archiving their full copies first if `ARCHIVE` is enabled.
+        Returns the number of states compacted.
+        """
+        config = Config()
+        hot_states = max(1, config.get_state_hot_states())
+
         with Session(self.engine) as session:
-            agent_state = session.query(AgentStateModel).filter(AgentStateModel.project == project).first()
-            if agent_state:
-                return json.loads(agent_state.state_stack_json)[-1]["completed"]
-            return None
-            
-    def update_token_usage(self, project: str, token_usage: int):
+            latest = session.get(AgentStateLatest, project)
+            if not latest:
+                return 0
+
+            cutoff = latest.seq - hot_states
+            compaction = session.get(AgentStateCompaction, project)
+            if compaction is None:
+                compaction = AgentStateCompaction(project=project, compacted_seq=-1)
+                session.add(compaction)
+            if cutoff <= compaction.compacted_seq:
+                return 0
+
+            events = session.query(AgentStateEvent).filter(
+                AgentStateEvent.project == project,
+                AgentStateEvent.seq > compaction.compacted_seq,
+                AgentStateEvent.seq <= cutoff
+            ).order_by(AgentStateEvent.seq).all()
+
+            if events and config.get_state_archive():
+                self._archive_states(project, events)
+
+            for event in events:
+                event.state_json = json.dumps(compact_state(json.loads(event.state_json)))
+
+            compaction.compacted_seq = cutoff
+            session.commit()
+            return len(events)
+
+    def compact_all(self) -> int:
         with Session(self.engine) as session:
-            agent_state = session.query(AgentStateModel).filter(AgentStateModel.project == project).first()
-            if agent_state:
-                state_stack = json.loads(agent_state.state_stack_json)
-                state_stack[-1]["token_usage"] += token_usage
-                agent_state.state_stack_json = json.dumps(state_stack)
-                session.commit()
-            else:
-                state_stack = [self.new_state()]
-                state_stack[-1]["token_usage"] = token_usage
-                agent_state = AgentStateModel(project=project, state_stack_json=json.dumps(state_stack))
-                session.add(agent_state)
-                session.commit()
+            projects = [latest.project for latest in session.query(AgentStateLatest).all()]
+        return sum(self.compact_history(project) for project in projects)
+
+    def update_token_usage(self, project: str, token_usage: int, direction: str = "prompt",
+                           agent: str = None, model: str = None):
+        TokenUsage().record(project, token_usage, direction, agent=agent, model=model)
 
     def get_latest_token_usage(self, project: str):
-        with Session(self.engine) as session:
-            agent_state = session.query(AgentStateModel).filter(AgentStateModel.project == project).first()
-            if agent_state:
-                return json.loads(agent_state.state_stack_json)[-1]["token_usage"]
-            return 0
+        return TokenUsage().get_total(project)
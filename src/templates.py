@@ -0,0 +1,98 @@
+import os
+import threading
+import time
+from pathlib import Path
+
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, Template
+
+from src.config import Config
+
+"""
+Registry of the prompt templates (`*.jinja2` files under `src/`). Each template
+is read and compiled once per process, optionally with a bytecode cache on disk
+so that restarts skip compiling too, and renders of every template are timed.
+
+    template = get_template("agents/coder/prompt.jinja2")
+    prompt = template.render(step_by_step_plan=plan, ...)
+"""
+
+TEMPLATES_DIR = Path(__file__).parent
+
+_environment = None
+_environment_lock = threading.Lock()
+
+_stats = {}  # template name -> {"renders", "total_time", "max_time"}
+_stats_lock = threading.Lock()
+
+
+def _record(name: str, elapsed: float):
+    with _stats_lock:
+        stats = _stats.setdefault(name, {"renders": 0, "total_time": 0.0, "max_time": 0.0})
+        stats["renders"] += 1
+        stats["total_time"] += elapsed
+        stats["max_time"] = max(stats["max_time"], elapsed)
+
+
+def get_render_stats() -> dict:
+    with _stats_lock:
+        return {name: dict(stats) for name, stats in _stats.items()}
+
+
+class TimedTemplate(Template):
+    def render(self, *args, **kwargs) -> str:
+        start = time.perf_counter()
+        try:
+            return super().render(*args, **kwargs)
+        finally:
+            _record(self.name, time.perf_counter() - start)
+
+
+class PromptLoader(FileSystemLoader):
+    """
+    Strips leading and trailing whitespace from the template source, as the
+    agents did when they read their prompt files themselves.
+    """
+
+    def get_source(self, environment, template):
+        source, filename, uptodate = super().get_source(environment, template)
+        return source.strip(), filename, uptodate
+
+
+def get_environment() -> Environment:
+    global _environment
+    with _environment_lock:
+        if _environment is None:
+            config = Config()
+            bytecode_cache = None
+            if config.get_templates_bytecode_cache():
+                cache_dir = config.get_templates_bytecode_cache_dir()
+                os.makedirs(cache_dir, exist_ok=True)
+                bytecode_cache = FileSystemBytecodeCache(cache_dir)
+
+            _environment = Environment(
+                loader=PromptLoader(TEMPLATES_DIR),
+                bytecode_cache=bytecode_cache,
+                # The files do not change while Devika runs, so there is no need to stat them on every use.
+                auto_reload=False,
+                cache_size=-1,
+            )
+            _environment.template_class = TimedTemplate
+        return _environment
+
+
+def get_template(name: str) -> TimedTemplate:
+    """
+    The compiled template at `name`, relative to `src/`.
+    """
+    return get_environment().get_template(name)
+
+
+def preload() -> int:
+    """
+    Compile every template up front, e.g. at startup. Returns how many there are.
+    """
+    environment = get_environment()
+    names = environment.list_templates(extensions=["jinja2"])
+    for name in names:
+        environment.get_template(name)
+    return len(names)
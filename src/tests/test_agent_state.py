@@ -0,0 +1,156 @@
+import gzip
+import json
+import sqlite3
+import time
+
+import pytest
+from sqlmodel import Session
+
+from src import state as state_module
+from src.config import Config
+from src.state import AgentState, AgentStateEvent, AgentStateLatest, AgentStateModel
+from src.token_usage import TokenUsage
+
+
+@pytest.fixture(params=["write-through", "write-behind"])
+def agent_state(request, tmp_path, monkeypatch):
+    monkeypatch.setitem(Config().config["STORAGE"], "SQLITE_DB", str(tmp_path / "devika.db"))
+    monkeypatch.setitem(Config().config, "STATE", {"CACHE_MODE": request.param, "FLUSH_INTERVAL": 60})
+    return AgentState()
+
+
+def test_append_and_replace_latest(agent_state):
+    first = agent_state.new_state()
+    first["internal_monologue"] = "first"
+    agent_state.add_to_current_state("demo", first)
+
+    second = agent_state.new_state()
+    second["internal_monologue"] = "second"
+    agent_state.add_to_current_state("demo", second)
+
+    agent_state.set_agent_completed("demo", True)
+    agent_state.update_token_usage("demo", 42)
+
+    stack = agent_state.get_current_state("demo")
+    assert [state["internal_monologue"] for state in stack] == ["first", "Agent is chilling..."]
+    assert agent_state.is_agent_completed("demo") is True
+    assert agent_state.get_latest_token_usage("demo") == 42
+
+    agent_state.delete_state("demo")
+    assert agent_state.get_current_state("demo") is None
+    assert agent_state.get_latest_state("demo") is None
+
+
+def test_state_without_history(agent_state):
+    assert agent_state.get_latest_token_usage("empty") == 0
+    agent_state.set_agent_active("empty", False)
+    assert agent_state.is_agent_active("empty") is False
+    assert len(agent_state.get_current_state("empty")) == 1
+
+
+def test_states_since(agent_state):
+    for i in range(4):
+        state = agent_state.new_state()
+        state["internal_monologue"] = str(i)
+        agent_state.add_to_current_state("demo", state)
+
+    states = agent_state.get_states_since("demo", 1)
+    assert [(s["seq"], s["state"]["internal_monologue"]) for s in states] == [(2, "2"), (3, "3")]
+    assert len(agent_state.get_states_since("demo", -1)) == 4
+
+
+def test_write_behind_buffers_until_flush(tmp_path, monkeypatch):
+    monkeypatch.setitem(Config().config["STORAGE"], "SQLITE_DB", str(tmp_path / "devika.db"))
+    monkeypatch.setitem(Config().config, "STATE", {"CACHE_MODE": "write-behind", "FLUSH_INTERVAL": 60})
+    cached = AgentState()
+
+    for i in range(5):
+        state = cached.new_state()
+        state["internal_monologue"] = str(i)
+        cached.add_to_current_state("demo", state)
+        cached.update_token_usage("demo", 1)
+
+    with Session(cached.engine) as session:
+        assert session.query(AgentStateEvent).count() == 0
+    assert [s["internal_monologue"] for s in cached.get_current_state("demo")] == ["0", "1", "2", "3", "4"]
+
+    cached.set_agent_completed("demo", True)
+    with Session(cached.engine) as session:
+        assert session.query(AgentStateEvent).count() == 5
+        latest = session.get(AgentStateLatest, "demo")
+        assert latest.seq == 4
+        assert json.loads(latest.state_json)["completed"] is True
+
+
+def test_compact_history_archives_and_strips_old_states(agent_state, tmp_path, monkeypatch):
+    monkeypatch.setitem(Config().config["STATE"], "HOT_STATES", 2)
+    monkeypatch.setitem(Config().config["STATE"], "ARCHIVE", "true")
+    monkeypatch.setitem(Config().config["STATE"], "ARCHIVE_DIR", str(tmp_path / "archive"))
+
+    for i in range(5):
+        state = agent_state.new_state()
+        state["terminal_session"]["output"] = f"output {i}"
+        agent_state.add_to_current_state("Demo Project", state)
+    agent_state.flush()
+
+    assert agent_state.compact_history("Demo Project") == 3
+    assert agent_state.compact_history("Demo Project") == 0
+
+    outputs = [state["terminal_session"]["output"] for state in agent_state.get_current_state("Demo Project")]
+    assert outputs == [None, None, None, "output 3", "output 4"]
+
+    with gzip.open(tmp_path / "archive" / "demo-project" / "0-2.jsonl.gz", "rt") as f:
+        archived = [json.loads(line) for line in f]
+    assert [entry["state"]["terminal_session"]["output"] for entry in archived] == ["output 0", "output 1", "output 2"]
+
+
+def test_migrates_legacy_state_blob(tmp_path, monkeypatch):
+    sqlite_path = str(tmp_path / "legacy.db")
+    monkeypatch.setitem(Config().config["STORAGE"], "SQLITE_DB", sqlite_path)
+
+    legacy_stack = [{"internal_monologue": str(i), "token_usage": i} for i in range(3)]
+    engine = AgentState().engine
+    with Session(engine) as session:
+        session.add(AgentStateModel(project="old", state_stack_json=json.dumps(legacy_stack)))
+        session.commit()
+
+    from src import state
+    state._migrated_databases.discard(sqlite_path)
+
+    migrated = AgentState()
+    assert migrated.get_current_state("old") == legacy_stack
+    assert migrated.get_latest_token_usage("old") == 2
+    with Session(migrated.engine) as session:
+        assert session.query(AgentStateModel).count() == 0
+
+
+def test_token_usage_keeps_a_running_total(agent_state):
+    agent_state.update_token_usage("demo", 10, "prompt", agent="Coder", model="gpt-4")
+    agent_state.update_token_usage("demo", 5, "response", agent="Coder", model="gpt-4")
+    agent_state.update_token_usage("demo", 3, "wasted", agent="Coder", model="gpt-4")
+
+    assert agent_state.get_latest_token_usage("demo") == 15
+    assert TokenUsage().get_usage_by_agent("demo")["Coder"] == {"prompt": 10, "response": 5, "wasted": 3, "total": 15}
+
+
+def test_failed_flush_is_retried_by_the_flusher(tmp_path, monkeypatch):
+    monkeypatch.setitem(Config().config["STORAGE"], "SQLITE_DB", str(tmp_path / "devika.db"))
+    monkeypatch.setitem(Config().config, "STATE", {"CACHE_MODE": "write-behind", "FLUSH_INTERVAL": 0.05})
+    cached = AgentState()
+
+    class LockedSession(Session):
+        def commit(self):
+            raise sqlite3.OperationalError("database is locked")
+
+    monkeypatch.setattr(state_module, "Session", LockedSession)
+    state = cached.new_state()
+    state["internal_monologue"] = "kept"
+    cached.add_to_current_state("demo", state)
+    time.sleep(0.2)
+    assert cached.cache.get_pending("demo")
+
+    monkeypatch.setattr(state_module, "Session", Session)
+    time.sleep(0.2)
+    assert not cached.cache.get_pending("demo")
+    with Session(cached.engine) as session:
+        assert json.loads(session.get(AgentStateLatest, "demo").state_json)["internal_monologue"] == "kept"
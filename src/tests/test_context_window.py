@@ -0,0 +1,55 @@
+from src.llm.context_window import fit_prompt
+from src.memory.conversation import count_tokens
+
+
+def render(results, code):
+    sections = [f"Query: {query}\n{result}" for query, result in results.items()]
+    return "Results:\n" + "\n---\n".join(sections) + f"\nCode:\n{code}\n"
+
+
+def test_prompt_that_fits_is_unchanged():
+    results = {"first": "short result"}
+    assert fit_prompt(render, {"results": results, "code": "print(1)"}, 1000) == render(results, "print(1)")
+
+
+def test_lowest_priority_section_is_trimmed_first():
+    results = {f"query {i}": "some search result text " * 200 for i in range(4)}
+    code = "print('hello')\n" * 50
+
+    prompt = fit_prompt(render, {"results": results, "code": code}, 1500)
+
+    assert count_tokens(prompt) <= 1500
+    assert code in prompt
+    assert "Query: query 0" in prompt
+    assert "Query: query 3" not in prompt
+
+
+class SmallModel:
+    model_id = "small-local-model"
+
+    def get_prompt_budget(self, model_id=None):
+        return 1500
+
+
+def test_action_conversation_fits_after_the_instructions(tmp_path, monkeypatch):
+    from src.config import Config
+    from src.llm.messages import to_text
+
+    monkeypatch.setitem(Config().config["STORAGE"], "SQLITE_DB", str(tmp_path / "devika.db"))
+    from src.agents.action.action import Action
+    from src.project import ProjectManager
+
+    manager = ProjectManager()
+    manager.create_project("demo")
+    for i in range(20):
+        manager.add_message_from_user("demo", f"message {i} " + "some words " * 100)
+
+    action = Action.__new__(Action)
+    action.project_name = "demo"
+    action.llm = SmallModel()
+
+    prompt = action.render()
+
+    assert prompt[0]["role"] == "system"
+    assert count_tokens(to_text(prompt)) <= 1500
+    assert "message 19" in prompt[-1]["content"]
@@ -0,0 +1,46 @@
+import pytest
+
+from src.config import Config
+from src.memory import ConversationContext
+from src.memory.conversation import count_tokens
+from src.project import ProjectManager
+
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    monkeypatch.setitem(Config().config["STORAGE"], "SQLITE_DB", str(tmp_path / "devika.db"))
+    monkeypatch.setitem(Config().config, "CONTEXT", {"RECENT_MESSAGES": 3, "MAX_MESSAGE_TOKENS": 50, "DIGEST_CHARS": 20})
+    manager = ProjectManager()
+    manager.create_project("demo")
+    return manager
+
+
+def test_long_messages_from_every_source_are_elided(manager):
+    pasted_code = "\n".join(f"line_{i} = {i}" for i in range(500))
+    manager.add_message_from_user("demo", pasted_code)
+    manager.add_message_from_devika("demo", pasted_code)
+    manager.add_system_message("demo", pasted_code)
+
+    conversation = ConversationContext(token_budget=1000).build("demo")
+
+    assert len(conversation) == 3
+    for text in conversation:
+        assert "tokens elided" in text
+        assert text.endswith("line_499 = 499")
+        assert count_tokens(text) < 100
+
+
+def test_older_messages_are_replaced_by_their_first_lines(manager):
+    manager.add_message_from_user("demo", "Build a todo app\nwith a REST API and a React frontend")
+    manager.add_message_from_devika("demo", "Sure, I will start with the backend")
+    for i in range(3):
+        manager.add_message_from_user("demo", f"question {i}")
+
+    summary, *recent = ConversationContext(token_budget=1000).build("demo")
+
+    assert summary.splitlines() == [
+        "system: First lines of 2 earlier messages:",
+        "- user: Build a todo app ...",
+        "- Devika: Sure, I will start w ...",
+    ]
+    assert recent == ["user: question 0", "user: question 1", "user: question 2"]
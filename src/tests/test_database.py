@@ -0,0 +1,25 @@
+from sqlalchemy.pool import QueuePool
+
+from src.config import Config
+from src.database import get_engine
+
+
+def test_one_engine_per_database(tmp_path):
+    engine = get_engine(str(tmp_path / "devika.db"))
+
+    assert get_engine(str(tmp_path / "devika.db")) is engine
+    assert get_engine(str(tmp_path / "other.db")) is not engine
+
+
+def test_connections_are_configured_for_concurrent_access(tmp_path, monkeypatch):
+    monkeypatch.setitem(Config().config, "DATABASE", {"BUSY_TIMEOUT": 1234, "POOL_SIZE": 3})
+    engine = get_engine(str(tmp_path / "devika.db"))
+
+    with engine.connect() as connection:
+        assert connection.exec_driver_sql("PRAGMA journal_mode").scalar() == "wal"
+        # NORMAL
+        assert connection.exec_driver_sql("PRAGMA synchronous").scalar() == 1
+        assert connection.exec_driver_sql("PRAGMA busy_timeout").scalar() == 1234
+
+    assert isinstance(engine.pool, QueuePool)
+    assert engine.pool.size() == 3
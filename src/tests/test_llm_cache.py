@@ -0,0 +1,109 @@
+import time
+
+import pytest
+
+from src.config import Config
+from src.llm import LLM, client_pool, router
+from src.llm.cache import ResponseCache
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setitem(Config().config["STORAGE"], "SQLITE_DB", str(tmp_path / "devika.db"))
+    monkeypatch.setitem(Config().config, "LLM", {"CACHE_MAX_ENTRIES": 2, "CACHE_MAX_SIZE_MB": 1, "CACHE_TTL": 0})
+    return ResponseCache()
+
+
+def test_enabled_per_agent(monkeypatch):
+    monkeypatch.setitem(Config().config, "LLM", {"CACHE_AGENTS": ["Formatter"]})
+    assert ResponseCache.is_enabled("Formatter")
+    assert not ResponseCache.is_enabled("Coder")
+
+    monkeypatch.setitem(Config().config, "LLM", {"CACHE_AGENTS": ["*"]})
+    assert ResponseCache.is_enabled("Coder")
+
+
+def test_key_depends_on_model_prompt_and_params():
+    key = ResponseCache.make_key("gpt-4", "prompt")
+    assert key == ResponseCache.make_key("gpt-4", "prompt", {})
+    assert key != ResponseCache.make_key("gpt-3.5-turbo", "prompt")
+    assert key != ResponseCache.make_key("gpt-4", "prompt", {"temperature": 0.5})
+
+
+def test_least_recently_used_entries_are_evicted(cache):
+    cache.put("a", "gpt-4", "first")
+    cache.put("b", "gpt-4", "second")
+    assert cache.get("a") == "first"
+    cache.put("c", "gpt-4", "third")
+
+    assert cache.get("b") is None
+    assert cache.get("a") == "first"
+    assert cache.get("c") == "third"
+
+
+def test_entries_are_evicted_by_total_size(cache):
+    cache.max_entries = 100
+    cache.max_size = 25
+    cache.put("a", "gpt-4", "x" * 10)
+    cache.put("b", "gpt-4", "y" * 10)
+    cache.put("c", "gpt-4", "z" * 10)
+
+    assert cache.get("a") is None
+    assert cache.stats()["size"] == 20
+
+
+def test_expired_entries_are_misses(cache):
+    cache.ttl = 0.01
+    cache.put("a", "gpt-4", "first")
+    time.sleep(0.02)
+
+    misses = cache.stats()["misses"]
+    assert cache.get("a") is None
+    assert cache.stats()["misses"] == misses + 1
+    assert cache.stats()["entries"] == 0
+
+
+class FakeOllama:
+    def get_models(self, wait=False):
+        return []
+
+
+class FakeOpenAi:
+    calls = []
+
+    def inference(self, model_id, prompt):
+        FakeOpenAi.calls.append(model_id)
+        if model_id == "gpt-4-0125-preview":
+            raise ValueError("model unavailable")
+        return f"answer from {model_id}"
+
+
+@pytest.fixture
+def providers(cache, monkeypatch):
+    monkeypatch.setitem(client_pool.PROVIDERS, "OLLAMA", (FakeOllama, Config.get_ollama_api_endpoint))
+    monkeypatch.setitem(client_pool.PROVIDERS, "OPENAI", (FakeOpenAi, Config.get_openai_api_key))
+    FakeOpenAi.calls = []
+    client_pool.reset_clients()
+    yield
+    client_pool.reset_clients()
+
+
+def test_fallback_responses_are_cached_under_the_model_that_answered(providers, monkeypatch):
+    monkeypatch.setitem(Config().config["LLM"], "CACHE_AGENTS", ["Tester"])
+    monkeypatch.setitem(Config().config, "ROUTER", {"FALLBACKS": {"gpt-4-0125-preview": ["gpt-3.5-turbo-0125"]}})
+    monkeypatch.setattr(router, "_router", router.Router(max_retries=0, hedge=False))
+
+    llm = LLM("gpt-4-0125-preview", "Tester")
+    assert llm.inference("question", "demo") == "answer from gpt-3.5-turbo-0125"
+    assert llm.inference("question", "demo") == "answer from gpt-3.5-turbo-0125"
+    # The selected model is asked again each time, the fallback's answer is cached for its own requests.
+    assert FakeOpenAi.calls == ["gpt-4-0125-preview", "gpt-3.5-turbo-0125", "gpt-4-0125-preview", "gpt-3.5-turbo-0125"]
+    assert LLM("gpt-3.5-turbo-0125", "Tester").inference("question", "demo") == "answer from gpt-3.5-turbo-0125"
+    assert len(FakeOpenAi.calls) == 4
+
+
+def test_key_includes_the_sampling_params_of_the_provider(providers):
+    llm = LLM("claude-3-haiku-20240307")
+    assert llm.get_cache_key("claude-3-haiku-20240307", "prompt") == ResponseCache.make_key(
+        "claude-3-haiku-20240307", "prompt", {"max_tokens": 4096}
+    )
@@ -0,0 +1,73 @@
+from src.llm.messages import split_system, to_messages, to_text
+
+
+def test_string_prompt_is_one_user_message():
+    assert to_messages("  hello  ") == [{"role": "user", "content": "hello"}]
+    assert split_system("hello") == (None, [{"role": "user", "content": "hello"}])
+    assert to_text("hello") == "hello"
+
+
+def test_consecutive_turns_of_the_same_role_are_merged():
+    prompt = [
+        {"role": "system", "content": "instructions"},
+        {"role": "user", "content": "write a file"},
+        {"role": "user", "content": "system: file written"},
+        {"role": "assistant", "content": "done"},
+    ]
+
+    system, messages = split_system(prompt)
+
+    assert system == "instructions"
+    assert messages == [
+        {"role": "user", "content": "write a file\n\nsystem: file written"},
+        {"role": "assistant", "content": "done"},
+    ]
+    assert prompt[1]["content"] == "write a file"
+
+
+def test_conversation_prefix_is_stable_between_turns(tmp_path, monkeypatch):
+    from src.config import Config
+    from src.memory import ConversationContext
+    from src.project import ProjectManager
+
+    monkeypatch.setitem(Config().config["STORAGE"], "SQLITE_DB", str(tmp_path / "devika.db"))
+    monkeypatch.setitem(Config().config, "CONTEXT", {"RECENT_MESSAGES": 4})
+    manager = ProjectManager()
+    manager.create_project("demo")
+
+    prompts = []
+    for i in range(12):
+        if i % 2:
+            manager.add_message_from_devika("demo", f"answer {i}")
+        else:
+            manager.add_message_from_user("demo", f"question {i}")
+        conversation = ConversationContext(token_budget=10000).build_messages("demo")
+        assert {message["role"] for message in conversation} == {"user"}
+        prompts.append(to_text(to_messages(conversation)))
+
+    # Messages 5 to 8 are verbatim until message 12 completes their block.
+    for previous, current in zip(prompts[7:10], prompts[8:11]):
+        assert current.startswith(previous)
+    # Then they are replaced by their digests, after the unchanged digests of messages 1 to 4.
+    digests_of_first_block = prompts[10].split("\n\nuser: question 4")[0]
+    assert "First lines of messages 1 to 4" in digests_of_first_block
+    assert prompts[11].startswith(digests_of_first_block)
+    assert "First lines of messages 5 to 8" in prompts[11]
+
+
+def test_claude_marks_the_chat_prefix_for_caching():
+    from src.llm.claude_client import Claude
+
+    request = Claude._messages([
+        {"role": "system", "content": "instructions"},
+        {"role": "user", "content": "user: write a file"},
+        {"role": "user", "content": "Devika: done"},
+    ])
+
+    assert request["system"] == [{"type": "text", "text": "instructions", "cache_control": {"type": "ephemeral"}}]
+    # One block per turn, so the breakpoint after "Devika: done" is a block boundary in the next request too.
+    assert request["messages"] == [{"role": "user", "content": [
+        {"type": "text", "text": "user: write a file"},
+        {"type": "text", "text": "Devika: done", "cache_control": {"type": "ephemeral"}},
+    ]}]
+    assert Claude._messages("hello") == {"messages": [{"role": "user", "content": "hello"}]}
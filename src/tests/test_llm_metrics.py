@@ -0,0 +1,58 @@
+import pytest
+
+from src.config import Config
+from src.llm.metrics import LLMMetrics, render_prometheus
+
+
+@pytest.fixture
+def metrics(tmp_path, monkeypatch):
+    monkeypatch.setitem(Config().config["STORAGE"], "SQLITE_DB", str(tmp_path / "devika.db"))
+    monkeypatch.setitem(Config().config, "LLM", {"METRICS_MAX_ROWS": 0})
+    return LLMMetrics()
+
+
+def test_summary_per_agent_and_model(metrics):
+    metrics.record("demo", "Coder", "gpt-4", 100, 40, 2.0)
+    # Streamed: 20 tokens in the 1s after the first token.
+    metrics.record("demo", "Coder", "gpt-4", 50, 20, 1.5, ttft=0.5)
+    metrics.record("demo", None, "llama3", 10, 5, 0.5)
+
+    assert metrics.get_summary() == [
+        {
+            "agent": "Coder", "model": "gpt-4", "requests": 2, "prompt_tokens": 150, "completion_tokens": 60,
+            "wall_time": 3.5, "streamed_requests": 1, "ttft": 0.5, "tokens_per_second": 20.0,
+        },
+        {
+            "agent": "unknown", "model": "llama3", "requests": 1, "prompt_tokens": 10, "completion_tokens": 5,
+            "wall_time": 0.5, "streamed_requests": 0, "ttft": 0.0, "tokens_per_second": 10.0,
+        },
+    ]
+
+
+def test_old_rows_are_rolled_up_into_totals(metrics):
+    metrics.max_rows = 4
+    for _ in range(10):
+        metrics.record("demo", "Coder", "gpt-4", 10, 10, 1.0)
+
+    summary = metrics.get_summary()
+    assert [(row["requests"], row["prompt_tokens"], row["tokens_per_second"]) for row in summary] == [(10, 100, 10.0)]
+    with metrics.engine.connect() as connection:
+        rows = connection.exec_driver_sql("SELECT count(*) FROM llm_metrics").scalar()
+    assert rows <= 4
+
+
+def test_prometheus_output_escapes_labels():
+    summary = [{
+        "agent": 'Say "hi"\\now', "model": "gpt-4\n", "requests": 2, "prompt_tokens": 150, "completion_tokens": 60,
+        "wall_time": 3.5, "streamed_requests": 1, "ttft": 0.5, "tokens_per_second": 20.0,
+    }]
+
+    text = render_prometheus(summary, cache_stats={"hits": 3, "misses": 1, "entries": 2})
+    lines = text.splitlines()
+
+    assert "# TYPE devika_llm_requests_total counter" in lines
+    assert 'devika_llm_requests_total{agent="Say \\"hi\\"\\\\now",model="gpt-4\\n"} 2' in lines
+    assert 'devika_llm_tokens_per_second{agent="Say \\"hi\\"\\\\now",model="gpt-4\\n"} 20.0' in lines
+    assert 'devika_llm_cache_requests_total{result="hit"} 3' in lines
+    assert "devika_llm_cache_entries 2" in lines
+    assert text.endswith("\n")
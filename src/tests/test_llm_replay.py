@@ -0,0 +1,56 @@
+import pytest
+
+from src.config import Config
+from src.llm import LLM, client_pool, replay
+
+MODEL_ID = "gpt-4-0125-preview"
+
+
+class FakeOllama:
+    def get_models(self, wait=False):
+        return []
+
+
+class FakeOpenAi:
+    calls = []
+
+    def inference(self, model_id, prompt):
+        FakeOpenAi.calls.append(prompt)
+        return f"answer to {prompt}"
+
+
+@pytest.fixture
+def providers(tmp_path, monkeypatch):
+    monkeypatch.setitem(Config().config["STORAGE"], "SQLITE_DB", str(tmp_path / "devika.db"))
+    monkeypatch.setitem(Config().config, "LLM", {"STREAM": "false"})
+    monkeypatch.setitem(client_pool.PROVIDERS, "OLLAMA", (FakeOllama, Config.get_ollama_api_endpoint))
+    monkeypatch.setitem(client_pool.PROVIDERS, "OPENAI", (FakeOpenAi, Config.get_openai_api_key))
+    FakeOpenAi.calls = []
+    client_pool.reset_clients()
+    yield tmp_path / "cassette.jsonl"
+    client_pool.reset_clients()
+
+
+def test_replays_recorded_responses_without_a_provider(providers, monkeypatch):
+    monkeypatch.setitem(Config().config, "REPLAY", {"MODE": "record", "CASSETTE": str(providers)})
+    recorded = [LLM(MODEL_ID, "Tester").inference(prompt, "demo") for prompt in ["first", "second"]]
+    assert FakeOpenAi.calls == ["first", "second"]
+
+    # Start from the file on disk, as a new process would.
+    replay._cassettes.clear()
+    monkeypatch.setitem(Config().config, "REPLAY", {"MODE": "replay", "CASSETTE": str(providers)})
+    replayed = [LLM(MODEL_ID, "Tester").inference(prompt, "demo") for prompt in ["first", "second"]]
+
+    assert replayed == recorded == ["answer to first", "answer to second"]
+    assert FakeOpenAi.calls == ["first", "second"]
+
+
+def test_prompt_missing_from_the_cassette_fails(providers, monkeypatch):
+    monkeypatch.setitem(Config().config, "REPLAY", {"MODE": "record", "CASSETTE": str(providers)})
+    LLM(MODEL_ID, "Tester").inference("first", "demo")
+
+    replay._cassettes.clear()
+    monkeypatch.setitem(Config().config, "REPLAY", {"MODE": "replay", "CASSETTE": str(providers)})
+    with pytest.raises(Exception, match="No recorded response"):
+        LLM(MODEL_ID, "Tester").inference("never recorded", "demo")
+    assert FakeOpenAi.calls == ["first"]
@@ -0,0 +1,165 @@
+import asyncio
+import time
+
+import pytest
+
+from src.config import Config
+from src.llm import AsyncLLM, client_pool, router as router_module
+from src.llm.router import AllModelsFailedError, Router
+from src.token_usage import TokenUsage
+
+
+class ProviderError(Exception):
+    def __init__(self, status_code):
+        self.status_code = status_code
+        super().__init__(f"HTTP {status_code}")
+
+
+class FakeProvider:
+    """
+    Answers with the model id, after failing or sleeping as scripted per model.
+    """
+
+    def __init__(self, failures=None, delays=None):
+        self.failures = {model_id: list(errors) for model_id, errors in (failures or {}).items()}
+        self.delays = delays or {}
+        self.calls = []
+
+    def __call__(self, model_id):
+        self.calls.append(model_id)
+        errors = self.failures.get(model_id)
+        if errors:
+            raise errors.pop(0)
+        time.sleep(self.delays.get(model_id, 0))
+        return f"answer from {model_id}"
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_router(**kwargs):
+    options = dict(
+        max_retries=2, backoff_base=1, backoff_max=10, failure_threshold=3,
+        reset_timeout=30, hedge=False, hedge_min_samples=5, latency_window=20,
+        sleep=lambda seconds: None
+    )
+    options.update(kwargs)
+    return Router(**options)
+
+
+def provider_of(model_id):
+    return model_id.split("-")[0]
+
+
+def test_retries_retriable_errors_on_the_same_model():
+    provider = FakeProvider({"claude-opus": [ProviderError(429), ProviderError(503)]})
+    router = make_router()
+
+    assert router.route(["claude-opus", "gpt-4"], provider, provider_of) == ("answer from claude-opus", "claude-opus")
+    assert provider.calls == ["claude-opus"] * 3
+
+
+def test_falls_back_in_order():
+    provider = FakeProvider({
+        "claude-opus": [ProviderError(401)],
+        "claude-sonnet": [ProviderError(500)] * 3,
+    })
+    router = make_router(failure_threshold=10)
+
+    assert router.route(["claude-opus", "claude-sonnet", "gpt-4"], provider, provider_of)[1] == "gpt-4"
+    # A bad request is not retried, a server error is.
+    assert provider.calls == ["claude-opus"] + ["claude-sonnet"] * 3 + ["gpt-4"]
+
+
+def test_all_models_failed():
+    provider = FakeProvider({"claude-opus": [ProviderError(400)], "gpt-4": [ProviderError(400)]})
+
+    with pytest.raises(AllModelsFailedError) as error:
+        make_router().route(["claude-opus", "gpt-4"], provider, provider_of)
+    assert [model_id for model_id, _ in error.value.errors] == ["claude-opus", "gpt-4"]
+
+
+def test_circuit_breaker_skips_failing_provider_until_reset():
+    clock = FakeClock()
+    provider = FakeProvider({"claude-opus": [ProviderError(529)] * 4})
+    router = make_router(clock=clock)
+
+    assert router.route(["claude-opus", "gpt-4"], provider, provider_of)[1] == "gpt-4"
+    assert router.stats()["breakers"]["claude"] == "open"
+
+    provider.calls.clear()
+    assert router.route(["claude-opus", "gpt-4"], provider, provider_of)[1] == "gpt-4"
+    assert provider.calls == ["gpt-4"]
+
+    clock.now += 30
+    assert router.get_breaker("claude").state == "half-open"
+    # One more failure re-opens the circuit straight away.
+    assert router.route(["claude-opus", "gpt-4"], provider, provider_of)[1] == "gpt-4"
+    assert router.get_breaker("claude").state == "open"
+
+    clock.now += 30
+    assert router.route(["claude-opus", "gpt-4"], provider, provider_of)[1] == "claude-opus"
+    assert router.get_breaker("claude").state == "closed"
+
+
+def test_hedges_slow_requests_to_the_next_model():
+    provider = FakeProvider(delays={"ollama-llama": 0.5})
+    router = make_router(hedge=True)
+    for _ in range(5):
+        router.get_latency("ollama-llama").record(0.05)
+
+    start = time.monotonic()
+    assert router.route(["ollama-llama", "groq-mixtral"], provider, provider_of)[1] == "groq-mixtral"
+    assert time.monotonic() - start < 0.4
+    assert provider.calls == ["ollama-llama", "groq-mixtral"]
+
+
+def test_does_not_hedge_without_enough_samples():
+    provider = FakeProvider(delays={"ollama-llama": 0.1})
+    router = make_router(hedge=True)
+
+    assert router.route(["ollama-llama", "groq-mixtral"], provider, provider_of)[1] == "ollama-llama"
+    assert provider.calls == ["ollama-llama"]
+
+
+def test_async_route_retries_and_falls_back():
+    provider = FakeProvider({"claude-opus": [ProviderError(503), ProviderError(401)]})
+    router = make_router(backoff_base=0)
+
+    async def call(model_id):
+        return provider(model_id)
+
+    assert asyncio.run(router.route_async(["claude-opus", "gpt-4"], call, provider_of)) == ("answer from gpt-4", "gpt-4")
+    assert provider.calls == ["claude-opus", "claude-opus", "gpt-4"]
+
+
+class FakeOllama:
+    def get_models(self, wait=False):
+        return []
+
+
+class FakeOpenAi:
+    async def async_inference(self, model_id, prompt):
+        if model_id == "gpt-4-0125-preview":
+            raise ProviderError(400)
+        return f"answer from {model_id}"
+
+
+def test_async_llm_is_routed_and_accounted_like_llm(tmp_path, monkeypatch):
+    monkeypatch.setitem(Config().config["STORAGE"], "SQLITE_DB", str(tmp_path / "devika.db"))
+    monkeypatch.setitem(Config().config, "ROUTER", {"FALLBACKS": {"gpt-4-0125-preview": ["gpt-3.5-turbo-0125"]}})
+    monkeypatch.setitem(client_pool.PROVIDERS, "OLLAMA", (FakeOllama, Config.get_ollama_api_endpoint))
+    monkeypatch.setitem(client_pool.PROVIDERS, "OPENAI", (FakeOpenAi, Config.get_openai_api_key))
+    monkeypatch.setattr(router_module, "_router", make_router())
+    client_pool.reset_clients()
+
+    response = asyncio.run(AsyncLLM("gpt-4-0125-preview", "Tester").inference("question", "demo"))
+    client_pool.reset_clients()
+
+    assert response == "answer from gpt-3.5-turbo-0125"
+    assert list(TokenUsage().get_usage_by_model("demo")) == ["gpt-3.5-turbo-0125"]
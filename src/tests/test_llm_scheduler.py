@@ -0,0 +1,54 @@
+import threading
+import time
+
+from src.llm.scheduler import BACKGROUND, INTERACTIVE, NORMAL, ProviderLimiter, TokenBucket
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_token_bucket_refills_over_time():
+    clock = FakeClock()
+    bucket = TokenBucket(60, clock)
+
+    assert bucket.delay(60) == 0
+    bucket.take(60)
+    assert bucket.delay(1) == 1
+
+    clock.now += 30
+    assert bucket.delay(30) == 0
+    # Charging more than was reserved pushes the next request further out.
+    bucket.take(40)
+    assert bucket.delay(1) == 11
+
+
+def test_waiting_requests_are_served_by_priority():
+    limiter = ProviderLimiter(rpm=600)
+    limiter.requests.take(limiter.requests.level)
+
+    served = []
+
+    def request(name, priority):
+        limiter.acquire(priority=priority)
+        served.append(name)
+
+    threads = []
+    for name, priority in [("background", BACKGROUND), ("normal", NORMAL), ("interactive", INTERACTIVE)]:
+        thread = threading.Thread(target=request, args=(name, priority))
+        thread.start()
+        threads.append(thread)
+        time.sleep(0.02)
+
+    assert limiter.get_stats()["queue_depth"] == 3
+    for thread in threads:
+        thread.join()
+
+    assert served == ["interactive", "normal", "background"]
+    stats = limiter.get_stats()
+    assert stats["queue_depth"] == 0
+    assert stats["by_priority"]["background"]["max_wait"] > stats["by_priority"]["interactive"]["max_wait"]
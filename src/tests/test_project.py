@@ -0,0 +1,146 @@
+import io
+import json
+import os
+import threading
+import zipfile
+
+import pytest
+from sqlmodel import Session
+
+from src import project as project_module
+from src.config import Config
+from src.project import ProjectManager, Projects
+
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    monkeypatch.setitem(Config().config["STORAGE"], "SQLITE_DB", str(tmp_path / "devika.db"))
+    monkeypatch.setitem(Config().config["STORAGE"], "PROJECTS_DIR", str(tmp_path / "projects"))
+    return ProjectManager()
+
+
+def test_migrates_legacy_message_stack(manager, tmp_path):
+    legacy_stack = [
+        {"source": "user", "message": "hello", "timestamp": "2024-01-01 00:00:00"},
+        {"source": "Devika", "message": "hi", "timestamp": "2024-01-01 00:00:01"},
+    ]
+    with Session(manager.engine) as session:
+        session.add(Projects(project="old", message_stack_json=json.dumps(legacy_stack)))
+        session.commit()
+
+    project_module._migrated_databases.discard(str(tmp_path / "devika.db"))
+    migrated = ProjectManager()
+
+    assert [(m["source"], m["message"]) for m in migrated.get_messages("old")] == [("user", "hello"), ("Devika", "hi")]
+    with Session(migrated.engine) as session:
+        assert session.query(Projects).filter(Projects.project == "old").one().message_stack_json == "[]"
+
+
+def test_pages_backwards_through_messages(manager):
+    manager.create_project("demo")
+    for i in range(5):
+        manager.add_message_from_user("demo", f"message {i}")
+
+    page = manager.get_messages("demo", limit=2)
+    assert [m["message"] for m in page] == ["message 3", "message 4"]
+
+    page = manager.get_messages("demo", before_id=page[0]["id"], limit=2)
+    assert [m["message"] for m in page] == ["message 1", "message 2"]
+
+    page = manager.get_messages("demo", before_id=page[0]["id"], limit=2)
+    assert [m["message"] for m in page] == ["message 0"]
+
+    assert manager.get_messages("unknown") is None
+
+
+def test_latest_messages_by_source(manager):
+    manager.create_project("demo")
+    assert manager.get_latest_message_from_user("demo") is None
+
+    manager.add_message_from_user("demo", "question")
+    manager.add_message_from_devika("demo", "answer")
+    manager.add_system_message("demo", "command output")
+
+    assert manager.get_latest_message_from_user("demo")["message"] == "command output"
+    assert manager.get_latest_message_from_devika("demo")["message"] == "answer"
+    assert manager.validate_last_message_is_from_user("demo")
+
+
+def test_concurrent_zips_of_the_same_project(manager):
+    project_path = manager.get_project_path("demo")
+    os.makedirs(project_path)
+    for i in range(20):
+        with open(os.path.join(project_path, f"file_{i}.txt"), "w") as f:
+            f.write("content " * 1000)
+
+    errors = []
+
+    def build():
+        try:
+            manager.project_to_zip("demo")
+        except Exception as error:
+            errors.append(error)
+
+    threads = [threading.Thread(target=build) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    with zipfile.ZipFile(manager.get_zip_path("demo")) as zipf:
+        assert len(zipf.namelist()) == 20
+        assert zipf.testzip() is None
+    assert not [name for name in os.listdir(os.path.dirname(project_path)) if name.endswith(".tmp")]
+
+
+def make_project(manager, files):
+    project_path = manager.get_project_path("demo")
+    for name, content in files.items():
+        os.makedirs(os.path.dirname(os.path.join(project_path, name)), exist_ok=True)
+        with open(os.path.join(project_path, name), "w") as f:
+            f.write(content)
+    return project_path
+
+
+def test_streamed_zip_matches_the_zip_on_disk(manager):
+    make_project(manager, {"main.py": "print('hi')\n" * 10000, "src/util.py": "x = 1\n"})
+
+    streamed = b"".join(manager.stream_project_zip("demo"))
+    with open(manager.project_to_zip("demo"), "rb") as f:
+        assert f.read() == streamed
+    with zipfile.ZipFile(io.BytesIO(streamed)) as zipf:
+        assert zipf.namelist() == ["demo/main.py", "demo/src/util.py"]
+        assert zipf.read("demo/src/util.py") == b"x = 1\n"
+
+
+def test_unchanged_project_reuses_its_zip(manager, monkeypatch):
+    project_path = make_project(manager, {"main.py": "print('hi')\n"})
+    zip_path = manager.project_to_zip("demo")
+
+    def fail(project, fileobj):
+        raise AssertionError("the zip was rebuilt")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(manager, "_write_zip", fail)
+        assert manager.project_to_zip("demo") == zip_path
+
+    with open(os.path.join(project_path, "main.py"), "w") as f:
+        f.write("print('changed')\n")
+    with zipfile.ZipFile(manager.project_to_zip("demo")) as zipf:
+        assert zipf.read("demo/main.py") == b"print('changed')\n"
+
+
+def test_excluded_files_are_left_out_of_the_zip(manager, monkeypatch):
+    monkeypatch.setitem(Config().config, "PROJECTS", {"ZIP_EXCLUDE": ["node_modules", "*.pyc", "build/*"]})
+    make_project(manager, {
+        "main.py": "",
+        "main.pyc": "",
+        "node_modules/lib/index.js": "",
+        "web/node_modules/index.js": "",
+        "build/out.txt": "",
+        "web/build/out.txt": "",
+    })
+
+    with zipfile.ZipFile(manager.project_to_zip("demo")) as zipf:
+        assert zipf.namelist() == ["demo/main.py", "demo/web/build/out.txt"]
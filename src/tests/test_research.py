@@ -0,0 +1,79 @@
+import threading
+import time
+
+import pytest
+
+from src.config import Config
+from src.logger import Logger
+
+
+class FakeSearch:
+    def __init__(self, release: threading.Event):
+        self.release = release
+
+    def search(self, query):
+        if "hang" in query:
+            self.release.wait()
+        self.query = query
+
+    def get_first_link(self):
+        return f"https://example.com/{self.query.replace(' ', '-')}"
+
+
+class FakeTab:
+    async def go_to(self, url):
+        self.url = url
+
+    async def screenshot(self, project_name):
+        return None, None
+
+    async def extract_text(self):
+        return f"page at {self.url}"
+
+    async def close_tab(self):
+        pass
+
+
+class FakeBrowser:
+    async def start(self):
+        return self
+
+    async def new_tab(self):
+        return FakeTab()
+
+    async def close(self):
+        pass
+
+
+class FakeFormatter:
+    async def async_execute(self, data, project_name):
+        return f"formatted {data}"
+
+
+@pytest.fixture
+def agent(tmp_path, monkeypatch):
+    # Some agent modules open the database when they are imported.
+    monkeypatch.setitem(Config().config["STORAGE"], "SQLITE_DB", str(tmp_path / "devika.db"))
+    import src.agents.agent as agent_module
+
+    release = threading.Event()
+    monkeypatch.setitem(Config().config, "RESEARCH", {"MAX_CONCURRENCY": 2, "QUERY_TIMEOUT": 0.5})
+    monkeypatch.setattr(agent_module, "Browser", FakeBrowser)
+    monkeypatch.setattr(agent_module, "emit_agent", lambda *args, **kwargs: None)
+
+    agent = agent_module.Agent.__new__(agent_module.Agent)
+    agent.engine = "bing"
+    agent.logger = Logger()
+    agent.formatter = FakeFormatter()
+    agent.get_search_engine = lambda: FakeSearch(release)
+    yield agent
+    release.set()
+
+
+def test_hung_query_is_dropped_within_the_timeout(agent):
+    start = time.monotonic()
+    results = agent.search_queries(["Second query", "hang forever", "first query"], "demo")
+
+    assert time.monotonic() - start < 2
+    assert list(results) == ["second query", "first query"]
+    assert results["first query"] == "formatted page at https://example.com/first-query"
@@ -0,0 +1,43 @@
+import time
+
+import pytest
+
+from src.browser.search_cache import SearchCache
+from src.config import Config
+
+
+@pytest.fixture
+def search_cache(tmp_path, monkeypatch):
+    monkeypatch.setitem(Config().config["STORAGE"], "SQLITE_DB", str(tmp_path / "devika.db"))
+    monkeypatch.setitem(Config().config, "SEARCH_CACHE", {"TTL": 60, "MAX_ENTRIES": 2})
+    return SearchCache()
+
+
+def test_hit_ignores_case_and_whitespace(search_cache):
+    search_cache.put("bing", "Python  asyncio", {"webPages": {"value": []}}, "en-US")
+
+    assert search_cache.get("bing", " python asyncio ", "en-US") == {"webPages": {"value": []}}
+    assert search_cache.get("bing", "python asyncio", "en-GB") is None
+    assert search_cache.get("google", "python asyncio", "en-US") is None
+
+
+def test_expired_entries_are_misses(search_cache):
+    search_cache.put("duckduckgo", "query", [{"href": "https://example.com"}], "en-us")
+    search_cache.ttl = 0.01
+    time.sleep(0.02)
+
+    misses = search_cache.stats()["misses"]
+    assert search_cache.get("duckduckgo", "query", "en-us") is None
+    assert search_cache.stats()["misses"] == misses + 1
+    assert search_cache.stats()["entries"] == 0
+
+
+def test_least_recently_used_entries_are_evicted(search_cache):
+    search_cache.put("bing", "first", [1])
+    search_cache.put("bing", "second", [2])
+    search_cache.get("bing", "first")
+    search_cache.put("bing", "third", [3])
+
+    assert search_cache.stats()["entries"] == 2
+    assert search_cache.get("bing", "first") == [1]
+    assert search_cache.get("bing", "second") is None
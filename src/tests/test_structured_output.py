@@ -0,0 +1,162 @@
+import asyncio
+import json
+
+import pytest
+
+from src.config import Config
+from src.llm import speculative
+from src.llm.structured_output import JSON, XML, StructuredOutput, StructuredOutputError
+from src.token_usage import TokenUsage
+from src.utils import parse_xml_llm_response
+
+
+class ScriptedLLM:
+    """
+    Returns the scripted responses in order and remembers the prompts.
+    """
+
+    agent = "Tester"
+    model_id = "test-model"
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.prompts = []
+
+    def inference(self, prompt, project_name):
+        self.prompts.append(prompt)
+        return self.responses.pop(0)
+
+
+def validate_json(response):
+    response = json.loads(response)
+    return response if "queries" in response else False
+
+
+def validate_xml(response):
+    response = parse_xml_llm_response(response)
+    return response if "response" in response else False
+
+
+@pytest.fixture(autouse=True)
+def db(tmp_path, monkeypatch):
+    monkeypatch.setitem(Config().config["STORAGE"], "SQLITE_DB", str(tmp_path / "devika.db"))
+
+
+def test_valid_response_needs_one_call():
+    llm = ScriptedLLM(['{"queries": ["a"]}'])
+    output = StructuredOutput(llm, JSON, validate_json, "JSON", max_retries=2)
+
+    assert output.run("prompt", "demo") == {"queries": ["a"]}
+    assert llm.prompts == ["prompt"]
+    assert TokenUsage().get_usage_by_agent("demo") == {}
+
+
+def test_local_repairs_do_not_call_the_model():
+    llm = ScriptedLLM(['Sure!\n```json\n{"queries": ["a", "b",],}\n```'])
+    output = StructuredOutput(llm, JSON, validate_json, "JSON", max_retries=2)
+
+    assert output.run("prompt", "demo") == {"queries": ["a", "b"]}
+    assert len(llm.prompts) == 1
+
+    llm = ScriptedLLM(["<response>fish & chips</response>"])
+    output = StructuredOutput(llm, XML, validate_xml, "XML", required_tags=["response"], max_retries=2)
+
+    assert output.run("prompt", "demo")["response"] == "fish & chips"
+
+
+def test_repair_prompt_contains_the_error_not_the_prompt():
+    llm = ScriptedLLM(["no json here", '{"queries": []}'])
+    output = StructuredOutput(llm, JSON, validate_json, "A JSON object", max_retries=2)
+
+    assert output.run("a very long original prompt", "demo") == {"queries": []}
+    assert "a very long original prompt" not in llm.prompts[1]
+    assert "no json here" in llm.prompts[1]
+    assert "not valid JSON" in llm.prompts[1]
+    assert TokenUsage().get_usage_by_agent("demo")["Tester"]["wasted"] > 0
+    assert TokenUsage().get_total("demo") == 0
+
+
+def test_empty_response_resends_the_prompt():
+    llm = ScriptedLLM(["", '{"queries": []}'])
+    output = StructuredOutput(llm, JSON, validate_json, "JSON", max_retries=2)
+
+    output.run("prompt", "demo")
+    assert llm.prompts == ["prompt", "prompt"]
+
+
+def test_gives_up_after_max_retries():
+    llm = ScriptedLLM(["bad"] * 3)
+    output = StructuredOutput(llm, JSON, validate_json, "JSON", max_retries=2)
+
+    with pytest.raises(StructuredOutputError) as error:
+        output.run("prompt", "demo")
+    assert error.value.attempts == 3
+    assert len(llm.prompts) == 3
+
+
+def test_stops_when_interrupted():
+    llm = ScriptedLLM(["bad", "bad"])
+    output = StructuredOutput(llm, JSON, validate_json, "JSON", max_retries=2)
+
+    assert output.run("prompt", "demo", should_stop=lambda: True) is None
+    assert len(llm.prompts) == 1
+
+
+def test_speculative_sampling_takes_the_first_valid_candidate(monkeypatch):
+    answers = {"slow-model": (0.5, "not json"), "fast-model": (0.01, '{"queries": ["fast"]}')}
+
+    class ScriptedAsyncLLM:
+        def __init__(self, model_id, agent):
+            self.model_id = model_id
+
+        async def inference(self, prompt, project_name):
+            delay, response = answers[self.model_id]
+            await asyncio.sleep(delay)
+            return response
+
+    monkeypatch.setattr(speculative, "AsyncLLM", ScriptedAsyncLLM)
+    monkeypatch.setitem(Config().config, "SPECULATIVE", {"Tester": {"CANDIDATES": 2, "MODELS": ["fast-model"]}})
+    llm = ScriptedLLM([])
+    llm.model_id = "slow-model"
+    output = StructuredOutput(llm, JSON, validate_json, "JSON", max_retries=2)
+
+    assert output.run("prompt", "demo") == {"queries": ["fast"]}
+    stats = speculative.get_speculative_stats()["Tester"]
+    assert stats["other_wins"] == 1
+    assert stats["extra_tokens"] > 0
+
+
+class FailingPlanner:
+    def execute(self, prompt, project_name):
+        raise StructuredOutputError("Planner", 3, "no JSON object found", "not json")
+
+
+def test_agent_flow_stops_cleanly_on_invalid_output(tmp_path, monkeypatch):
+    monkeypatch.setitem(Config().config["STORAGE"], "SQLITE_DB", str(tmp_path / "devika.db"))
+    from src.agents.agent import Agent
+    from src.logger import Logger
+    from src.project import ProjectManager
+    from src.state import AgentState
+
+    agent = Agent.__new__(Agent)
+    agent.logger = Logger()
+    agent.planner = FailingPlanner()
+    agent.project_manager = ProjectManager()
+    agent.agent_state = AgentState()
+    agent.project_manager.create_project("demo")
+
+    agent.execute(prompt="build a todo app", project_name_from_user="demo")
+
+    assert "Invalid response from the model" in agent.project_manager.get_messages("demo")[-1]["message"]
+    assert agent.agent_state.is_agent_completed("demo")
+
+
+def test_inner_agent_steps_raise_invalid_output(tmp_path, monkeypatch):
+    monkeypatch.setitem(Config().config["STORAGE"], "SQLITE_DB", str(tmp_path / "devika.db"))
+    from src.agents.agent import Agent
+
+    agent = Agent.__new__(Agent)
+    agent.decision = FailingPlanner()
+
+    with pytest.raises(StructuredOutputError):
+        agent.make_decision("build a todo app", "demo")
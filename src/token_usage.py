@@ -0,0 +1,118 @@
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.dialects.sqlite import insert
+from sqlmodel import Field, Index, Session, SQLModel
+
+from src.config import Config
+from src.database import get_engine
+
+
+class TokenUsageModel(SQLModel, table=True):
+    """
+    Ledger of every prompt and response sent through `LLM`, one row per call.
+    Rows are only ever inserted, so concurrent writers cannot lose updates.
+    """
+    __tablename__ = "token_usage"
+    __table_args__ = (
+        Index("ix_token_usage_project_agent", "project", "agent", "tokens"),
+        Index("ix_token_usage_project_model", "project", "model", "tokens"),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    project: str
+    agent: Optional[str] = None
+    model: Optional[str] = None
+    # "prompt", "response", "wasted" (already counted as one of the others), or
+    # "legacy" for the total carried over from before the ledger existed.
+    direction: str
+    tokens: int
+    timestamp: str = Field(default_factory=lambda: datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+
+
+class TokenUsageTotalModel(SQLModel, table=True):
+    """
+    Running total of each project's ledger, without wasted tokens, updated in
+    the same transaction as the ledger so that reading it is a single lookup.
+    """
+    __tablename__ = "token_usage_totals"
+
+    project: str = Field(primary_key=True)
+    tokens: int = 0
+
+
+def migrate_token_totals(engine):
+    """
+    Fill in the running totals of projects whose ledger predates them.
+    """
+    with Session(engine) as session:
+        totaled = select(TokenUsageTotalModel.project)
+        rows = session.query(TokenUsageModel.project, func.sum(TokenUsageModel.tokens)).filter(
+            TokenUsageModel.direction != "wasted",
+            TokenUsageModel.project.not_in(totaled)
+        ).group_by(TokenUsageModel.project).all()
+        for project, tokens in rows:
+            session.add(TokenUsageTotalModel(project=project, tokens=tokens))
+        session.commit()
+
+
+class TokenUsage:
+    def __init__(self):
+        sqlite_path = Config().get_sqlite_db()
+        self.engine = get_engine(sqlite_path)
+
+    def record(self, project: str, tokens: int, direction: str, agent: str = None, model: str = None):
+        with Session(self.engine) as session:
+            session.add(TokenUsageModel(
+                project=project,
+                agent=agent,
+                model=model,
+                direction=direction,
+                tokens=tokens
+            ))
+            if direction != "wasted":
+                session.execute(
+                    insert(TokenUsageTotalModel).values(project=project, tokens=tokens).on_conflict_do_update(
+                        index_elements=["project"],
+                        set_={"tokens": TokenUsageTotalModel.tokens + tokens}
+                    )
+                )
+            session.commit()
+
+    def has_usage(self, project: str) -> bool:
+        with Session(self.engine) as session:
+            return session.get(TokenUsageTotalModel, project) is not None
+
+    def get_total(self, project: str) -> int:
+        with Session(self.engine) as session:
+            total = session.get(TokenUsageTotalModel, project)
+            return total.tokens if total else 0
+
+    def _group_by(self, project: str, column) -> dict:
+        with Session(self.engine) as session:
+            rows = session.query(
+                column, TokenUsageModel.direction, func.sum(TokenUsageModel.tokens)
+            ).filter(
+                TokenUsageModel.project == project
+            ).group_by(column, TokenUsageModel.direction).all()
+
+        breakdown = {}
+        for key, direction, tokens in rows:
+            usage = breakdown.setdefault(key or "unknown", {"prompt": 0, "response": 0, "wasted": 0, "total": 0})
+            usage[direction] = usage.get(direction, 0) + tokens
+            if direction != "wasted":
+                usage["total"] += tokens
+        return breakdown
+
+    def get_usage_by_agent(self, project: str) -> dict:
+        return self._group_by(project, TokenUsageModel.agent)
+
+    def get_usage_by_model(self, project: str) -> dict:
+        return self._group_by(project, TokenUsageModel.model)
+
+    def delete_usage(self, project: str):
+        with Session(self.engine) as session:
+            session.query(TokenUsageModel).filter(TokenUsageModel.project == project).delete()
+            session.query(TokenUsageTotalModel).filter(TokenUsageTotalModel.project == project).delete()
+            session.commit()
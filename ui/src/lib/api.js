@@ -103,6 +103,19 @@ export async function fetchAgentState() {
   agentState.set(data.state);
 }
 
+export async function fetchAgentStateSince(sinceSeq) {
+  const projectName = localStorage.getItem("selectedProject");
+  const response = await fetch(`${API_BASE_URL}/api/get-agent-state-since`, {
+    method: "POST",
+    headers: {
+      "Content-Type": "application/json",
+    },
+    body: JSON.stringify({project_name: projectName, since_seq: sinceSeq}),
+  });
+  const data = await response.json();
+  return data.states;
+}
+
 export async function executeAgent(prompt) {
   const projectName = localStorage.getItem("selectedProject");
   const modelId = localStorage.getItem("selectedModel");
@@ -28,6 +28,7 @@ export const agentState = writable(null);
 
 export const internet = writable(true);
 export const tokenUsage = writable(0);
+export const streamingOutput = writable("");
 
 
 selectedProject.subscribe((value) => {